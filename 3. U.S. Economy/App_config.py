@@ -0,0 +1,56 @@
+# Cached loader for the secrets and keys shared by the daily update and dashboard containers
+# Values come from, in order of precedence:
+#   1. environment variables of the same name (FRED_KEY, DB_NAME, ...)
+#   2. a local env.source file named by ECON_ENV_FILE, e.g. for running on a local machine
+#   3. env.source in the econdaily-prod-app-config S3 bucket, downloaded once per container
+# Nothing is read at import time; the first load_secrets() call does the work and later
+# calls return the cached dict.
+
+import functools
+import os
+
+KEYS = ['FRED_KEY', 'DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_PORT']
+
+# Where the daily update writes and the dashboard reads: 'wide' is the econ_metrics table,
+# 'long' the econ_observations table and its econ_metrics_wide view (Scrape_long_store.py),
+# 'both' writes to both while moving from one to the other and reads the view
+STORAGE_MODE = os.environ.get('ECON_STORAGE', 'wide')
+
+bucket_name = 'econdaily-prod-app-config'
+file_name = 'env.source'
+local_filename = '/app/myfilefroms3'
+
+
+def parse_env_file(path):
+    """KEY=value lines of an env.source file as a dict, blank lines and comments skipped"""
+    secrets = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, _, value = line.partition('=')
+            secrets[key.replace('export ', '').strip()] = value.strip()
+    return secrets
+
+
+@functools.lru_cache(maxsize=None)
+def load_secrets():
+    env = {k: os.environ[k] for k in KEYS if k in os.environ}
+    if len(env) == len(KEYS):
+        return env
+
+    path = os.environ.get('ECON_ENV_FILE')
+    if path is None:
+        path = local_filename
+        if not os.path.exists(path):
+            # Connect to S3 to download secrets and keys, boto3 is only imported when needed
+            import boto3
+            boto3.client('s3').download_file(bucket_name, file_name, path)
+
+    return dict(parse_env_file(path), **env)
+
+
+def metrics_table(storage=STORAGE_MODE):
+    """Table or view holding the wide econ_metrics rows for a storage mode"""
+    return 'econ_metrics' if storage == 'wide' else 'econ_metrics_wide'
@@ -0,0 +1,98 @@
+# Timing spans for the daily update and the dashboard, logged as CloudWatch Embedded Metric
+# Format (EMF): one JSON line per span with its duration and row/byte counts. On ECS the
+# awslogs driver ships stdout to CloudWatch Logs, which turns each line into metrics in
+# the EconDaily namespace, dimensioned by Service and Stage. The remaining fields, such as
+# the series id, stay searchable in Logs Insights. Every line of one process carries the
+# same RunId.
+#   with span('fetch', series='DJIA') as metrics:
+#       ...
+#       metrics['Rows'] = len(observations)
+# ECON_PROFILE=0 turns the span lines off. Frames are logged as one line summaries by
+# log_frame(); ECON_PRINT_FRAMES=1 prints them in full again for debugging.
+
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+NAMESPACE = os.environ.get('ECON_METRICS_NAMESPACE', 'EconDaily')
+
+PROFILE = os.environ.get('ECON_PROFILE', '1').lower() not in ('0', 'off', 'false', 'no')
+PRINT_FRAMES = os.environ.get('ECON_PRINT_FRAMES') == '1'
+
+RUN_ID = uuid.uuid4().hex[:12]
+
+# Units of the metric names used by the spans, anything else is unitless
+UNITS = {
+    'Duration': 'Milliseconds',
+    'Wait': 'Milliseconds',
+    'Rows': 'Count',
+    'Inserted': 'Count',
+    'Updated': 'Count',
+    'Skipped': 'Count',
+    'Requests': 'Count',
+    'Bytes': 'Bytes',
+    'MaxRss': 'Bytes',
+    'LatencyP50': 'Milliseconds',
+    'LatencyP95': 'Milliseconds',
+    'LatencyMax': 'Milliseconds',
+}
+
+
+def emit(stage, metrics, service='ingest', **properties):
+    """Print one EMF line with `metrics` ({name: number}) under Service and Stage"""
+    if not PROFILE:
+        return
+    metrics = {name: value for name, value in metrics.items() if value is not None}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Service', 'Stage']],
+                'Metrics': [{'Name': name, 'Unit': UNITS.get(name, 'None')} for name in metrics],
+            }],
+        },
+        'Service': service,
+        'Stage': stage,
+        'RunId': RUN_ID,
+        **properties,
+        **metrics,
+    }
+    print(json.dumps(record, default=str), flush=True)
+
+
+@contextmanager
+def span(stage, service='ingest', **properties):
+    """Time the block as `stage`; the block adds counts to the yielded dict. A span left
+    by an exception is logged with the exception's name under Error."""
+    metrics = {}
+    started = time.perf_counter()
+    try:
+        yield metrics
+    except BaseException as e:
+        properties['Error'] = type(e).__name__
+        raise
+    finally:
+        metrics['Duration'] = round((time.perf_counter() - started) * 1000, 3)
+        emit(stage, metrics, service=service, **properties)
+
+
+def frame_summary(df):
+    """Rows, date range and NaNs per column of a frame in one line"""
+    if not len(df):
+        return '0 rows'
+    nans = df.isna().sum()
+    nans = {col: int(n) for col, n in nans.items() if n}
+    text = f"{len(df)} rows x {len(df.columns)} columns"
+    if 'date' in df.columns:
+        text += f", {str(df['date'].iloc[0])[:10]} to {str(df['date'].iloc[-1])[:10]}"
+    return text + (f", NaNs: {nans}" if nans else ", no NaNs")
+
+
+def log_frame(label, df):
+    if PRINT_FRAMES:
+        print(label, df)
+    else:
+        print(label, frame_summary(df))
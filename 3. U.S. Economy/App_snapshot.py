@@ -0,0 +1,230 @@
+# Versioned dashboard snapshots published by the daily update and read by the dashboard
+# After a successful write the daily update renders the default dashboard figure and a
+# compact columnar copy of econ_metrics, gzips both once and publishes them under a new
+# version, together with the Confidence analytics (Scrape_analytics.py) when they exist.
+# The dashboard loads the newest version at startup and swaps in newer ones as they
+# appear, without querying the database.
+# Snapshots live in a local directory or an S3-compatible bucket, named by
+# ECON_SNAPSHOT_URI, e.g. file:///app/snapshots or s3://bucket/snapshots
+# (ECON_SNAPSHOT_ENDPOINT points boto3 at an S3-compatible store other than AWS).
+# Layout of a store:
+#   LATEST                       manifest of the newest version, written last
+#   <version>/frame.json.gz      {column: [values]}, dates as YYYY-MM-DD, NaN as null
+#   <version>/figure.json.gz     Plotly figure JSON
+#   <version>/analytics.json.gz  {'rolling': {column: [values]}, 'cross': {column: [values]}}
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_URI = os.environ.get('ECON_SNAPSHOT_URI')
+
+# Versions kept in the store besides the newest
+KEEP_VERSIONS = 7
+
+# analytics is None for versions published without them
+Snapshot = namedtuple('Snapshot', ['version', 'manifest', 'frame', 'figure', 'analytics'],
+                      defaults=(None,))
+
+
+class LocalSnapshots:
+
+    def __init__(self, root):
+        self.root = root
+
+    def read(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def write(self, name, body):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def delete(self, version):
+        shutil.rmtree(os.path.join(self.root, version), ignore_errors=True)
+
+
+class S3Snapshots:
+
+    def __init__(self, bucket, prefix='', client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            # boto3 is only imported when snapshots are kept in S3
+            import boto3
+            self._client = boto3.client('s3', endpoint_url=os.environ.get('ECON_SNAPSHOT_ENDPOINT'))
+        return self._client
+
+    def key(self, name):
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def read(self, name):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(name))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read()
+
+    def write(self, name, body):
+        self.client.put_object(Bucket=self.bucket, Key=self.key(name), Body=body)
+
+    def versions(self):
+        prefix = self.key('')
+        paginator = self.client.get_paginator('list_objects_v2')
+        versions = set()
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            for p in page.get('CommonPrefixes', []):
+                versions.add(p['Prefix'][len(prefix):].strip('/'))
+        return sorted(versions)
+
+    def delete(self, version):
+        for name in ('frame.json.gz', 'figure.json.gz', 'analytics.json.gz'):
+            self.client.delete_object(Bucket=self.bucket, Key=self.key(f'{version}/{name}'))
+
+
+def snapshot_store(uri=SNAPSHOT_URI):
+    """Snapshot store for a file:// or s3:// uri, None when snapshots are not configured"""
+    if not uri:
+        return None
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3Snapshots(bucket, prefix)
+    return LocalSnapshots(uri[len('file://'):] if uri.startswith('file://') else uri)
+
+
+def frame_to_json(df_final):
+    columns = {'date': pd.to_datetime(df_final['date']).dt.strftime('%Y-%m-%d').tolist()}
+    for col in df_final.columns[1:]:
+        values = pd.to_numeric(df_final[col], errors='coerce').astype('float64')
+        columns[col] = [None if np.isnan(v) else v for v in values.tolist()]
+    return json.dumps(columns, separators=(',', ':')).encode()
+
+
+def frame_from_json(body):
+    columns = json.loads(body)
+    df = pd.DataFrame({col: np.array(values, dtype='float64')
+                       for col, values in columns.items() if col != 'date'})
+    df.insert(0, 'date', pd.to_datetime(columns['date'], format='%Y-%m-%d').date)
+    return df
+
+
+def analytics_to_json(rolling, cross):
+    """The (rolling, cross) frames of Scrape_analytics.read_analytics as column lists"""
+    def columns(df):
+        out = {}
+        for col in df.columns:
+            if col in ('date', 'as_of'):
+                out[col] = pd.to_datetime(df[col]).dt.strftime('%Y-%m-%d').tolist()
+            elif col == 'metric':
+                out[col] = df[col].tolist()
+            else:
+                values = pd.to_numeric(df[col], errors='coerce').astype('float64')
+                out[col] = [None if np.isnan(v) else v for v in values.tolist()]
+        return out
+    return json.dumps({'rolling': columns(rolling), 'cross': columns(cross)},
+                      separators=(',', ':')).encode()
+
+
+def analytics_from_json(body):
+    payload = json.loads(body)
+    frames = []
+    for name in ('rolling', 'cross'):
+        columns = payload[name]
+        frames.append(pd.DataFrame({col: values if col in ('metric', 'date', 'as_of')
+                                    else np.array(values, dtype='float64')
+                                    for col, values in columns.items()}))
+    return tuple(frames)
+
+
+def render_figure(df_final, metric='dow'):
+    """Figure JSON of the dashboard's default view, downsampled as the dashboard does"""
+    # Plotly is only needed when a snapshot is rendered
+    from Plotly_downsample import overview_points
+    from Plotly_figure import build_figure
+
+    dates = pd.to_datetime(df_final['date']).to_numpy().astype('datetime64[D]')
+    fig = build_figure(df_final, metric_menu=False, metric=metric,
+                       points=lambda col: overview_points(dates, df_final[col].to_numpy(dtype='float64')))
+    return fig.to_json()
+
+
+def publish_snapshot(store, df_final, figure_json, keep=KEEP_VERSIONS, now=None,
+                     analytics=None):
+    """Publish econ_metrics, its rendered figure and the (rolling, cross) analytics frames,
+    if any, as a new version; returns the version, or None when the newest version already
+    holds the same data"""
+
+    frame_body = frame_to_json(df_final)
+    analytics_body = analytics_to_json(*analytics) if analytics is not None else b''
+    # The digest covers everything the dashboard reads, so a change of the analytics
+    # alone is published too; the figure is rendered from the frame
+    content = hashlib.sha1(frame_body)
+    content.update(analytics_body)
+    digest = content.hexdigest()[:12]
+    latest = store.read('LATEST')
+    if latest is not None and json.loads(latest).get('sha1') == digest:
+        print(f"Snapshot unchanged, keeping version {json.loads(latest)['version']}")
+        return None
+
+    # Versions sort by creation time
+    now = now or datetime.now(timezone.utc)
+    version = f"{now:%Y%m%dT%H%M%SZ}-{digest}"
+    store.write(f'{version}/frame.json.gz', gzip.compress(frame_body, mtime=0))
+    store.write(f'{version}/figure.json.gz', gzip.compress(figure_json.encode(), mtime=0))
+    if analytics is not None:
+        store.write(f'{version}/analytics.json.gz', gzip.compress(analytics_body, mtime=0))
+    manifest = {
+        'version': version,
+        'created': now.isoformat(),
+        'rows': len(df_final),
+        'watermark': str(df_final['date'].max()) if len(df_final) else None,
+        'sha1': digest,
+        'analytics': analytics is not None,
+    }
+    # The pointer is written last, so readers never see a partly written version
+    store.write('LATEST', json.dumps(manifest).encode())
+
+    for old in store.versions()[:-(keep + 1)]:
+        store.delete(old)
+    print(f"Published snapshot {version}: {len(df_final)} rows")
+    return version
+
+
+def load_snapshot(store, current=None):
+    """Newest snapshot, or None when there is none or it is the `current` version"""
+    latest = store.read('LATEST')
+    if latest is None:
+        return None
+    manifest = json.loads(latest)
+    if manifest['version'] == current:
+        return None
+    version = manifest['version']
+    frame = frame_from_json(gzip.decompress(store.read(f'{version}/frame.json.gz')))
+    figure = json.loads(gzip.decompress(store.read(f'{version}/figure.json.gz')))
+    analytics = None
+    if manifest.get('analytics'):
+        analytics = analytics_from_json(gzip.decompress(store.read(f'{version}/analytics.json.gz')))
+    return Snapshot(version, manifest, frame, figure, analytics)
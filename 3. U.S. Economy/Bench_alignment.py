@@ -0,0 +1,86 @@
+# Benchmark of the vectorized calendar alignment (Scrape_align.align_long) against the
+# original per-series missed_daily/missed_monthly code of the daily update script
+# Synthetic series are generated offline; both paths are checked to give the same frame.
+#
+# Usage: python3 Bench_alignment.py [--series 10 100 500] [--years 1 10 30]
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from Scrape_align import align_long
+
+
+def synthetic_long(n_series, years, end='2024-12-31'):
+    """Long-format observations for n_series series over `years` years, 30% monthly"""
+    end = pd.Timestamp(end)
+    start = end - pd.DateOffset(years=years)
+    business_days = pd.bdate_range(start, end)
+    month_starts = pd.date_range(start - pd.DateOffset(months=2), end, freq='MS')
+    rng = np.random.default_rng(0)
+    series, frames = [], []
+    for i in range(n_series):
+        monthly = i % 10 >= 7
+        series_id = f'S{i:04d}'
+        dates = month_starts if monthly else business_days
+        series.append((series_id, series_id.lower(), 'monthly' if monthly else 'daily'))
+        frames.append(pd.DataFrame({'series_id': series_id, 'date': dates,
+                                    'value': rng.normal(100, 10, len(dates)).round(2)}))
+    long_df = pd.concat(frames, ignore_index=True)
+    long_df['series_id'] = long_df['series_id'].astype('category')
+    return long_df, series, start, end
+
+
+def legacy_align(long_df, series, d, t):
+    """Original per-series code: one date_range and reindex per series, pd.concat, then the
+    redundant DataFrame rebuild over the index union"""
+
+    def missed_daily(series_id, col_name):
+        idx = pd.date_range(d.strftime('%Y-%m-%d'), t.strftime('%Y-%m-%d'))
+        series_id = pd.Series(series_id, name=col_name)
+        series_id.index = pd.DatetimeIndex(series_id.index)
+        return series_id.reindex(idx)
+
+    def missed_monthly(series_id, col_name):
+        idx = pd.date_range(d.strftime('%Y-%m-%d'), t.strftime('%Y-%m-%d'))
+        series_id = pd.Series(series_id, name=col_name)
+        series_id.index = pd.DatetimeIndex(series_id.index)
+        return series_id.reindex(idx, method='ffill')
+
+    aligned = []
+    for series_id, col, freq in series:
+        raw = long_df[long_df['series_id'] == series_id].set_index('date')['value']
+        aligned.append((missed_monthly if freq == 'monthly' else missed_daily)(raw, col))
+    econ = pd.concat(aligned, axis=1)
+    df_econ = pd.DataFrame(index=aligned[0].index.union(aligned[1].index), data=econ)
+    return df_econ.reset_index().rename(columns={'index': 'date'})
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--series', type=int, nargs='+', default=[10, 50, 100, 500])
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 10, 30])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'series':>7} {'years':>6} {'rows':>7} {'legacy s':>9} {'vector s':>9} {'speedup':>8} {'MB':>6}")
+    for n_series in args.series:
+        for years in args.years:
+            long_df, series, d, t = synthetic_long(n_series, years)
+            legacy_s, legacy = best_of(lambda: legacy_align(long_df, series, d, t), args.repeat)
+            vector_s, vector = best_of(lambda: align_long(long_df, d, t, series), args.repeat)
+            pd.testing.assert_frame_equal(legacy, vector, check_freq=False, check_names=False)
+            mb = vector.memory_usage(deep=True).sum() / 1e6
+            print(f"{n_series:>7} {years:>6} {len(vector):>7} {legacy_s:>9.4f} {vector_s:>9.4f} "
+                  f"{legacy_s / vector_s:>7.1f}x {mb:>6.1f}")
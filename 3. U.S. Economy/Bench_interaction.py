@@ -0,0 +1,169 @@
+# Interaction benchmark for the clientside mode against the callback mode
+# Replays one session, a page load followed by metric switches and zooms on random
+# windows, in both modes and reports:
+#   - bytes per session, gzip: the layout plus every callback response in callback mode;
+#     the layout plus the columnar payload in clientside mode, where a repeat visit takes
+#     the payload from the browser cache and downloads the layout only
+#   - interaction latency: server time of each callback in callback mode (the network
+#     round trip comes on top), and the time of the clientside JavaScript run in node
+#     in clientside mode. Plotly's redraw in the browser is left out in both.
+# econ_metrics is replaced by a synthetic frame of daily rows, so no database is needed.
+#
+# Usage: python3 Bench_interaction.py --years 1 10 30 --interactions 20
+
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import Plotly_clientside
+import Plotly_python_script as dashboard
+from Bench_payload import COLUMNS, synthetic_frame, use_frame, walk
+
+# Runs the clientside callback over a session in node and prints the times in ms as JSON
+NODE_HARNESS = """
+const fs = require('fs');
+global.window = {dash_clientside: {no_update: {}}};
+const interact = (%s);
+const started = process.hrtime.bigint();
+const data = JSON.parse(fs.readFileSync(process.argv[2]));
+const parsed = Number(process.hrtime.bigint() - started) / 1e6;
+let figure = JSON.parse(fs.readFileSync(process.argv[3]));
+const session = JSON.parse(fs.readFileSync(process.argv[4]));
+const times = [];
+for (const [metric, relayout] of session) {
+    const t0 = process.hrtime.bigint();
+    const [newFigure, summary] = interact(data, metric, relayout, figure);
+    times.push(Number(process.hrtime.bigint() - t0) / 1e6);
+    if (newFigure !== window.dash_clientside.no_update) { figure = newFigure; }
+    if (typeof summary !== 'string') { throw new Error('no summary'); }
+}
+console.log(JSON.stringify({parse_ms: parsed, times: times}));
+"""
+
+
+def session(df, interactions, seed=0):
+    """[(metric, relayoutData)] of one session: the first view, then alternating metric
+    switches and zooms"""
+    rng = random.Random(seed)
+    first, last = pd.Timestamp(df['date'].iloc[0]), pd.Timestamp(df['date'].iloc[-1])
+    metric, relayout = dashboard.DEFAULT_METRIC, None
+    steps = []
+    for i in range(interactions):
+        if i % 2:
+            start = first + pd.Timedelta(days=rng.randrange(max((last - first).days - 60, 1)))
+            end = min(start + pd.Timedelta(days=rng.randrange(60, 2000)), last)
+            relayout = {'xaxis3.range[0]': start.strftime('%Y-%m-%d'),
+                        'xaxis3.range[1]': end.strftime('%Y-%m-%d')}
+        else:
+            metric = rng.choice([c for c in COLUMNS if c != metric])
+        steps.append((metric, relayout, 'plot.relayoutData' if i % 2 else 'metric.value'))
+    return steps
+
+
+def gzip_get(client, url):
+    return client.get(url, headers={'Accept-Encoding': 'gzip'})
+
+
+def callback_session(client, steps):
+    dashboard.METRIC_MODE = 'callback'
+    total = len(gzip_get(client, '/_dash-layout').data)
+    times = []
+    window = None
+    for metric, relayout, changed in steps:
+        payload = {'output': '..plot.figure...window.data..',
+                   'outputs': [{'id': 'plot', 'property': 'figure'},
+                               {'id': 'window', 'property': 'data'}],
+                   'inputs': [{'id': 'metric', 'property': 'value', 'value': metric},
+                              {'id': 'plot', 'property': 'relayoutData', 'value': relayout}],
+                   'changedPropIds': [changed],
+                   'state': [{'id': 'window', 'property': 'data', 'value': window}]}
+        started = time.perf_counter()
+        response = client.post('/_dash-update-component', data=json.dumps(payload),
+                               content_type='application/json',
+                               headers={'Accept-Encoding': 'gzip'})
+        times.append((time.perf_counter() - started) * 1000)
+        total += len(response.data)
+        if response.status_code == 200:
+            body = response.data
+            if response.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            window = json.loads(body)['response']['window']['data']
+    return total, times
+
+
+def clientside_session(client, steps, node):
+    dashboard.METRIC_MODE = 'clientside'
+    layout = gzip_get(client, '/_dash-layout')
+    components = list(walk(json.loads(gzip.decompress(layout.data))))
+    url = next(c['props']['data'] for c in components if c['props'].get('id') == 'columns-url')
+    figure = next(c['props']['figure'] for c in components
+                  if c['props'].get('id') == Plotly_clientside.GRAPH_ID)
+    payload = gzip_get(client, url)
+    first_visit = len(layout.data) + len(payload.data)
+    repeat_visit = len(layout.data)
+    immutable = payload.cache_control.immutable
+    if node is None:
+        return first_visit, repeat_visit, immutable, None, None
+
+    work = tempfile.mkdtemp(prefix='bench_interaction_')
+    try:
+        paths = [os.path.join(work, name) for name in ('harness.js', 'data.json', 'figure.json',
+                                                       'session.json')]
+        with open(paths[0], 'w') as f:
+            f.write(NODE_HARNESS % Plotly_clientside.INTERACT)
+        with open(paths[1], 'wb') as f:
+            f.write(gzip.decompress(payload.data))
+        with open(paths[2], 'w') as f:
+            json.dump(figure, f)
+        with open(paths[3], 'w') as f:
+            json.dump([[metric, relayout] for metric, relayout, _ in steps], f)
+        result = json.loads(subprocess.run([node, *paths], capture_output=True, text=True,
+                                           check=True).stdout)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return first_visit, repeat_visit, immutable, result['parse_ms'], result['times']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clientside against callback interactions')
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 10, 30])
+    parser.add_argument('--interactions', type=int, default=20)
+    args = parser.parse_args()
+
+    node = shutil.which('node')
+    client = dashboard.app.server.test_client()
+    print(f"{args.interactions} interactions per session; node: {node or 'not found'}")
+    print(f"{'years':>6} {'rows':>7} {'cb. KB':>7} {'cs. KB':>7} {'cs. repeat':>10} "
+          f"{'cb. p50 ms':>10} {'cb. p95 ms':>10} {'cs. p50 ms':>10} {'cs. p95 ms':>10} "
+          f"{'cs. load ms':>11}")
+    for years in args.years:
+        df = synthetic_frame(years)
+        use_frame(df)
+        steps = session(df, args.interactions)
+        callback_bytes, callback_times = callback_session(client, steps)
+        first, repeat, immutable, parse_ms, client_times = clientside_session(client, steps, node)
+        if not immutable:
+            print('Payload is not served immutable')
+        if client_times is None:
+            client_p50 = client_p95 = parse = 'n/a'
+        else:
+            client_p50 = f'{np.percentile(client_times, 50):.2f}'
+            client_p95 = f'{np.percentile(client_times, 95):.2f}'
+            parse = f'{parse_ms:.1f}'
+        print(f"{years:>6g} {len(df):>7} {callback_bytes / 1024:>7.0f} {first / 1024:>7.0f} "
+              f"{repeat / 1024:>10.0f} {np.percentile(callback_times, 50):>10.1f} "
+              f"{np.percentile(callback_times, 95):>10.1f} {client_p50:>10} {client_p95:>10} "
+              f"{parse:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# Local load test of the dashboard with 1, 2 and 4 waitress workers
+# Starts Plotly_python_script.py on a free port for each worker count, fed by a snapshot of
+# synthetic daily rows so no database is needed. Then drives it from several client
+# processes for a fixed time. Each client mixes page layouts with zoom callbacks on
+# random windows, which miss the caches and downsample and serialize a new figure patch.
+# Reports requests per second, p50/p95 latency, and the server's total proportional set
+# size (PSS, shared pages split between the processes sharing them).
+#
+# Usage: python3 Bench_load.py --workers 1 2 4 --clients 8 --seconds 20 --years 30
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from App_snapshot import LocalSnapshots, publish_snapshot, render_figure
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COLUMNS = ['dow', 'nasdaq', 'sp500', 'inflation_5yr', 'oil', 'interest', 't_note_10yr',
+           'cpi_item_cost', 'cpi_purchase_power', 'confidence']
+
+
+def synthetic_frame(years, end='2024-06-28'):
+    dates = pd.date_range(end=end, periods=int(years * 365.25))
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(100, 10, (len(dates), len(COLUMNS))).cumsum(axis=0).round(2),
+                      columns=COLUMNS)
+    df.insert(0, 'date', dates.date)
+    return df
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/_dash-layout')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'Dashboard did not come up on port {port}')
+
+
+def zoom_payload(rng, first, last):
+    start = first + pd.Timedelta(days=rng.randrange((last - first).days - 400))
+    end = start + pd.Timedelta(days=rng.randrange(60, 400))
+    relayout = {'xaxis3.range[0]': start.strftime('%Y-%m-%d'),
+                'xaxis3.range[1]': end.strftime('%Y-%m-%d')}
+    return json.dumps({
+        'output': '..plot.figure...window.data..',
+        'outputs': [{'id': 'plot', 'property': 'figure'}, {'id': 'window', 'property': 'data'}],
+        'inputs': [{'id': 'metric', 'property': 'value', 'value': rng.choice(COLUMNS)},
+                   {'id': 'plot', 'property': 'relayoutData', 'value': relayout}],
+        'changedPropIds': ['plot.relayoutData'],
+        'state': [{'id': 'window', 'property': 'data', 'value': None}],
+    })
+
+
+def client(args):
+    port, seconds, seed, first, last = args
+    rng = random.Random(seed)
+    first, last = pd.Timestamp(first), pd.Timestamp(last)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if rng.random() < 0.2:
+                conn.request('GET', '/_dash-layout', headers={'Accept-Encoding': 'gzip'})
+            else:
+                conn.request('POST', '/_dash-update-component', body=zoom_payload(rng, first, last),
+                             headers={'Content-Type': 'application/json',
+                                      'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - started)
+    return latencies, errors
+
+
+def process_tree(pid):
+    pids = [pid]
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/task/{p}/children') as f:
+                pids += [int(c) for c in f.read().split()]
+        except OSError:
+            pass
+    return pids
+
+
+def pss_mb(pids):
+    total = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Pss:'):
+                        total += int(line.split()[1])
+        except OSError:
+            return None
+    return total / 1024
+
+
+def run(workers, clients, seconds, snapshot_dir, first, last):
+    port = free_port()
+    work = tempfile.mkdtemp(prefix='bench_load_')
+    env = dict(os.environ, DASH_WORKERS=str(workers), DASH_PORT=str(port),
+               ECON_SNAPSHOT_URI=snapshot_dir, DASH_SHARED_DIR=os.path.join(work, 'shared'),
+               DASH_EGRESS_FILE=os.path.join(work, 'egress.json'),
+               DASH_EGRESS_BUDGET_MB='1000000',
+               FRED_KEY='', DB_NAME='', DB_USER='', DB_PASSWORD='', DB_HOST='', DB_PORT='')
+    server = subprocess.Popen([sys.executable, 'Plotly_python_script.py'], cwd=HERE, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        # Warm every worker before measuring
+        with multiprocessing.Pool(clients) as pool:
+            pool.map(client, [(port, 2, -i, first, last) for i in range(clients)])
+            started = time.perf_counter()
+            results = pool.map(client, [(port, seconds, i, first, last) for i in range(clients)])
+            elapsed = time.perf_counter() - started
+        memory = pss_mb(process_tree(server.pid))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = np.array([x for r, _ in results for x in r])
+    errors = sum(e for _, e in results)
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'pss_mb': memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard throughput by worker count')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--years', type=float, default=30)
+    args = parser.parse_args()
+
+    snapshot_dir = tempfile.mkdtemp(prefix='bench_snapshots_')
+    df = synthetic_frame(args.years)
+    publish_snapshot(LocalSnapshots(snapshot_dir), df, render_figure(df))
+    first, last = str(df['date'].iloc[0]), str(df['date'].iloc[-1])
+
+    print(f"{len(df)} rows, {args.clients} clients, {args.seconds:g}s per run, "
+          f"{os.cpu_count()} cpus")
+    print(f"{'workers':>7} {'requests':>9} {'errors':>6} {'rps':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'PSS MB':>8}")
+    for workers in args.workers:
+        r = run(workers, args.clients, args.seconds, snapshot_dir, first, last)
+        memory = f"{r['pss_mb']:.0f}" if r['pss_mb'] is not None else 'n/a'
+        print(f"{r['workers']:>7} {r['requests']:>9} {r['errors']:>6} {r['rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {memory:>8}")
+
+
+if __name__ == '__main__':
+    main()
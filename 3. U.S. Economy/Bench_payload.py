@@ -0,0 +1,176 @@
+# Payload benchmark for the dashboard
+# Reports the bytes a visitor downloads per page load for the figure data, the layout
+# JSON from /_dash-layout, with the metric dropdown embedded in the figure ('embedded',
+# the original) and with metrics loaded on demand by callback ('callback'), plus the
+# response size of one metric selection in callback mode. The Dash JS bundles and
+# assets are the same in both modes and are left out.
+# With --visits it also reports the bytes of a whole page visit (index, JS bundles, layout,
+# dependencies, flowchart): uncompressed as before the HTTP layer, compressed on a first
+# visit, and on a repeat visit where cached bundles are reused and the rest revalidated.
+# With --live it reports what an open page downloads when one new day of data arrives:
+# the live-update poll against reloading the page layout.
+# econ_metrics is replaced by a synthetic frame of daily rows, so no database is needed.
+#
+# Usage: python3 Bench_payload.py --years 1 10 30 [--visits] [--live]
+
+import argparse
+import gzip
+import json
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import Plotly_python_script as dashboard
+
+COLUMNS = ['dow', 'nasdaq', 'sp500', 'inflation_5yr', 'oil', 'interest', 't_note_10yr',
+           'cpi_item_cost', 'cpi_purchase_power', 'confidence']
+
+
+def synthetic_frame(years, end='2024-06-28'):
+    dates = pd.date_range(end=end, periods=int(years * 365.25))
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(100, 10, (len(dates), len(COLUMNS))).round(2), columns=COLUMNS)
+    df.insert(0, 'date', dates.date)
+    return df
+
+
+def use_frame(df):
+    # Serve the synthetic frame from the dashboard's store without touching a database
+    store = dashboard.store
+    store.frame = df
+    store.version += 1
+    store.refresh_seconds = float('inf')
+    store.checked_at = time.monotonic()
+
+
+def sizes(body):
+    return len(body), len(gzip.compress(body))
+
+
+def measure(client, mode):
+    dashboard.METRIC_MODE = mode
+    layout = client.get('/_dash-layout').data
+    result = {'layout': sizes(layout)}
+    if mode == 'callback':
+        payload = {'output': '..plot.figure...window.data..',
+                   'outputs': [{'id': 'plot', 'property': 'figure'},
+                               {'id': 'window', 'property': 'data'}],
+                   'inputs': [{'id': 'metric', 'property': 'value', 'value': 'oil'},
+                              {'id': 'plot', 'property': 'relayoutData', 'value': None}],
+                   'changedPropIds': ['metric.value'],
+                   'state': [{'id': 'window', 'property': 'data', 'value': None}]}
+        response = client.post('/_dash-update-component', data=json.dumps(payload),
+                               content_type='application/json')
+        result['select'] = sizes(response.data)
+    return result
+
+
+def visit_bytes(client, compressed=True, cached=None):
+    """Bytes downloaded by one page visit; `cached` maps urls to the ETag and max-age
+    seen on the previous visit, and is updated for the next one"""
+    headers = {'Accept-Encoding': 'gzip, br' if compressed else 'identity'}
+    index = client.get('/', headers=headers)
+    html = index.get_data()
+    if index.headers.get('Content-Encoding') == 'gzip':
+        html = gzip.decompress(html)
+    urls = re.findall(r'(?:src|href)="(/[^"]+\.(?:js|css)[^"]*)"', html.decode())
+    urls += ['/_dash-layout', '/_dash-dependencies', '/assets/Flowchart.jpg']
+
+    total = len(index.data)
+    for url in urls:
+        request_headers = dict(headers)
+        if cached is not None and url in cached:
+            etag, max_age = cached[url]
+            if max_age:
+                continue
+            if etag:
+                request_headers['If-None-Match'] = f'"{etag}"'
+        response = client.get(url, headers=request_headers)
+        total += len(response.data)
+        if cached is not None and response.status_code == 200:
+            cached[url] = (response.get_etag()[0], response.cache_control.max_age)
+    return total
+
+
+def live_bytes(client, df, new_days=1):
+    """Bytes of the live-update poll, and of a full layout reload, after `new_days` rows
+    are added to what the page has"""
+    use_frame(df.iloc[:-new_days].reset_index(drop=True))
+    layout = json.loads(client.get('/_dash-layout').data)
+    stores = [c for c in walk(layout) if c.get('props', {}).get('id') == 'last-date']
+    last_date = stores[0]['props']['data']
+
+    use_frame(df)
+    # The figure output of the live callback carries a hash, as it is a duplicate output
+    output = next(d['output'] for d in json.loads(client.get('/_dash-dependencies').data)
+                  if 'last-date.data' in d['output'])
+    figure = output.strip('.').split('...')[0]
+    payload = {'output': output,
+               'outputs': [{'id': 'plot', 'property': figure.split('.', 1)[1]},
+                           {'id': 'last-date', 'property': 'data'}],
+               'inputs': [{'id': 'live', 'property': 'n_intervals', 'value': 1}],
+               'changedPropIds': ['live.n_intervals'],
+               'state': [{'id': 'last-date', 'property': 'data', 'value': last_date},
+                         {'id': 'metric', 'property': 'value', 'value': 'dow'}]}
+    poll = client.post('/_dash-update-component', data=json.dumps(payload),
+                       content_type='application/json', headers={'Accept-Encoding': 'gzip'})
+    reload = client.get('/_dash-layout', headers={'Accept-Encoding': 'gzip'})
+    return len(poll.data), len(reload.data)
+
+
+def walk(component):
+    # Every component dict in a serialized Dash layout
+    if isinstance(component, dict):
+        if 'props' in component:
+            yield component
+        for value in component.values():
+            yield from walk(value)
+    elif isinstance(component, list):
+        for value in component:
+            yield from walk(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bytes per dashboard page load by metric mode')
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 10, 30])
+    parser.add_argument('--visits', action='store_true', help='also measure whole page visits')
+    parser.add_argument('--live', action='store_true', help='also measure live-update polls')
+    args = parser.parse_args()
+
+    client = dashboard.app.server.test_client()
+    print(f"{'years':>6} {'rows':>7} {'embedded KB':>12} {'callback KB':>12} "
+          f"{'gzip emb.':>10} {'gzip cb.':>10} {'select KB':>10} {'ratio':>6}")
+    for years in args.years:
+        df = synthetic_frame(years)
+        use_frame(df)
+        embedded = measure(client, 'embedded')
+        callback = measure(client, 'callback')
+        print(f"{years:>6g} {len(df):>7} {embedded['layout'][0] / 1024:>12.0f} "
+              f"{callback['layout'][0] / 1024:>12.0f} {embedded['layout'][1] / 1024:>10.0f} "
+              f"{callback['layout'][1] / 1024:>10.0f} {callback['select'][0] / 1024:>10.0f} "
+              f"{embedded['layout'][0] / callback['layout'][0]:>6.1f}")
+
+    if args.visits:
+        dashboard.METRIC_MODE = 'callback'
+        print(f"\n{'years':>6} {'plain KB':>9} {'first KB':>9} {'repeat KB':>10} {'ratio':>6}")
+        for years in args.years:
+            use_frame(synthetic_frame(years))
+            plain = visit_bytes(client, compressed=False)
+            cached = {}
+            first = visit_bytes(client, cached=cached)
+            repeat = visit_bytes(client, cached=cached)
+            print(f"{years:>6g} {plain / 1024:>9.0f} {first / 1024:>9.0f} {repeat / 1024:>10.1f} "
+                  f"{plain / max(first, 1):>6.1f}")
+
+    if args.live:
+        dashboard.METRIC_MODE = 'callback'
+        print(f"\n{'years':>6} {'poll bytes':>11} {'reload KB':>10}")
+        for years in args.years:
+            poll, reload = live_bytes(client, synthetic_frame(years))
+            print(f"{years:>6g} {poll:>11} {reload / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+# End-to-end pipeline benchmark, fully offline
+# Times each stage of the daily update and the dashboard separately against
+# Scrape_fake_fred.py (with configurable latency and rate limit) and a synthetic
+# econ_metrics table of every requested size:
+#   fetch            the daily update's FRED requests, measured once per run
+#   missed_daily_monthly  the original per-series calendar alignment over the whole
+#                    history (Bench_alignment.legacy_align), up to --legacy-max-rows
+#   align            the same alignment with Scrape_align.align_long
+#   insert           bulk_upsert of the whole history into an empty table (a plain COPY
+#                    with --legacy-schema, as bulk_upsert merges on the primary key)
+#   update_db        the original per-row existence check of a 31 day batch whose last
+#                    week is new, up to --legacy-max-rows
+#   append_from_df_to_db  the original per-row INSERT of that batch's new days, rolled back
+#   upsert_daily     bulk_upsert of a 31 day batch with 7 revised days (not with
+#                    --legacy-schema)
+#   read             read_metrics of the whole table, as the dashboard and snapshots do
+#   figure           the dashboard's default figure, downsampled, and its JSON size
+#   figure_embedded  the original figure with every column embedded, up to --legacy-max-rows
+# Without a database DSN the database stages run against a stand-in connection. It
+# answers every statement after a simulated round trip, plus transfer time for COPY,
+# so the stand-in measures round trips rather than PostgreSQL's work.
+# With --dsn (or BENCH_DSN) econ_metrics and schema_migrations in that database are
+# dropped and recreated, so point it at a scratch database.
+# Sizes past about 260k rows start in the year 1000 instead of ending in 2024.
+# Results are written as JSON; --compare prints the change of every stage against an
+# earlier results file and flags regressions.
+#
+# Usage: python3 Bench_pipeline.py --rows 1000 10000 100000 1000000 [--dsn postgresql://...]
+#        python3 Bench_pipeline.py --rows 1000 10000 --compare bench_pipeline_old.json
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from Bench_alignment import legacy_align
+from Scrape_align import align_long
+from Scrape_db import bulk_upsert, incremental_periods, read_metrics
+from Scrape_fake_fred import start_fake_fred
+from Scrape_fred_fetch import TokenBucket, fetch_observations
+from Scrape_series import SERIES, COLUMNS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+END = date(2024, 6, 28)
+# Earliest synthetic date; four-digit years keep the CSV dates of bulk_upsert valid
+FIRST_DAY = date(1000, 1, 1)
+
+
+class StandInCursor:
+    """Cursor answering every statement after one simulated round trip"""
+
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+        self.description = None
+        self.sql = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.db.round_trip()
+        self.rowcount = 0
+        self.sql = sql
+
+    def copy_expert(self, sql, buf):
+        self.db.round_trip(len(buf.getvalue()) if isinstance(buf, io.StringIO) else 0)
+
+    def fetchone(self):
+        # Counts are zero and lookups find nothing, as in an empty table
+        return (0,) if 'count(' in self.sql else None
+
+    def fetchall(self):
+        return []
+
+
+class StandInConnection:
+    """psycopg2-like connection whose statements only cost simulated network time"""
+
+    def __init__(self, latency=0.001, bandwidth=50e6):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.autocommit = True
+        self.round_trips = 0
+
+    def rollback(self):
+        self.round_trip()
+
+    def round_trip(self, nbytes=0):
+        self.round_trips += 1
+        time.sleep(self.latency + nbytes / self.bandwidth)
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+
+def calendar(rows):
+    """Consecutive days holding `rows` weekdays after the first monthly release, ending
+    on END, or starting on FIRST_DAY when they cannot"""
+    n_days = rows * 7 // 5 + 62
+    start = date.fromordinal(max(END.toordinal() - n_days + 1, FIRST_DAY.toordinal()))
+    return np.arange(np.datetime64(start), np.datetime64(start) + n_days).astype('datetime64[D]')
+
+
+def synthetic_long(days, seed=0):
+    """Long-format observations of every series over `days`: daily series on weekdays,
+    monthly series on the 1st, as FRED publishes them"""
+    rng = np.random.default_rng(seed)
+    weekday = (days.astype(np.int64) + 3) % 7 < 5
+    first = days.astype('datetime64[M]').astype('datetime64[D]') == days
+    frames = []
+    for series_id, _, freq in SERIES:
+        on = first if freq == 'monthly' else weekday
+        values = (1000 + rng.normal(0, 1, on.sum()).cumsum()).round(2)
+        frames.append(pd.DataFrame({'series_id': series_id, 'date': days[on], 'value': values}))
+    long_df = pd.concat(frames, ignore_index=True)
+    long_df['series_id'] = pd.Categorical(long_df['series_id'],
+                                          categories=[s for s, _, _ in SERIES])
+    long_df['date'] = pd.to_datetime(long_df['date'])
+    return long_df
+
+
+def reset_table(conn, keyed):
+    from Scrape_migrations import migrate, create_table
+
+    if isinstance(conn, StandInConnection):
+        return
+    with conn.cursor() as cur:
+        cur.execute('DROP TABLE IF EXISTS econ_metrics, schema_migrations CASCADE')
+        if keyed:
+            migrate(conn)
+        else:
+            # The original table: no key on date
+            create_table(cur)
+
+
+def timed(stages, name, fn, **extra):
+    """Run fn, record its seconds (or the error it raised) under `name`, return its value"""
+    start = time.perf_counter()
+    try:
+        value = fn()
+    except Exception as e:
+        stages[name] = {'error': repr(e)}
+        print(f"  {name:<22} failed: {e!r}")
+        return None
+    stages[name] = dict({'seconds': time.perf_counter() - start}, **extra)
+    print(f"  {name:<22} {stages[name]['seconds']:>10.4f} s")
+    return value
+
+
+def note(stages, name, **extra):
+    stages[name].update(extra)
+    print(f"  {'':<22} {', '.join(f'{k} {v}' for k, v in extra.items())}")
+
+
+def bench_fetch(latency, requests_per_minute, client_rpm):
+    server = start_fake_fred(latency=latency, requests_per_minute=requests_per_minute)
+    periods = incremental_periods({}, datetime.today())
+    started = time.perf_counter()
+    fetched = fetch_observations([(series_id, periods[series_id]) for series_id, _, _ in SERIES],
+                                 api_key='benchmark', base_url=server.base_url,
+                                 bucket=TokenBucket(client_rpm))
+    seconds = time.perf_counter() - started
+    server.shutdown()
+    result = {'seconds': seconds, 'requests': server.request_count,
+              'rejected': server.rejected_count,
+              'bytes': sum(r.nbytes for r in fetched.values()),
+              'observations': sum(len(r.observations) for r in fetched.values())}
+    print(f"  {'fetch':<22} {seconds:>10.4f} s, {result['requests']} requests, "
+          f"{result['bytes']} bytes")
+    return result
+
+
+# The original row-at-a-time write path of the daily update, replaced by bulk_upsert: one
+# SELECT per row to check the date and one INSERT per new row
+
+def check_if_date_exists(cur, date):
+    query = ("""SELECT date FROM econ_metrics WHERE date = %s""")
+    cur.execute(query, (date,))
+    return cur.fetchone() is not None
+
+
+def insert_into_table(cur, date, Dow, NASDAQ, SP500, Inflation_5yr, Oil,
+                      Interest, T_Note_10yr, CPI_item_cost, CPI_purchase_power, Confidence):
+    insert_into_econ_metrics = ("""INSERT INTO econ_metrics (date, Dow, NASDAQ, SP500,
+    Inflation_5yr, Oil, Interest, T_Note_10yr, CPI_item_cost, CPI_purchase_power, Confidence)
+                        VALUES(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);""")
+    row_to_insert = (date, Dow, NASDAQ, SP500, Inflation_5yr, Oil,
+                     Interest, T_Note_10yr, CPI_item_cost, CPI_purchase_power, Confidence)
+    cur.execute(insert_into_econ_metrics, row_to_insert)
+
+
+def append_from_df_to_db(cur,df_final):
+    for i, row in df_final.iterrows():
+        insert_into_table(cur, row['date'],  row['Dow'],
+                          row['NASDAQ'], row['SP500'], row['Inflation_5yr'], row['Oil'],
+                          row['Interest'], row['T_Note_10yr'], row['CPI_item_cost'],
+                          row['CPI_purchase_power'], row['Confidence'])
+
+
+def update_db(cur,df_final):
+    # If date exists then skip it, else keep the row to append it with append_from_df_to_db
+    exists = [check_if_date_exists(cur, date) for date in df_final['date']]
+    return df_final[[not e for e in exists]]
+
+
+def copy_rows(conn, df_final):
+    """Append df_final to econ_metrics with one COPY, for the original table without a key"""
+    buf = io.StringIO()
+    df_final[['date'] + COLUMNS].to_csv(buf, index=False, header=False, date_format='%Y-%m-%d')
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY econ_metrics (date, {', '.join(COLUMNS)}) FROM STDIN "
+                        "WITH (FORMAT csv)", buf)
+
+
+def bench_size(rows, conn, keyed, legacy_max_rows):
+    from Plotly_downsample import overview_points
+    from Plotly_figure import build_figure
+
+    print(f"{rows} rows")
+    stages = {}
+    days = calendar(rows)
+    long_df = synthetic_long(days)
+    start, end = pd.Timestamp(days[0]), pd.Timestamp(days[-1])
+    series = SERIES
+
+    if rows <= legacy_max_rows:
+        timed(stages, 'missed_daily_monthly', lambda: legacy_align(long_df, series, start, end))
+    df_final = timed(stages, 'align', lambda: align_long(long_df, start, end))
+    if df_final is None:
+        return stages
+    # Weekends, and days before the first monthly release, are dropped as in the daily update
+    df_final = df_final.dropna().tail(rows).reset_index(drop=True)
+
+    reset_table(conn, keyed)
+    merge = keyed or isinstance(conn, StandInConnection)
+    timed(stages, 'insert', lambda: (bulk_upsert if merge else copy_rows)(conn, df_final),
+          rows=len(df_final))
+
+    if rows <= legacy_max_rows:
+        # The original write path on the last 31 days moved a week later, so the newest
+        # week is new: the existence checks, then one INSERT per new day, rolled back
+        legacy = df_final.tail(31).copy()
+        legacy['date'] = pd.to_datetime(legacy['date']) + pd.Timedelta(days=7)
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                new = timed(stages, 'update_db', lambda: update_db(cur, legacy), rows=len(legacy))
+                if new is not None:
+                    timed(stages, 'append_from_df_to_db', lambda: append_from_df_to_db(cur, new),
+                          rows=len(new))
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+
+    batch = df_final.tail(31).copy()
+    batch.iloc[-7:, 1:] += 0.01
+    if merge:
+        timed(stages, 'upsert_daily', lambda: bulk_upsert(conn, batch), rows=len(batch))
+
+    if not isinstance(conn, StandInConnection):
+        with conn.cursor() as cur:
+            read = timed(stages, 'read', lambda: read_metrics(cur))
+        if read is not None:
+            df_final = read
+    frame = df_final.rename(columns=str.lower)
+
+    dates = pd.to_datetime(frame['date']).to_numpy().astype('datetime64[D]')
+    points = lambda col: overview_points(dates, frame[col].to_numpy(dtype=np.float64))
+    figure_json = timed(stages, 'figure',
+                        lambda: build_figure(frame, metric_menu=False, points=points).to_json())
+    if figure_json is not None:
+        note(stages, 'figure', json_bytes=len(figure_json))
+    if rows <= legacy_max_rows:
+        figure_json = timed(stages, 'figure_embedded', lambda: build_figure(frame).to_json())
+        if figure_json is not None:
+            note(stages, 'figure_embedded', json_bytes=len(figure_json))
+    if isinstance(conn, StandInConnection):
+        stages['db_round_trips'] = conn.round_trips
+        conn.round_trips = 0
+    return stages
+
+
+def git_commit():
+    out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                         capture_output=True, text=True)
+    return out.stdout.strip() or None
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """Print every stage's time against `baseline` and return the regressed ones: slower
+    by more than `threshold` times and by more than `min_seconds`"""
+    for key in ('database', 'schema', 'cpus'):
+        if baseline.get(key) != results.get(key):
+            print(f"Note: {key} differs, {baseline.get(key)} before and {results.get(key)} now")
+    regressions = []
+    old = {r['rows']: r['stages'] for r in baseline['sizes']}
+    print(f"\n{'rows':>8} {'stage':<22} {'before s':>10} {'after s':>10} {'change':>8}")
+    pairs = [(None, 'fetch', baseline.get('fetch'), results.get('fetch'))]
+    for r in results['sizes']:
+        for name, stage in r['stages'].items():
+            pairs.append((r['rows'], name, old.get(r['rows'], {}).get(name), stage))
+    for rows, name, before, after in pairs:
+        if not isinstance(before, dict) or not isinstance(after, dict):
+            continue
+        if 'seconds' not in before or 'seconds' not in after:
+            continue
+        ratio = after['seconds'] / max(before['seconds'], 1e-9)
+        slower = after['seconds'] - before['seconds'] > min_seconds
+        flag = ' <-- regression' if ratio > threshold and slower else ''
+        if flag:
+            regressions.append((rows, name, ratio))
+        print(f"{rows if rows else '':>8} {name:<22} {before['seconds']:>10.4f} "
+              f"{after['seconds']:>10.4f} {ratio:>7.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline per-stage pipeline benchmark')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DSN'),
+                        help='scratch PostgreSQL database; a stand-in is used without one')
+    parser.add_argument('--legacy-schema', action='store_true',
+                        help='benchmark econ_metrics without the migrations (no key on date, '
+                             'so no upsert_daily)')
+    parser.add_argument('--db-latency', type=float, default=0.001,
+                        help='round trip of the stand-in database, seconds')
+    parser.add_argument('--fred-latency', type=float, default=0.05,
+                        help='latency of each fake FRED response, seconds')
+    parser.add_argument('--fred-rpm', type=int, default=None,
+                        help='requests per minute the fake FRED accepts before HTTP 429')
+    parser.add_argument('--client-rpm', type=int, default=120,
+                        help='token bucket rate of the fetch engine')
+    parser.add_argument('--legacy-max-rows', type=int, default=100000,
+                        help='largest size the original code paths are timed at')
+    parser.add_argument('--output', help='results file (default bench_pipeline_<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio reported as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help='smaller slowdowns are timing noise, not regressions')
+    args = parser.parse_args()
+
+    if args.dsn:
+        import psycopg2
+        conn = psycopg2.connect(args.dsn)
+        conn.autocommit = True
+        database = 'postgresql'
+    else:
+        conn = StandInConnection(latency=args.db_latency)
+        database = 'stand-in'
+
+    now = datetime.now(timezone.utc)
+    results = {
+        'created': now.isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'database': database,
+        'schema': 'original' if args.legacy_schema else 'migrated',
+        # The DSN may hold a password
+        'args': dict(vars(args), dsn=bool(args.dsn)),
+    }
+    print(f"Database: {database}, schema: {results['schema']}")
+    results['fetch'] = bench_fetch(args.fred_latency, args.fred_rpm, args.client_rpm)
+    results['sizes'] = [{'rows': rows,
+                         'stages': bench_size(rows, conn, not args.legacy_schema,
+                                              args.legacy_max_rows)}
+                        for rows in args.rows]
+    conn.close()
+
+    output = args.output or f'bench_pipeline_{now:%Y%m%dT%H%M%SZ}.json'
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1, default=str)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} stages slower than {args.threshold}x")
+
+
+if __name__ == '__main__':
+    main()
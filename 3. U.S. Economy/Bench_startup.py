@@ -0,0 +1,75 @@
+# Startup benchmark for the daily update container
+# Reports, each as the best of several fresh interpreter runs:
+#   - import time of the original module set (numpy, pandas, fredpy, matplotlib,
+#     statsmodels, boto3) against the import time of Scrape_python_script today
+#   - time from process start to the first FRED API call, and the total run time,
+#     for a full daily update against Scrape_fake_fred.py
+# The run needs a PostgreSQL database with the econ_metrics table, taken from the DB_*
+# environment variables; without one only the import times are reported.
+#
+# Usage: DB_HOST=localhost DB_NAME=postgres DB_USER=postgres DB_PASSWORD= DB_PORT=5432 \
+#        python3 Bench_startup.py
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from Scrape_fake_fred import start_fake_fred
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LEGACY_IMPORTS = ('import numpy, pandas, psycopg2, boto3, botocore.exceptions, subprocess, '
+                  'matplotlib.pyplot, statsmodels.api, fredpy')
+
+
+def import_seconds(statement, env):
+    code = ('import time; t = time.perf_counter(); ' + statement +
+            '; print(time.perf_counter() - t)')
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def daily_run(env, server):
+    server.first_request_at = None
+    start = time.time()
+    out = subprocess.run([sys.executable, 'Scrape_python_script.py'], cwd=HERE, env=env,
+                         capture_output=True, text=True)
+    total = time.time() - start
+    if out.returncode != 0 or server.first_request_at is None:
+        print(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else 'daily run failed')
+        return None, None
+    return server.first_request_at - start, total
+
+
+def best(values):
+    values = [v for v in values if v is not None]
+    return '%8.3f s' % min(values) if values else '     n/a'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup benchmark for the daily update')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    server = start_fake_fred()
+    tmp = tempfile.mkdtemp()
+    env_file = os.path.join(tmp, 'env.source')
+    with open(env_file, 'w') as f:
+        f.write('FRED_KEY=benchmark\n')
+    env = dict(os.environ, ECON_ENV_FILE=env_file, FRED_BASE_URL=server.base_url,
+               FRED_CACHE_MODE='off', FRED_CACHE_DIR=tmp)
+
+    legacy = [import_seconds(LEGACY_IMPORTS, env) for _ in range(args.repeat)]
+    current = [import_seconds('import Scrape_python_script', env) for _ in range(args.repeat)]
+    runs = [daily_run(env, server) for _ in range(args.repeat)] if 'DB_HOST' in env else []
+
+    print('original imports          ', best(legacy))
+    print('Scrape_python_script import', best(current))
+    print('time to first API call    ', best([r[0] for r in runs]))
+    print('daily update total        ', best([r[1] for r in runs]))
@@ -1,77 +1,159 @@
 # This Lambda function coordinates running the plotly script and the daily scraping script on the same EC2 instance ...
 # in order to remain within the AWS free tier resource limits.
+# Instead of fixed sleeps, ECS task and service state is polled with backoff: the dashboard
+# is restarted as soon as the ingest task exits, and a run that outlives its time budget
+# is stopped and reported as a timeout.
+# All ECS calls go through ecs_client, so the handler is tested offline with
+# botocore.stub.Stubber(ecs_client) and a no-op sleep, see Lambda_scripts_coordinator_test.py.
+# Not needed when the dashboard runs the daily update itself, see DASH_INGEST=scheduled in
+# Plotly_scheduler.py
 
 import json
+import os
 import boto3
 import time
+from botocore.exceptions import BotoCoreError, ClientError
 
 ecs_client = boto3.client('ecs')
 
-def stop_ecs_service(cluster, service):
-    response = ecs_client.update_service(
+# Seconds to wait for the dashboard service to drain, and for the ingest task to finish
+# Lambda functions run for at most 15 minutes, so both together must stay below that
+SERVICE_STOP_TIMEOUT = int(os.environ.get('SERVICE_STOP_TIMEOUT', 180))
+INGEST_TIMEOUT = int(os.environ.get('INGEST_TIMEOUT', 600))
+
+def stop_ecs_service(cluster, service, client=None):
+    response = (client or ecs_client).update_service(
         cluster=cluster,
         service=service,
         desiredCount=0
     )
     return response
 
-def start_ecs_service(cluster, service):
-    response = ecs_client.update_service(
+def start_ecs_service(cluster, service, client=None):
+    response = (client or ecs_client).update_service(
         cluster=cluster,
         service=service,
         desiredCount=1
     )
     return response
 
-def lambda_handler(event, context):
+def poll(check, timeout, initial_delay=2, max_delay=30, sleep=time.sleep):
+    # Call check() until it returns something other than None, sleeping with exponential
+    # backoff in between; returns None once timeout seconds of sleeping have passed
+    waited = 0
+    delay = initial_delay
+    while True:
+        result = check()
+        if result is not None:
+            return result
+        if waited >= timeout:
+            return None
+        delay = min(delay, timeout - waited, max_delay)
+        sleep(delay)
+        waited += delay
+        delay = min(delay * 2, max_delay)
+
+def wait_for_service_drained(cluster, service, timeout, client=None, sleep=time.sleep):
+    # True once the service has no running or pending tasks
+    def check():
+        response = (client or ecs_client).describe_services(cluster=cluster, services=[service])
+        s = response['services'][0]
+        return True if s['runningCount'] == 0 and s['pendingCount'] == 0 else None
+    return poll(check, timeout, sleep=sleep) is not None
+
+def wait_for_task_stopped(cluster, task_arn, timeout, client=None, sleep=time.sleep):
+    # Task description once it has stopped, None if it is still running after timeout;
+    # RuntimeError when ECS cannot describe the task
+    def check():
+        response = (client or ecs_client).describe_tasks(cluster=cluster, tasks=[task_arn])
+        if response.get('failures') or not response.get('tasks'):
+            raise RuntimeError(f"Could not describe task {task_arn}: {response.get('failures')}")
+        task = response['tasks'][0]
+        return task if task['lastStatus'] == 'STOPPED' else None
+    return poll(check, timeout, sleep=sleep)
+
+def lambda_handler(event, context, sleep=time.sleep):
     # Replace 'your_cluster_name' and 'your_service_name' with your actual ECS cluster and service names
     cluster = 'econdaily'
     service = 'econplotly'
     task_definition = 'arn:aws:ecs:us-east-1:307103213532:task-definition/econdaily'
+    started = time.time()
+    result = {'ingest': 'not started', 'exitCode': None}
+    task_arn = None
+    task = None
 
     # Stop the ECS service
     stop_ecs_service(cluster, service)
     print(f'Stopped ECS service: {service}')
-    
-    # Give ECS service time to fully stop
-    time.sleep(120)
-    
-    # Try/except clause ensures the Plotly website keeps running on AWS even if daily database update has errors
+
+    # Try/except/finally clause ensures the Plotly website is started again on AWS whatever
+    # happens from here on, even if the daily database update or an ECS call fails
     try:
-        
+        # Wait until the ECS service has fully stopped, rather than a fixed 2 minutes
+        drained = wait_for_service_drained(cluster, service, SERVICE_STOP_TIMEOUT, sleep=sleep)
+        print(f'Service drained: {drained} after {time.time() - started:.0f}s')
+
         # Get the container instances in your cluster
         response = ecs_client.list_container_instances(cluster=cluster)
         container_instances = response['containerInstanceArns']
-        
+
         # Run the ECS task using the first container instance in the list
         response1 = ecs_client.start_task(
             cluster=cluster,
             containerInstances=[container_instances[0]],
             taskDefinition=task_definition,
         )
-    
-        # The econdaily task takes about 7 minutes to run per prior log metrics
-        time.sleep(600)
-        
-        # Generate task_id from prior response1 since stop task method needs specific task_id
-        task_id = response1['tasks'][0]['taskArn'].split('/')[-1]
+        if not response1.get('tasks'):
+            raise RuntimeError(f"Ingest task not placed: {response1.get('failures')}")
+        task_arn = response1['tasks'][0]['taskArn']
+        task_id = task_arn.split('/')[-1]
         print(task_id)
-        
-        # Stop the ECS task
-        response2 = ecs_client.stop_task(
-            cluster=cluster,
-            task=task_id
-        )
-        
-    except error as err:
+
+        # Poll the task until it exits instead of sleeping for the worst case
+        task = wait_for_task_stopped(cluster, task_arn, INGEST_TIMEOUT, sleep=sleep)
+
+        if task is None:
+            # Stopped below, it ran past its time budget
+            result['ingest'] = 'timeout'
+        else:
+            container = task['containers'][0]
+            result['exitCode'] = container.get('exitCode')
+            result['stoppedReason'] = task.get('stoppedReason')
+            result['ingest'] = 'succeeded' if result['exitCode'] == 0 else 'failed'
+
+    except (ClientError, BotoCoreError) as err:
+        # API errors, and connection errors or timeouts of the ECS endpoint
         print(err)
-        pass
+        result['ingest'] = 'error'
+        result['error'] = str(err)
+    except (IndexError, KeyError, RuntimeError) as err:
+        # No container instance registered, no task placed or the task could not be tracked
+        print(f'Could not run the ingest task: {err!r}')
+        result['ingest'] = 'error'
+        result['error'] = repr(err)
+    finally:
+        # A started task that was not seen to stop, by a timeout or an error, is stopped so
+        # it cannot run on beside the dashboard
+        if task_arn is not None and task is None:
+            try:
+                ecs_client.stop_task(
+                    cluster=cluster,
+                    task=task_arn,
+                    reason=(f'Timed out after {INGEST_TIMEOUT}s' if result['ingest'] == 'timeout'
+                            else 'Stopped by the coordinator after an error')
+                )
+                print(f'Stopped ECS task: {task_arn}')
+            except (ClientError, BotoCoreError) as err:
+                print(f'Could not stop the ingest task: {err}')
+
+        # Start the ECS service
+        start_ecs_service(cluster, service)
+        print(f'Started ECS service: {service}')
 
-    # Start the ECS service
-    start_ecs_service(cluster, service)
-    print(f'Started ECS service: {service}')
+    result['seconds'] = round(time.time() - started)
+    print(json.dumps(result))
 
     return {
-        'statusCode': 200,
-        'body': 'Plotly paused, daily task ran, Plotly resumed.'
+        'statusCode': 200 if result['ingest'] == 'succeeded' else 500,
+        'body': json.dumps(dict(result, message='Plotly paused, daily task ran, Plotly resumed.'))
     }
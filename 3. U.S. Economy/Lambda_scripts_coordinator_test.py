@@ -0,0 +1,131 @@
+# Offline tests of Lambda_scripts_coordinator.lambda_handler
+# Every ECS call is answered by botocore.stub.Stubber on the module's ecs_client, in the
+# order the handler makes them, and sleeping is a no-op, so no AWS account is needed.
+#
+# Usage: python3 -m unittest Lambda_scripts_coordinator_test
+
+import json
+import os
+import unittest
+from unittest import mock
+
+# The client is created at import, it needs a region and credentials but never uses them
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+
+from botocore.exceptions import EndpointConnectionError
+from botocore.stub import ANY, Stubber
+
+import Lambda_scripts_coordinator as coordinator
+
+CLUSTER = 'econdaily'
+SERVICE = 'econplotly'
+TASK_ARN = 'arn:aws:ecs:us-east-1:307103213532:task/econdaily/0123456789abcdef'
+
+
+def stopped_task(exit_code):
+    return {'tasks': [{'taskArn': TASK_ARN, 'lastStatus': 'STOPPED',
+                       'stoppedReason': 'Essential container in task exited',
+                       'containers': [{'name': 'econdaily', 'exitCode': exit_code}]}]}
+
+
+class LambdaHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stubber = Stubber(coordinator.ecs_client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def expect_service(self, desired_count):
+        self.stubber.add_response('update_service', {},
+                                  {'cluster': CLUSTER, 'service': SERVICE,
+                                   'desiredCount': desired_count})
+
+    def expect_start(self, running_polls=0):
+        """Service stopped and drained, ingest task started and seen running `running_polls`
+        times"""
+        self.expect_service(0)
+        self.stubber.add_response('describe_services',
+                                  {'services': [{'runningCount': 0, 'pendingCount': 0}]},
+                                  {'cluster': CLUSTER, 'services': [SERVICE]})
+        self.stubber.add_response('list_container_instances',
+                                  {'containerInstanceArns': ['container-instance']},
+                                  {'cluster': CLUSTER})
+        self.stubber.add_response('start_task', {'tasks': [{'taskArn': TASK_ARN}], 'failures': []},
+                                  {'cluster': CLUSTER, 'containerInstances': ['container-instance'],
+                                   'taskDefinition': ANY})
+        for _ in range(running_polls):
+            self.stubber.add_response('describe_tasks',
+                                      {'tasks': [{'taskArn': TASK_ARN, 'lastStatus': 'RUNNING'}]},
+                                      {'cluster': CLUSTER, 'tasks': [TASK_ARN]})
+
+    def expect_stop_task(self):
+        self.stubber.add_response('stop_task', {},
+                                  {'cluster': CLUSTER, 'task': TASK_ARN, 'reason': ANY})
+
+    def run_handler(self):
+        response = coordinator.lambda_handler({}, None, sleep=lambda seconds: None)
+        self.stubber.assert_no_pending_responses()
+        return response['statusCode'], json.loads(response['body'])
+
+    def test_success(self):
+        self.expect_start(running_polls=2)
+        self.stubber.add_response('describe_tasks', stopped_task(0))
+        self.expect_service(1)
+        status, body = self.run_handler()
+        self.assertEqual(status, 200)
+        self.assertEqual((body['ingest'], body['exitCode']), ('succeeded', 0))
+
+    def test_non_zero_exit(self):
+        self.expect_start()
+        self.stubber.add_response('describe_tasks', stopped_task(1))
+        self.expect_service(1)
+        status, body = self.run_handler()
+        self.assertEqual(status, 500)
+        self.assertEqual((body['ingest'], body['exitCode']), ('failed', 1))
+
+    def test_timeout_stops_the_task(self):
+        self.expect_start(running_polls=1)
+        self.expect_stop_task()
+        self.expect_service(1)
+        with mock.patch.object(coordinator, 'INGEST_TIMEOUT', 0):
+            status, body = self.run_handler()
+        self.assertEqual(status, 500)
+        self.assertEqual(body['ingest'], 'timeout')
+
+    def test_describe_failure_stops_the_task(self):
+        self.expect_start()
+        self.stubber.add_response('describe_tasks',
+                                  {'tasks': [], 'failures': [{'arn': TASK_ARN, 'reason': 'MISSING'}]})
+        self.expect_stop_task()
+        self.expect_service(1)
+        status, body = self.run_handler()
+        self.assertEqual(status, 500)
+        self.assertEqual(body['ingest'], 'error')
+        self.assertIn('MISSING', body['error'])
+
+    def test_api_error_restarts_the_service(self):
+        self.expect_service(0)
+        self.stubber.add_response('describe_services',
+                                  {'services': [{'runningCount': 0, 'pendingCount': 0}]})
+        self.stubber.add_client_error('list_container_instances', 'AccessDeniedException')
+        self.expect_service(1)
+        status, body = self.run_handler()
+        self.assertEqual(status, 500)
+        self.assertEqual(body['ingest'], 'error')
+
+    def test_connection_error_restarts_the_service(self):
+        self.expect_service(0)
+        self.expect_service(1)
+        error = EndpointConnectionError(endpoint_url='https://ecs.us-east-1.amazonaws.com')
+        with mock.patch.object(coordinator.ecs_client, 'describe_services', side_effect=error):
+            status, body = self.run_handler()
+        self.assertEqual(status, 500)
+        self.assertEqual(body['ingest'], 'error')
+
+
+if __name__ == '__main__':
+    unittest.main()
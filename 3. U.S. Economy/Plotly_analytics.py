@@ -0,0 +1,51 @@
+# Confidence analytics panel for the dashboard
+# Charts what the daily update materialized in econ_analytics and econ_cross_correlations
+# (Scrape_analytics.py), so no statistic is computed while serving: the store hands over
+# the stored statistics of every window (MetricsStore.analytics: from the database, the
+# snapshot or the prefork parent's shared copy) and one figure is drawn per data version,
+# downsampled like the main panels.
+#   top     rolling correlation of Confidence with every other metric over
+#           DASH_ANALYTICS_WINDOW rows (252 by default, one of ECON_ANALYTICS_WINDOWS)
+#   bottom  correlation by lead/lag over the latest window; a peak at a positive lag
+#           means the metric leads Confidence by that many rows (trading days)
+
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.colors import DEFAULT_PLOTLY_COLORS
+from plotly.subplots import make_subplots
+
+from Plotly_downsample import DEFAULT_BUDGET, DEFAULT_METHOD, overview_points
+
+WINDOW = int(os.environ.get('DASH_ANALYTICS_WINDOW', 252))
+
+
+def build_analytics_figure(rolling, cross, window=WINDOW, budget=DEFAULT_BUDGET,
+                           method=DEFAULT_METHOD):
+    """Figure of the `window` rows of Scrape_analytics.read_analytics frames"""
+    rolling = rolling[rolling['window_rows'] == window]
+    cross = cross[cross['window_rows'] == window]
+    as_of = cross['as_of'].max() if len(cross) else None
+    fig = make_subplots(rows=2, cols=1, vertical_spacing=0.12,
+                        subplot_titles=(f'Rolling {window}-row correlation with Confidence',
+                                        f'Correlation with Confidence by lead (+) or lag (-) '
+                                        f'in rows, {window} rows to {as_of}'))
+    for i, (metric, group) in enumerate(rolling.groupby('metric', sort=False)):
+        x, y = overview_points(pd.to_datetime(group['date']).to_numpy().astype('datetime64[D]'),
+                               group['correlation'].to_numpy(dtype=np.float64), budget, method)
+        # Both panels share each metric's color and legend entry
+        color = DEFAULT_PLOTLY_COLORS[i % len(DEFAULT_PLOTLY_COLORS)]
+        fig.add_trace(go.Scatter(x=x, y=y, name=metric, legendgroup=metric,
+                                 line={'color': color}), row=1, col=1)
+        lagged = cross[cross['metric'] == metric]
+        fig.add_trace(go.Scatter(x=lagged['lag_rows'],
+                                 y=lagged['correlation'].to_numpy(dtype=np.float64),
+                                 name=metric, legendgroup=metric, showlegend=False,
+                                 mode='lines+markers', line={'color': color}), row=2, col=1)
+
+    fig.update_yaxes(range=[-1, 1])
+    fig.update_xaxes(type='date', row=1, col=1)
+    fig.update_layout(height=700, width=1100)
+    return fig
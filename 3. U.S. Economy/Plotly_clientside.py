@@ -0,0 +1,148 @@
+# Clientside interaction mode for the dashboard
+# The browser fetches all of econ_metrics once per data version as one compact columnar
+# JSON payload: dates as day offsets from the first date, one value list per column. The
+# payload URL carries a hash of its content, so it is served with a year-long immutable
+# Cache-Control and repeat visits take it from the browser cache.
+# Metric switching, zoom/range filtering and the summary readouts (last value and change
+# over the visible window) then run as clientside_callback JavaScript: interactions cost
+# no server CPU and no egress.
+# The components use their own ids, so the server callbacks of the other modes never fire.
+
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+from dash import Input, Output, State, dcc, html
+from flask import Response, request
+
+COLUMNS_ROUTE = '/data/metrics.json'
+
+GRAPH_ID = 'plot-client'
+METRIC_ID = 'metric-client'
+
+# Payload fetched once per data version; the browser cache answers repeat requests
+LOAD_COLUMNS = """
+function(url) {
+    if (!url) {
+        return window.dash_clientside.no_update;
+    }
+    return fetch(url).then(function(response) { return response.json(); });
+}
+"""
+
+# Redraws the three panels from the payload when the data or metric changes, and
+# summarizes the visible window on every zoom
+INTERACT = """
+function(data, metric, relayout, figure) {
+    var noUpdate = window.dash_clientside.no_update;
+    if (!data || !figure) {
+        return [noUpdate, noUpdate];
+    }
+    var cache = window.econColumns || (window.econColumns = {});
+    if (cache.version !== data.version) {
+        var t0 = Date.parse(data.start);
+        cache.version = data.version;
+        cache.dates = data.day.map(function(d) {
+            return new Date(t0 + d * 86400000).toISOString().slice(0, 10);
+        });
+        cache.drawn = null;
+    }
+    var dates = cache.dates;
+
+    // Visible window from the last relayout event, the whole history when reset
+    var start = dates[0], end = dates[dates.length - 1];
+    var axes = ['xaxis', 'xaxis2', 'xaxis3'];
+    for (var a = 0; relayout && a < axes.length; a++) {
+        var range = relayout[axes[a] + '.range'];
+        if (relayout[axes[a] + '.range[0]'] !== undefined) {
+            range = [relayout[axes[a] + '.range[0]'], relayout[axes[a] + '.range[1]']];
+        }
+        if (range) {
+            start = String(range[0]).slice(0, 10);
+            end = String(range[1]).slice(0, 10);
+            break;
+        }
+    }
+    var lo = 0, hi = dates.length;
+    while (lo < dates.length && dates[lo] < start) { lo++; }
+    while (hi > lo && dates[hi - 1] > end) { hi--; }
+
+    var panels = ['confidence', 'sp500', metric];
+    var lines = panels.map(function(col) {
+        var y = data.columns[col], first = -1, last = -1;
+        for (var i = lo; i < hi; i++) { if (y[i] !== null) { first = i; break; } }
+        for (var j = hi - 1; j >= lo; j--) { if (y[j] !== null) { last = j; break; } }
+        if (first < 0) {
+            return col + ': no data in this range';
+        }
+        var change = y[last] - y[first];
+        var pct = y[first] ? (100 * change / Math.abs(y[first])).toFixed(1) + '%' : 'n/a';
+        return col + ': ' + y[last] + ' on ' + dates[last] + ', ' + (change >= 0 ? '+' : '') +
+            change.toFixed(2) + ' (' + pct + ') since ' + dates[first];
+    });
+
+    var key = data.version + '|' + metric;
+    var newFigure = noUpdate;
+    if (cache.drawn !== key) {
+        cache.drawn = key;
+        newFigure = Object.assign({}, figure, {data: figure.data.map(function(trace, i) {
+            return Object.assign({}, trace, {x: dates, y: data.columns[panels[i]], name: panels[i]});
+        })});
+    }
+    return [newFigure, lines.join('\\n')];
+}
+"""
+
+
+def columns_payload(frame):
+    """(JSON bytes, content hash) of the compact columnar payload of `frame`"""
+    dates = pd.to_datetime(frame['date']).to_numpy().astype('datetime64[D]')
+    start = dates[0] if len(dates) else np.datetime64('1970-01-01', 'D')
+    payload = {
+        'start': str(start),
+        'day': (dates - start).astype(np.int64).tolist(),
+        'columns': {col: [None if np.isnan(v) else v
+                          for v in frame[col].to_numpy(dtype=np.float64).tolist()]
+                    for col in frame.columns[1:]},
+    }
+    digest = hashlib.sha1(json.dumps(payload, separators=(',', ':')).encode()).hexdigest()[:16]
+    payload['version'] = digest
+    return json.dumps(payload, separators=(',', ':')).encode(), digest
+
+
+def components(payload_url):
+    return [
+        dcc.Store(id='columns-url', data=payload_url),
+        dcc.Store(id='columns'),
+        html.Div(id='summary', style={'whiteSpace': 'pre-line', 'fontSize': '14px',
+                                      'marginLeft': '10%'}),
+    ]
+
+
+def validation_components():
+    return [dcc.Graph(id=GRAPH_ID), dcc.Dropdown(id=METRIC_ID), *components(None)]
+
+
+def register(app, payload):
+    """Add the payload route and the clientside callbacks to `app`; payload() returns the
+    current (JSON bytes, content hash)"""
+
+    def serve_columns():
+        body, digest = payload()
+        response = Response(body, mimetype='application/json')
+        if request.args.get('v') == digest:
+            # The URL names this exact content
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    app.server.add_url_rule(COLUMNS_ROUTE, 'econ_columns', serve_columns)
+    app.clientside_callback(LOAD_COLUMNS, Output('columns', 'data'), Input('columns-url', 'data'))
+    app.clientside_callback(INTERACT,
+                            Output(GRAPH_ID, 'figure'), Output('summary', 'children'),
+                            Input('columns', 'data'), Input(METRIC_ID, 'value'),
+                            Input(GRAPH_ID, 'relayoutData'), State(GRAPH_ID, 'figure'))
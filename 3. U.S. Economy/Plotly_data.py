@@ -0,0 +1,175 @@
+# Pooled, cached data access for the dashboard
+# A small psycopg2 connection pool serves all queries and the econ_metrics frame is held
+# in process. At most every `refresh_seconds` a cheap max(date)/count(*) probe tells
+# whether the table changed; only then are the rows newer than the cached watermark
+# (minus a short lookback, to pick up FRED revisions of recent days) fetched and merged.
+# The dashboard sees new rows without a restart and without full-table scans.
+
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pandas as pd
+from psycopg2.pool import ThreadedConnectionPool
+
+from App_config import load_secrets, metrics_table
+from App_snapshot import load_snapshot
+from Scrape_analytics import read_analytics
+
+# Days before the cached watermark that are re-read on change, matching the ingest job's
+# revision lookback for daily series
+REVISION_LOOKBACK_DAYS = 7
+
+
+class MetricsStore:
+
+    def __init__(self, pool=None, refresh_seconds=300, minconn=1, maxconn=4, table=None):
+        self._pool = pool
+        # econ_metrics, or the econ_metrics_wide view of the long-format store
+        self.table = table or metrics_table()
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.refresh_seconds = refresh_seconds
+        self.frame = None
+        self.watermark = None
+        self.row_count = None
+        # Incremented whenever the frame changes, so derived figures can be cached per version
+        self.version = 0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            secrets = load_secrets()
+            self._pool = ThreadedConnectionPool(self.minconn, self.maxconn,
+                                                dbname=secrets['DB_NAME'],
+                                                user=secrets['DB_USER'],
+                                                password=secrets['DB_PASSWORD'],
+                                                host=secrets['DB_HOST'],
+                                                port=secrets['DB_PORT'])
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.getconn()
+        try:
+            conn.autocommit = True
+            yield conn
+        except Exception:
+            # Drop connections that may be broken instead of returning them to the pool
+            self.pool.putconn(conn, close=True)
+            raise
+        else:
+            self.pool.putconn(conn)
+
+    def query(self, sql, params=None):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            columns = [c.name for c in cur.description]
+            return pd.DataFrame(cur.fetchall(), columns=columns)
+
+    def analytics(self):
+        """(rolling, cross) frames of the Confidence analytics, read from the database"""
+        with self.connection() as conn, conn.cursor() as cur:
+            return read_analytics(cur)
+
+    def get_frame(self):
+        """Cached econ_metrics frame, refreshed when the table changed since the last probe"""
+        if self.frame is None or time.monotonic() - self.checked_at > self.refresh_seconds:
+            # One thread refreshes while the others keep serving the cached frame
+            if self.lock.acquire(blocking=self.frame is None):
+                try:
+                    if self.frame is None or time.monotonic() - self.checked_at > self.refresh_seconds:
+                        self.refresh()
+                except Exception as e:
+                    # Only a cold start has nothing to serve instead
+                    if self.frame is None:
+                        raise
+                    self.checked_at = time.monotonic()
+                    print(f"Refresh failed, serving the cached frame: {e!r}")
+                finally:
+                    self.lock.release()
+        return self.frame
+
+    def reload(self):
+        """Refresh now, e.g. right after the daily update committed; requests keep getting
+        the current frame until the new one replaces it"""
+        with self.lock:
+            return self.refresh()
+
+    def refresh(self):
+        """Probe the table and merge new rows; returns True when the frame changed"""
+        self.checked_at = time.monotonic()
+        probe = self.query(f'SELECT max(date) AS watermark, count(*) AS row_count FROM {self.table}')
+        watermark, row_count = probe.iloc[0]['watermark'], int(probe.iloc[0]['row_count'])
+        if self.frame is not None and (watermark, row_count) == (self.watermark, self.row_count):
+            return False
+
+        if self.frame is None or self.watermark is None:
+            frame = self.query(f'SELECT * FROM {self.table} ORDER BY date;')
+        else:
+            since = self.watermark - timedelta(days=REVISION_LOOKBACK_DAYS)
+            new_rows = self.query(f'SELECT * FROM {self.table} WHERE date > %s ORDER BY date;',
+                                  (since,))
+            frame = pd.concat([self.frame[self.frame['date'] <= since], new_rows],
+                              ignore_index=True)
+            if len(frame) != row_count:
+                # Rows changed before the lookback window, reload everything once
+                frame = self.query(f'SELECT * FROM {self.table} ORDER BY date;')
+
+        self.frame = self.compact(frame)
+        self.watermark, self.row_count = watermark, row_count
+        self.version += 1
+        print(f"{self.table} refreshed: {len(self.frame)} rows up to {watermark}")
+        return True
+
+    @staticmethod
+    def compact(frame):
+        # numeric columns arrive as Decimal objects, float64 is smaller and faster to plot
+        frame = frame.copy()
+        for col in frame.columns:
+            if col != 'date':
+                frame[col] = pd.to_numeric(frame[col], errors='coerce').astype('float64')
+        return frame.reset_index(drop=True)
+
+
+class SnapshotMetricsStore(MetricsStore):
+    """MetricsStore fed by the snapshots the daily update publishes: the newest version is
+    loaded at startup and every probe is a read of the small LATEST manifest, so the
+    database is only queried while no snapshot has been published yet"""
+
+    def __init__(self, snapshots, refresh_seconds=300, **kwargs):
+        super().__init__(refresh_seconds=refresh_seconds, **kwargs)
+        self.snapshots = snapshots
+        self.snapshot_version = None
+        # Pre-rendered figure and analytics of the current snapshot, None while serving
+        # from the database or when the snapshot has none
+        self.figure = None
+        self.analytics_frames = None
+
+    def refresh(self):
+        self.checked_at = time.monotonic()
+        try:
+            snapshot = load_snapshot(self.snapshots, current=self.snapshot_version)
+        except Exception as e:
+            print(f"Could not read snapshot: {e!r}")
+            snapshot = None
+        if snapshot is None:
+            if self.snapshot_version is None:
+                return super().refresh()
+            return False
+
+        self.frame = self.compact(snapshot.frame)
+        self.figure = snapshot.figure
+        self.analytics_frames = snapshot.analytics
+        self.snapshot_version = snapshot.version
+        self.watermark, self.row_count = snapshot.manifest['watermark'], snapshot.manifest['rows']
+        self.version += 1
+        print(f"Loaded snapshot {snapshot.version}: {len(self.frame)} rows")
+        return True
+
+    def analytics(self):
+        """The current snapshot's analytics; the database is never queried for them"""
+        return self.analytics_frames
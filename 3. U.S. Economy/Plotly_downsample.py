@@ -0,0 +1,88 @@
+# Downsampling of the dashboard's time series to a fixed point budget
+# Every trace is reduced to at most `budget` points before it is sent to the browser, so
+# the figure size stays bounded however long the history grows. Two methods:
+#   - lttb: Largest-Triangle-Three-Buckets, keeps the points that best preserve the shape
+#   - minmax: the lowest and highest point of each bucket, keeps every spike, fully vectorized
+# When the user zooms in, the visible window is resampled from the full resolution data
+# with the same budget, and the overview is kept outside the window for the range slider.
+
+import os
+
+import numpy as np
+
+DEFAULT_BUDGET = int(os.environ.get('DASH_POINT_BUDGET', 2000))
+DEFAULT_METHOD = os.environ.get('DASH_DOWNSAMPLE', 'lttb')
+
+
+def lttb(x, y, budget):
+    """Indices of at most `budget` points of (x, y) chosen by Largest-Triangle-Three-Buckets;
+    x must be increasing and numeric"""
+    n = len(x)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+
+    # First and last point are always kept, the rest is split into budget - 2 buckets
+    edges = np.linspace(1, n - 1, budget - 1).astype(np.int64)
+    idx = np.empty(budget, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(budget - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        # Twice the area of the triangle between the last kept point, each candidate and
+        # the average of the next bucket
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def minmax(x, y, budget):
+    """Indices of the minimum and maximum of each of budget // 2 buckets, in order"""
+    n = len(x)
+    if budget >= n or budget < 4:
+        return np.arange(n)
+
+    n_buckets = budget // 2
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    # Pad the buckets to equal width with NaN so argmin/argmax run on one 2-D block
+    width = int(np.diff(edges).max())
+    positions = edges[:-1, None] + np.arange(width)
+    valid = positions < edges[1:, None]
+    block = np.where(valid, y[np.minimum(positions, n - 1)], np.nan)
+    lows = edges[:-1] + np.nanargmin(block, axis=1)
+    highs = edges[:-1] + np.nanargmax(block, axis=1)
+    return np.unique(np.concatenate([lows, highs]))
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(x, y, budget=DEFAULT_BUDGET, method=DEFAULT_METHOD):
+    """(x, y) reduced to at most `budget` points; x is a datetime64 array, NaNs are dropped"""
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    if method == 'off' or len(x) <= budget:
+        return x, y
+    idx = METHODS[method](x.astype('datetime64[ns]').astype(np.int64).astype(np.float64), y, budget)
+    return x[idx], y[idx]
+
+
+def overview_points(x, y, budget=DEFAULT_BUDGET, method=DEFAULT_METHOD):
+    """Downsampled (x, y) of a whole series with x as YYYY-MM-DD strings, the most compact
+    form of a date axis in figure JSON"""
+    x, y = downsample(x, y, budget, method)
+    return np.datetime_as_string(x, unit='D'), y
+
+
+def window_points(x, y, overview, start, end, budget=DEFAULT_BUDGET, method=DEFAULT_METHOD):
+    """Points for a view zoomed into [start, end]: the window resampled at up to `budget`
+    points from the full data, and the overview points outside it"""
+    inside = (x >= start) & (x <= end)
+    wx, wy = downsample(x[inside], y[inside], budget, method)
+    ox, oy = overview
+    before, after = ox < start, ox > end
+    return (np.concatenate([ox[before], wx, ox[after]]),
+            np.concatenate([oy[before], wy, oy[after]]))
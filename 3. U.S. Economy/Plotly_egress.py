@@ -0,0 +1,194 @@
+# In-process egress metering for the dashboard
+# Lambda_data_egress_checker.py only learns about egress from Cost Explorer hours later and
+# then stops the whole service. This meter counts the bytes of every response as it is
+# sent, per route and per client, in 5 minute buckets over a rolling 24 hour window. The
+# buckets are persisted to a local JSON file so a restart does not reset the count, and
+# are published at /metrics.
+# From today's bytes and the rate of the last hour it projects the UTC day's egress (the
+# day Cost Explorer bills by) and steps the dashboard down as the projection nears the
+# budget, before the checker has to take it offline:
+#   coarse        fewer points per trace
+#   no_flowchart  the architecture image is left out of the page
+#   snapshot      the cached page only: no data refreshes, zoom or metric callbacks
+#   stopped       503 for everything but /metrics*, once today's bytes reach the budget
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import Response, jsonify, request
+
+NORMAL, COARSE, NO_FLOWCHART, SNAPSHOT, STOPPED = range(5)
+LEVEL_NAMES = ['normal', 'coarse', 'no_flowchart', 'snapshot', 'stopped']
+
+# Share of the budget the projected daily egress must reach for COARSE, NO_FLOWCHART and
+# SNAPSHOT; STOPPED is reached by the bytes actually sent today
+DEFAULT_THRESHOLDS = (0.6, 0.75, 0.9)
+
+# Distinct clients counted per bucket, the rest are added up under 'other'
+MAX_CLIENTS = 1000
+
+
+def route_of(req):
+    # The URL rule a request matched, so every bundle, asset or page path of one rule is
+    # counted together, and requests no rule matched (scanners, 404s) under 'other'; the
+    # routes stay a fixed, small set whatever paths are requested
+    rule = req.url_rule
+    return rule.rule if rule is not None else 'other'
+
+
+def client_of(req):
+    # Behind Cloudflare and the load balancer the visitor is in the forwarding headers
+    forwarded = req.headers.get('CF-Connecting-IP') or req.headers.get('X-Forwarded-For', '')
+    return forwarded.split(',')[0].strip() or req.remote_addr or 'unknown'
+
+
+class EgressMeter:
+
+    def __init__(self, budget_bytes, path=None, window=86400, bucket_seconds=300,
+                 save_every=60, thresholds=DEFAULT_THRESHOLDS, clock=time.time):
+        self.budget_bytes = budget_bytes
+        self.path = path
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.save_every = save_every
+        self.thresholds = thresholds
+        self.clock = clock
+        # {bucket start: {'routes': Counter, 'clients': Counter}}
+        self.buckets = {}
+        self.started = clock()
+        self.saved_at = self.started
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        # (time, level) of the last level() call, levels are recomputed once per second
+        self._level = (None, NORMAL)
+        if path and os.path.exists(path):
+            self.load()
+
+    def install(self, server):
+        """Meter `server`'s responses and add /metrics; install before other after_request
+        hooks, such as compression, so the bytes counted are the bytes sent"""
+        server.before_request(self.guard)
+        server.after_request(self.record)
+        server.add_url_rule('/metrics', 'egress_metrics', self.metrics_view)
+        if self.path:
+            atexit.register(self.save)
+
+    def record(self, response):
+        nbytes = response.calculate_content_length()
+        if nbytes is None:
+            nbytes = int(response.headers.get('Content-Length', 0))
+        # Status line and headers are sent too
+        nbytes += sum(len(k) + len(v) + 4 for k, v in response.headers.items()) + 17
+        self.add(route_of(request), client_of(request), nbytes)
+        return response
+
+    def add(self, route, client, nbytes):
+        now = self.clock()
+        start = int(now // self.bucket_seconds) * self.bucket_seconds
+        with self.lock:
+            bucket = self.buckets.setdefault(start, {'routes': Counter(), 'clients': Counter()})
+            bucket['routes'][route] += nbytes
+            if client not in bucket['clients'] and len(bucket['clients']) >= MAX_CLIENTS:
+                client = 'other'
+            bucket['clients'][client] += nbytes
+            self.expire(now)
+            # One request thread takes care of each periodic save
+            due = self.path and now - self.saved_at >= self.save_every
+            if due:
+                self.saved_at = now
+        if due:
+            self.save()
+
+    def expire(self, now):
+        for start in [s for s in self.buckets if s <= now - self.window]:
+            del self.buckets[start]
+
+    def bytes_since(self, since):
+        with self.lock:
+            return sum(sum(b['routes'].values()) for s, b in self.buckets.items()
+                       if s + self.bucket_seconds > since)
+
+    def projection(self):
+        """(bytes sent today, projected bytes for the whole UTC day)"""
+        now = self.clock()
+        day_start = now - now % 86400
+        today = self.bytes_since(day_start)
+        # Rate of the last hour, or of the time observed so far if shorter
+        with self.lock:
+            observed = now - min(min(self.buckets, default=now), self.started)
+        span = min(3600, max(observed, self.bucket_seconds))
+        rate = self.bytes_since(now - span) / span
+        return today, today + rate * (day_start + 86400 - now)
+
+    def level(self):
+        now = self.clock()
+        checked, level = self._level
+        if checked is not None and 0 <= now - checked < 1:
+            return level
+        level = self.compute_level()
+        self._level = (now, level)
+        return level
+
+    def compute_level(self):
+        today, projected = self.projection()
+        if today >= self.budget_bytes:
+            return STOPPED
+        level = NORMAL
+        for step, share in enumerate(self.thresholds, start=COARSE):
+            if projected >= share * self.budget_bytes:
+                level = step
+        return level
+
+    def guard(self):
+        if request.path.startswith('/metrics') or self.level() < STOPPED:
+            return None
+        now = self.clock()
+        retry = int(86400 - now % 86400)
+        return Response('The dashboard has reached its daily data budget, please come back tomorrow.\n',
+                        status=503, mimetype='text/plain', headers={'Retry-After': str(retry)})
+
+    def summary(self, top=20):
+        today, projected = self.projection()
+        routes, clients = Counter(), Counter()
+        with self.lock:
+            for bucket in self.buckets.values():
+                routes.update(bucket['routes'])
+                clients.update(bucket['clients'])
+        return {
+            'level': LEVEL_NAMES[self.compute_level()],
+            'budget_bytes': self.budget_bytes,
+            'today_bytes': today,
+            'projected_bytes': round(projected),
+            'window_seconds': self.window,
+            'window_bytes': sum(routes.values()),
+            'routes': dict(routes.most_common()),
+            'clients': dict(clients.most_common(top)),
+        }
+
+    def metrics_view(self):
+        return jsonify(self.summary())
+
+    def save(self):
+        with self.lock:
+            data = {str(s): {'routes': dict(b['routes']), 'clients': dict(b['clients'])}
+                    for s, b in self.buckets.items()}
+        with self.save_lock:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except ValueError:
+            print(f'Ignoring unreadable egress file {self.path}')
+            return
+        self.buckets = {int(s): {'routes': Counter(b['routes']), 'clients': Counter(b['clients'])}
+                        for s, b in data.items()}
+        self.expire(self.clock())
@@ -0,0 +1,127 @@
+# Figure construction for the dashboard
+# Visualization with charts for Confidence and FRED economic metrics
+# Features include FRED economic metrics dropdown bar, time range button selector and date slider at bottom
+
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+def build_figure(df_final, metric_menu=True, metric='dow', points=None):
+    """Three-panel figure of econ_metrics rows: Confidence, SP500 and a panel showing
+    `metric`. With metric_menu the figure embeds a dropdown carrying every column's full
+    history; without it the third panel is switched by a Dash callback instead.
+    `points(col)` returns the (x, y) plotted for a column, e.g. downsampled; by default
+    every row is plotted."""
+
+    if points is None:
+        points = lambda col: (df_final['date'], df_final[col])
+
+    fig = make_subplots(rows = 3,
+        cols = 1,
+        subplot_titles = ('Confidence', 'SP500', 'Other Economic Metrics'),
+        shared_xaxes = True)
+
+    fig.append_trace(go.Scatter(
+        x = points('confidence')[0],
+        y = points('confidence')[1],
+        name = 'confidence'), row = 1, col = 1)
+
+    fig.add_trace(go.Scatter(
+        x = points('sp500')[0],
+        y = points('sp500')[1],
+        name = 'sp500'), row = 2, col = 1)
+
+    fig.append_trace(go.Scatter(
+        x = points(metric)[0],
+        y = points(metric)[1],
+        name = metric), row = 3, col = 1)
+
+    fig.update_layout(height = 700,
+                      width = 1100) # title_text = "Consumer Confidence and the U.S. Economy")
+
+    # Add date range selector buttons - starter code from Plotly documentation
+    fig.update_layout(
+        xaxis = dict(
+            rangeselector = dict(
+                buttons = list([
+                    dict(count = 1,
+                        label = "1m",
+                        step = "month",
+                        stepmode = "backward"),
+                    dict(count = 6,
+                        label = "6m",
+                        step = "month",
+                        stepmode = "backward"),
+                    dict(count = 1,
+                        label = "YTD",
+                        step = "year",
+                        stepmode = "todate"),
+                    dict(count = 1,
+                        label = "1y",
+                        step = "year",
+                        stepmode = "backward"),
+                    dict(step = "all")
+                ]), x = 1.05 #, y = 1.5
+            ),
+            type = "date"
+        )
+    )
+
+    # fig.update_xaxes(matches = 'x')
+    fig.update_layout(xaxis_showticklabels = True,
+        xaxis2_showticklabels = True,
+        xaxis3_showticklabels = True)
+
+    if metric_menu:
+        updatemenu = []
+        buttons = []
+
+        # button with one option for each dataframe column excluding first df column
+        for col in df_final.columns[1: ]:
+            buttons.append(dict(method = 'restyle',
+                label = col,
+                visible = True,
+                args = [{
+                        'y': [points(col)[1]],
+                        'x': [points(col)[0]],
+                        'type': 'scatter'
+                    },
+                    [2]
+                ],
+            ))
+
+        # some adjustments to the updatemenus
+        updatemenu = []
+        your_menu = dict()
+        updatemenu.append(your_menu)
+
+        updatemenu[0]['buttons'] = buttons
+        updatemenu[0]['direction'] = 'down'
+        updatemenu[0]['showactive'] = True # Position dropdown: https: //stackoverflow.com/questions/50330544/positioning-a-dropdown-in-plotly
+        updatemenu[0]['x'] = 1.25
+        updatemenu[0]['y'] = 0.22
+
+        # add dropdown menus to the figure
+        fig.update_layout(showlegend = False, updatemenus = updatemenu)
+    else:
+        fig.update_layout(showlegend = False)
+
+    # Add date range selector slider
+    fig.update_layout(xaxis3 = dict(rangeslider = dict(visible = True), type = 'date'))
+
+    # Keep the user's zoom when callbacks replace trace data
+    fig.update_layout(uirevision = 'econ_metrics')
+
+    fig.update_layout(
+        height = 700,
+        width = 1100,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="center",
+            x=0.5
+        )
+    )
+
+    return fig
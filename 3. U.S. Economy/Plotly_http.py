@@ -0,0 +1,132 @@
+# HTTP response layer for the dashboard's Flask server
+# Waitress serves app.server as is, so every visit used to download the layout JSON, the
+# Dash JS bundles and the flowchart uncompressed. This layer adds:
+#   - gzip, or brotli when the brotli package is installed and the browser accepts it,
+#     for JSON, JS, CSS and HTML responses
+#   - strong ETags and conditional GETs answered with 304 Not Modified
+#   - Cache-Control: a year and immutable for fingerprinted Dash bundles, a day for
+#     /assets, and no-cache (always revalidate) for the data payloads
+#   - the layout and dependency JSON compressed once per data version and served from
+#     memory until the data changes, instead of being rebuilt and compressed per request
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, g, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('application/json', 'application/javascript', 'text/javascript', 'text/css',
+                'text/html', 'text/plain', 'image/svg+xml')
+
+# Responses smaller than this are not worth compressing
+MIN_SIZE = 1024
+
+ASSETS_MAX_AGE = 86400
+BUNDLE_MAX_AGE = 31536000
+
+
+def compress(body, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level + 3, 11))
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def strong_etag(body):
+    return hashlib.sha1(body).hexdigest()
+
+
+class HttpLayer:
+
+    def __init__(self, server, version=None, versioned_paths=('/_dash-layout', '/_dash-dependencies'),
+                 max_entries=64, level=6):
+        # version() returns a hashable data version; responses for versioned_paths are
+        # kept until it changes
+        self.version = version
+        self.versioned_paths = versioned_paths
+        self.max_entries = max_entries
+        self.level = level
+        self.cache = OrderedDict()
+        # Waitress serves requests from several threads; the lock keeps a lookup from
+        # seeing a key that another thread evicts before move_to_end
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.compressed = 0
+        server.before_request(self.serve_cached)
+        server.after_request(self.finish)
+
+    def encoding(self):
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def cache_key(self):
+        if request.method != 'GET':
+            return None
+        if request.path in self.versioned_paths and self.version is not None:
+            # The query string is part of the key, it can name a content version
+            return (request.full_path, self.version(), self.encoding())
+        if request.path.startswith('/_dash-component-suites/'):
+            # Bundles never change while the process runs
+            return (request.full_path, None, self.encoding())
+        return None
+
+    def serve_cached(self):
+        key = self.cache_key()
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is None:
+                return None
+            self.cache.move_to_end(key)
+            self.hits += 1
+        g.http_layer_cached = True
+        body, headers = cached
+        response = Response(body, headers=headers)
+        return response.make_conditional(request)
+
+    def finish(self, response):
+        if g.get('http_layer_cached'):
+            return response
+
+        if request.path.startswith('/assets/'):
+            response.cache_control.public = True
+            response.cache_control.max_age = ASSETS_MAX_AGE
+        elif request.path.startswith('/_dash-component-suites/'):
+            if response.cache_control.max_age:
+                # Fingerprinted URLs change with every package version
+                response.cache_control.public = True
+                response.cache_control.max_age = BUNDLE_MAX_AGE
+                response.cache_control.immutable = True
+        elif request.path in self.versioned_paths and not response.cache_control.max_age:
+            response.cache_control.no_cache = True
+
+        if response.status_code != 200 or response.headers.get('Content-Encoding'):
+            return response
+
+        if response.mimetype in COMPRESSIBLE:
+            encoding = self.encoding()
+            response.vary.add('Accept-Encoding')
+            response.direct_passthrough = False
+            body = response.get_data()
+            if encoding and len(body) >= MIN_SIZE:
+                body = compress(body, encoding, self.level)
+                response.set_data(body)
+                response.headers['Content-Encoding'] = encoding
+                self.compressed += 1
+            response.set_etag(strong_etag(body))
+
+            key = self.cache_key()
+            if key is not None:
+                with self.lock:
+                    self.cache[key] = (body, list(response.headers.items()))
+                    while len(self.cache) > self.max_entries:
+                        self.cache.popitem(last=False)
+
+        return response.make_conditional(request)
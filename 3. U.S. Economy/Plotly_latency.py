@@ -0,0 +1,111 @@
+# Request latency histograms for the dashboard
+# Every response's time from the start of the request to the last after_request hook
+# (compression included) is counted per URL rule in fixed millisecond buckets. The cumulative
+# histograms are published at /metrics/latency. Once per flush interval the interval's
+# request count, p50, p95 and maximum per route are logged in CloudWatch Embedded Metric
+# Format (App_metrics.emit, off with ECON_PROFILE=0), so CloudWatch adds up the workers
+# of a prefork server, each of which only sees its own requests here.
+# Percentiles are read from the buckets and are the upper bound of the bucket they fall in.
+
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from App_metrics import emit
+from Plotly_egress import route_of
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+
+def new_histogram():
+    return {'counts': [0] * len(BUCKETS_MS), 'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0}
+
+
+def observe(histogram, ms):
+    for i, bound in enumerate(BUCKETS_MS):
+        if ms <= bound:
+            histogram['counts'][i] += 1
+            break
+    histogram['count'] += 1
+    histogram['sum_ms'] += ms
+    histogram['max_ms'] = max(histogram['max_ms'], ms)
+
+
+def percentile(histogram, q):
+    """Upper bound of the bucket holding the q-th percentile, the maximum for the last one"""
+    if not histogram['count']:
+        return None
+    rank = q / 100 * histogram['count']
+    seen = 0
+    for bound, n in zip(BUCKETS_MS, histogram['counts']):
+        seen += n
+        if seen >= rank:
+            return round(min(bound, histogram['max_ms']), 3)
+    return round(histogram['max_ms'], 3)
+
+
+class LatencyHistograms:
+
+    def __init__(self, flush_seconds=60, clock=time.monotonic):
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        # {route: histogram} since the start, and of the current flush interval
+        self.total = {}
+        self.interval = {}
+        self.flushed_at = clock()
+        self.lock = threading.Lock()
+
+    def install(self, server):
+        """Time `server`'s requests and add /metrics/latency; install before the other
+        hooks, so the time covers them all"""
+        server.before_request(self.start)
+        server.after_request(self.record)
+        server.add_url_rule('/metrics/latency', 'latency_metrics', self.metrics_view)
+
+    def start(self):
+        g.latency_started = time.perf_counter()
+
+    def record(self, response):
+        started = g.pop('latency_started', None)
+        if started is not None:
+            self.add(route_of(request), (time.perf_counter() - started) * 1000)
+        return response
+
+    def add(self, route, ms):
+        now = self.clock()
+        with self.lock:
+            observe(self.total.setdefault(route, new_histogram()), ms)
+            observe(self.interval.setdefault(route, new_histogram()), ms)
+            due = now - self.flushed_at >= self.flush_seconds
+            if due:
+                interval, self.interval = self.interval, {}
+                self.flushed_at = now
+        if due:
+            self.flush(interval)
+
+    def flush(self, interval):
+        for route, histogram in interval.items():
+            emit('request', {'Requests': histogram['count'],
+                             'LatencyP50': percentile(histogram, 50),
+                             'LatencyP95': percentile(histogram, 95),
+                             'LatencyMax': round(histogram['max_ms'], 3)},
+                 service='dashboard', route=route)
+
+    def summary(self):
+        with self.lock:
+            total = {route: dict(h, counts=list(h['counts'])) for route, h in self.total.items()}
+        # Bucket upper bounds and counts as lists, JSON objects would lose their order
+        bounds = [bound if bound != float('inf') else '+Inf' for bound in BUCKETS_MS]
+        return {route: {'le_ms': bounds,
+                        'counts': h['counts'],
+                        'count': h['count'],
+                        'mean_ms': round(h['sum_ms'] / h['count'], 3),
+                        'p50_ms': percentile(h, 50),
+                        'p95_ms': percentile(h, 95),
+                        'p99_ms': percentile(h, 99),
+                        'max_ms': round(h['max_ms'], 3)}
+                for route, h in sorted(total.items())}
+
+    def metrics_view(self):
+        return jsonify(self.summary())
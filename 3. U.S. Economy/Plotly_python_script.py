@@ -1,165 +1,176 @@
+import os
+import functools
+import numpy as np
 import pandas as pd
-import psycopg2 as ps # needed to establish connection with AWS RDS
-import boto3
 import dash
-from dash import Dash, html, dcc, callback, Output, Input, dash_table
+from dash import Dash, html, dcc, callback, ctx, Output, Input, State, Patch, dash_table
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly
-import plotly.graph_objects as go
-import plotly.subplots
-from plotly.subplots import make_subplots
-import plotly.express as px
 from waitress import serve
 # from jupyter_dash import JupyterDash # for local test env
 
-# Connect to S3 to download secrets and keys
-s3 = boto3.client('s3')
-bucket_name = 'econdaily-prod-app-config'
-file_name = 'env.source'
-local_filename = '/app/myfilefroms3'
-
-s3.download_file(bucket_name, file_name, local_filename)
-
-with open(local_filename, 'r') as f:
-    secrets = {line.strip().split('=')[0]: line.strip().split('=')[1] for line in f}
-# print('secrets are:', secrets) # for debugging
-
-def connect_to_db(dbname, user, password, host, port):
+from App_snapshot import snapshot_store
+import Plotly_clientside
+from Plotly_analytics import build_analytics_figure
+from Plotly_data import MetricsStore, SnapshotMetricsStore
+from Plotly_downsample import DEFAULT_BUDGET, DEFAULT_METHOD, overview_points, window_points
+from Plotly_egress import COARSE, NO_FLOWCHART, SNAPSHOT, EgressMeter
+from Plotly_figure import build_figure
+from Plotly_http import HttpLayer
+from Plotly_latency import LatencyHistograms
+from Plotly_scheduler import scheduler_from_env
+from Plotly_shared_store import SharedMetricsStore, serve_prefork
+
+# Secrets and keys come from App_config, the same loader as the daily update container.
+# When ECON_SNAPSHOT_URI is set the data and the default figure come from the snapshots
+# the daily update publishes, otherwise econ_metrics is read through a pooled, cached
+# store. Either way new data is picked up without restarting the service, checking at
+# most every DASH_REFRESH_SECONDS.
+refresh_seconds = int(os.environ.get('DASH_REFRESH_SECONDS', 300))
+snapshots = snapshot_store()
+if snapshots is not None:
+    store = SnapshotMetricsStore(snapshots, refresh_seconds=refresh_seconds)
+else:
+    store = MetricsStore(refresh_seconds=refresh_seconds)
+
+# Response bytes are metered per route and client, and the dashboard steps down as the
+# projected daily egress nears DASH_EGRESS_BUDGET_MB, ahead of Lambda_data_egress_checker.py
+meter = EgressMeter(budget_bytes=int(float(os.environ.get('DASH_EGRESS_BUDGET_MB', 950)) * 2**20),
+                    path=os.environ.get('DASH_EGRESS_FILE', '/app/egress.json'))
+
+def current_frame():
+    # In snapshot mode the cached frame is served as is, without probing the database
+    if meter.level() >= SNAPSHOT and store.frame is not None:
+        return store.frame
+    return store.get_frame()
+
+def point_budget():
+    return DEFAULT_BUDGET // 4 if meter.level() >= COARSE else DEFAULT_BUDGET
+
+# 'callback' ships one metric with the page and loads the others on demand through the
+# metric dropdown; 'embedded' is the original figure, whose own dropdown carries the full
+# history of every column in each page load; 'clientside' loads every column once per
+# data version and runs metric switching, zooming and the summary readouts in the browser
+METRIC_MODE = os.environ.get('DASH_METRIC_MODE', 'callback')
+DEFAULT_METRIC = 'dow'
+
+# Every trace is downsampled to DASH_POINT_BUDGET points over the full history, and the
+# visible window is resampled from full resolution data when the user zooms in. Results
+# are cached per (data version, metric, window, budget).
+@functools.lru_cache(maxsize=2)
+def _dates(version):
+    return pd.to_datetime(store.frame['date']).to_numpy().astype('datetime64[D]')
+
+@functools.lru_cache(maxsize=512)
+def _points(version, metric, start, end, budget, method):
+    x, y = _dates(version), store.frame[metric].to_numpy(dtype=np.float64)
+    if start is None:
+        return overview_points(x, y, budget, method)
+    overview = _points(version, metric, None, None, budget, method)
+    overview = (overview[0].astype('datetime64[D]'), np.asarray(overview[1]))
+    x, y = window_points(x, y, overview, np.datetime64(start), np.datetime64(end),
+                         budget, method)
+    return np.datetime_as_string(x, unit='D'), y
+
+def metric_points(metric, window=None):
+    current_frame()
+    start, end = window or (None, None)
+    return _points(store.version, metric, start, end, point_budget(), DEFAULT_METHOD)
+
+def zoom_window(relayout):
+    """[start, end] dates of the x range in a relayoutData event, None when the user
+    reset the zoom and False when the event did not change the x range"""
+    if not relayout:
+        return False
+    if any(key.startswith('xaxis') and key.endswith('autorange') for key in relayout):
+        return None
+    for axis in ('xaxis', 'xaxis2', 'xaxis3'):
+        if f'{axis}.range[0]' in relayout:
+            start, end = relayout[f'{axis}.range[0]'], relayout[f'{axis}.range[1]']
+        elif f'{axis}.range' in relayout:
+            start, end = relayout[f'{axis}.range']
+        else:
+            continue
+        # Whole days, so nearby zooms share cache entries
+        start = pd.Timestamp(start).floor('D')
+        end = pd.Timestamp(end).ceil('D')
+        return [start.date().isoformat(), end.date().isoformat()]
+    return False
+
+# The figure is rebuilt only when the store's data version or the point budget changes
+_figure_cache = {}
+
+def current_figure():
+    df_final = current_frame()
+    key = (store.version, METRIC_MODE, point_budget())
+    if key not in _figure_cache:
+        _figure_cache.clear()
+        figure = getattr(store, 'figure', None)
+        if (figure is not None and METRIC_MODE != 'embedded' and point_budget() == DEFAULT_BUDGET
+                and figure['data'][2]['name'] == DEFAULT_METRIC):
+            # The snapshot's pre-rendered figure is this exact view
+            _figure_cache[key] = figure
+            return figure
+        _figure_cache[key] = build_figure(df_final, metric_menu=METRIC_MODE == 'embedded',
+                                          metric=DEFAULT_METRIC, points=metric_points)
+    return _figure_cache[key]
+
+# Confidence analytics materialized by the daily update (Scrape_analytics.py), drawn once
+# per data version from wherever the store reads its data, so snapshot and prefork workers
+# never query the database for them; DASH_ANALYTICS=off leaves the panel out
+ANALYTICS = os.environ.get('DASH_ANALYTICS', 'on') != 'off'
+
+@functools.lru_cache(maxsize=1)
+def _analytics_figure(version, budget):
     try:
-        conn = ps.connect(
-            dbname=dbname,
-            user=user,
-            password=password,
-            host=host,
-            port=port
-        )
-    except ps.OperationalError as e:
-        raise e
-    else:
-        print('Connected!')
-        return conn
-    
-dbname  = secrets['DB_NAME']
-user    = secrets['DB_USER']
-password= secrets['DB_PASSWORD']
-host    = secrets['DB_HOST']
-port    = secrets['DB_PORT']
-
-conn = connect_to_db(dbname, user, password, host, port)
-conn.set_isolation_level(ps.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-cur = conn.cursor()
-
-query = "SELECT * FROM econ_metrics;"
-df_final = pd.read_sql_query(query, conn)
-
-cur.close()
-conn.close()
-# print(df_final) #for debugging
-
-# Visualization with charts for Confidence and FRED economic metrics
-# Features include FRED economic metrics dropdown bar, time range button selector and date slider at bottom
-
-fig = make_subplots(rows = 3,
-    cols = 1,
-    subplot_titles = ('Confidence', 'SP500', 'Other Economic Metrics'),
-    shared_xaxes = True)
-
-fig.append_trace(go.Scatter(
-    x = df_final['date'],
-    y = df_final['confidence'],
-    name = 'confidence'), row = 1, col = 1)
-
-fig.add_trace(go.Scatter(
-    x = df_final['date'],
-    y = df_final['sp500'],
-    name = 'sp500'), row = 2, col = 1)
-
-fig.append_trace(go.Scatter(
-    x = df_final['date'],
-    y = df_final['dow'],
-    name = 'dow'), row = 3, col = 1)
-
-fig.update_layout(height = 700,
-                  width = 1100) # title_text = "Consumer Confidence and the U.S. Economy")
-
-# Add date range selector buttons - starter code from Plotly documentation
-fig.update_layout(
-    xaxis = dict(
-        rangeselector = dict(
-            buttons = list([
-                dict(count = 1,
-                    label = "1m",
-                    step = "month",
-                    stepmode = "backward"),
-                dict(count = 6,
-                    label = "6m",
-                    step = "month",
-                    stepmode = "backward"),
-                dict(count = 1,
-                    label = "YTD",
-                    step = "year",
-                    stepmode = "todate"),
-                dict(count = 1,
-                    label = "1y",
-                    step = "year",
-                    stepmode = "backward"),
-                dict(step = "all")
-            ]), x = 1.05 #, y = 1.5
-        ),
-        type = "date"
-    )
-)
-
-# fig.update_xaxes(matches = 'x')
-fig.update_layout(xaxis_showticklabels = True,
-    xaxis2_showticklabels = True,
-    xaxis3_showticklabels = True)
-
-updatemenu = []
-buttons = []
-
-# button with one option for each dataframe column excluding first df column
-for col in df_final.columns[1: ]:
-    buttons.append(dict(method = 'restyle',
-        label = col,
-        visible = True,
-        args = [{
-                'y': [df_final[col]],
-                'x': [df_final['date']],
-                'type': 'scatter'
-            },
-            [2]
-        ],
-    ))
-
-# some adjustments to the updatemenus
-updatemenu = []
-your_menu = dict()
-updatemenu.append(your_menu)
-
-updatemenu[0]['buttons'] = buttons
-updatemenu[0]['direction'] = 'down'
-updatemenu[0]['showactive'] = True # Position dropdown: https: //stackoverflow.com/questions/50330544/positioning-a-dropdown-in-plotly
-updatemenu[0]['x'] = 1.25
-updatemenu[0]['y'] = 0.22
-
-# add dropdown menus to the figure
-fig.update_layout(showlegend = False, updatemenus = updatemenu)
-
-# Add date range selector slider
-fig.update_layout(xaxis3 = dict(rangeslider = dict(visible = True), type = 'date'))
-
-fig.update_layout(
-    height = 700,
-    width = 1100,
-    legend=dict(
-        orientation="h",
-        yanchor="bottom",
-        y=1.02,
-        xanchor="center",
-        x=0.5
-    )
-)
+        analytics = store.analytics()
+        return build_analytics_figure(*analytics, budget=budget) if analytics else None
+    except Exception as e:
+        print(f"Analytics not available: {e!r}")
+        return None
+
+def analytics_figure():
+    current_frame()
+    return _analytics_figure(store.version, point_budget())
+
+# Open pages poll every DASH_LIVE_SECONDS (0 turns polling off) for rows newer than the
+# last date they have, and the figure grows in place by those points only
+LIVE_SECONDS = int(os.environ.get('DASH_LIVE_SECONDS', 600))
+
+def latest_date():
+    dates = _dates(store.version)
+    return np.datetime_as_string(dates.max(), unit='D') if len(dates) else None
+
+def metric_dropdown():
+    columns = current_frame().columns[1:]
+    return dcc.Dropdown(id=Plotly_clientside.METRIC_ID if METRIC_MODE == 'clientside' else 'metric',
+                        options=[{'label': col, 'value': col} for col in columns],
+                        value=DEFAULT_METRIC, clearable=False,
+                        style={'width': '220px', 'display': 'inline-block'})
+
+# Compact columnar payload of the clientside mode, built once per data version
+@functools.lru_cache(maxsize=2)
+def _columns_payload(version):
+    return Plotly_clientside.columns_payload(store.frame)
+
+def columns_payload():
+    current_frame()
+    return _columns_payload(store.version)
+
+# Components under the figure: the live update state, or the payload URL and summary
+# readouts of the clientside mode, named by the payload's content hash
+def interaction_components():
+    if METRIC_MODE == 'clientside':
+        _, digest = columns_payload()
+        return Plotly_clientside.components(f'{Plotly_clientside.COLUMNS_ROUTE}?v={digest}')
+    return [
+        dcc.Store(id = 'window'),
+        # Date of the newest point this page has, for the live updates
+        dcc.Store(id = 'last-date', data = latest_date()),
+        dcc.Interval(id = 'live', interval = max(LIVE_SECONDS, 1) * 1000,
+                     disabled = LIVE_SECONDS <= 0)
+    ]
 
 legend_data = pd.DataFrame({
     'Metric': ['Confidence', 'SP500', 'dow', 'nasdaq', 'inflation_5yr', 'oil',
@@ -186,167 +197,279 @@ legend_table = html.Table([
 
 app = Dash(__name__, external_stylesheets = [dbc.themes.BOOTSTRAP])
 
+# The layout and dependency JSON only change with the data, the metric mode and the
+# degradation level
+def data_version():
+    current_frame()
+    return (store.version, METRIC_MODE, meter.level())
+
+# Request latency per route at /metrics/latency; installed first, so its time covers the
+# metering, the egress guard and compression
+latency = LatencyHistograms()
+latency.install(app.server)
+
+# Metering goes next, so its after_request hook runs after compression and counts
+# compressed bytes
+meter.install(app.server)
+
+# Compression, ETags and cache headers; DASH_HTTP_LAYER=off serves responses as Dash makes them
+if os.environ.get('DASH_HTTP_LAYER', 'on') != 'off':
+    http_layer = HttpLayer(app.server, version=data_version,
+                           versioned_paths=('/_dash-layout', '/_dash-dependencies',
+                                            Plotly_clientside.COLUMNS_ROUTE))
+
 image_path = '/assets/Flowchart.jpg'
 
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-                html.H1("Consumer Confidence and the U.S. Economy"), 
-                html.H3("By: Mushfiqur Rahman")
-        ],
-            width = 'auto',
-            style = {
-                'padding': '7px',
-                'backgroundColor': '#f0e442',
-                'align': 'center',
-                'width': '100%',
-                "justify": "center",
-                'textAlign': 'center'
-            })
-    ]),
-
-    dbc.Row([
-        dbc.Col([
-            dcc.Graph(id = 'plot', figure = fig,
-                style = {
-                    "width": "80.8%",
-                    #"height": "800px",
-                    "display": "inline-block",
-                    #"border": "2px #3c1c1c solid",
-                    #"padding-top": "0px",
-                    #"padding-left": "10px",
-                    #"overflow": "hidden",
-                    #"top": "200%",
-                    #"left": "20%",
-                    "align": "center",
-                    "justify": "center",
-                    'horizontal-align': 'center',
-                    #"margin-top": "-400px"
-                })
-            ], width='auto')
-            ]),
-
-    dbc.Row([
-        dbc.Col([
-            legend_table
-            ], width='80.8%', align='center', 
-            style={
-            # 'display': 'flex', 'justifyContent': 'center', 
-            # 'align':'center', 'justify':'center', 'horizontal-align':'center'
-            'marginLeft': '25%'
-            },
-            )
-    ]),
-
-    dbc.Row([
-        dbc.Col([
-                html.H3("")
-                ],
+# Layout is a function so every page load gets the latest cached figure
+def serve_layout():
+    level = meter.level()
+    analytics = analytics_figure() if ANALYTICS and level < NO_FLOWCHART else None
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                    html.H1("Consumer Confidence and the U.S. Economy"), 
+                    html.H3("By: Mushfiqur Rahman")
+            ],
                 width = 'auto',
                 style = {
                     'padding': '7px',
+                    'backgroundColor': '#f0e442',
                     'align': 'center',
-                    'width': '90%',
-                    'justify': 'center',
+                    'width': '100%',
+                    "justify": "center",
                     'textAlign': 'center'
-                    })
-            ]),
-
-    dbc.Row([
-        dbc.Col([
-            dcc.Markdown('''  
+                })
+        ]),
+
+        dbc.Row([
+            dbc.Col([
+                html.Label('Other Economic Metrics: ', style={'marginRight': '10px'}),
+                metric_dropdown()
+            ], width='auto', style={'marginLeft': '10%'})
+        ], style={'display': 'none'} if METRIC_MODE == 'embedded' else {}),
+
+        dbc.Row([
+            dbc.Col([
+                dcc.Graph(id = Plotly_clientside.GRAPH_ID if METRIC_MODE == 'clientside' else 'plot',
+                    figure = current_figure(),
+                    style = {
+                        "width": "80.8%",
+                        #"height": "800px",
+                        "display": "inline-block",
+                        #"border": "2px #3c1c1c solid",
+                        #"padding-top": "0px",
+                        #"padding-left": "10px",
+                        #"overflow": "hidden",
+                        #"top": "200%",
+                        #"left": "20%",
+                        "align": "center",
+                        "justify": "center",
+                        'horizontal-align': 'center',
+                        #"margin-top": "-400px"
+                    }),
+                *interaction_components()
+                ], width='auto')
+                ]),
+
+        # Left out with the flowchart when egress runs high
+        dbc.Row([
+            dbc.Col([
+                dcc.Graph(id='analytics', figure=analytics,
+                          style={'width': '80.8%', 'display': 'inline-block'})
+            ], width='auto')
+        ]) if analytics is not None else html.Div(),
+
+        dbc.Row([
+            dbc.Col([
+                legend_table
+                ], width='80.8%', align='center', 
+                style={
+                # 'display': 'flex', 'justifyContent': 'center', 
+                # 'align':'center', 'justify':'center', 'horizontal-align':'center'
+                'marginLeft': '25%'
+                },
+                )
+        ]),
+
+        dbc.Row([
+            dbc.Col([
+                    html.H3("")
+                    ],
+                    width = 'auto',
+                    style = {
+                        'padding': '7px',
+                        'align': 'center',
+                        'width': '90%',
+                        'justify': 'center',
+                        'textAlign': 'center'
+                        })
+                ]),
+
+        dbc.Row([
+            dbc.Col([
+                dcc.Markdown('''  
                          
-                **Overview:**  
-                The project's goal is to visually compare consumer confidence of the US economy
-                with respect to important economic metrics from the Federal Reserve's FRED API using Dash and Plotly.
-                Furthermore, the project showcases my knowledge of data, deployment and cloud tools.
+                    **Overview:**  
+                    The project's goal is to visually compare consumer confidence of the US economy
+                    with respect to important economic metrics from the Federal Reserve's FRED API using Dash and Plotly.
+                    Furthermore, the project showcases my knowledge of data, deployment and cloud tools.
                 
-                Initial questions to explore:  
-                What is the current consumer confidence of the economy?  
-                How has it varied over time?  
-                Is there a correlation between consumer confidence and economic metrics 
-                    like stock market performance?  
+                    Initial questions to explore:  
+                    What is the current consumer confidence of the economy?  
+                    How has it varied over time?  
+                    Is there a correlation between consumer confidence and economic metrics 
+                        like stock market performance?  
                 
-                Once enough data are collected, they will be fed into machine learning models
-                to best fit a predictive model and determine if any economic indicators have correlations with 
-                consumer confidence as the target variable.
+                    Once enough data are collected, they will be fed into machine learning models
+                    to best fit a predictive model and determine if any economic indicators have correlations with 
+                    consumer confidence as the target variable.
                                 
-                **Methodology:**  
-                1. Download economic data from U.S. Federal Reserve's FRED API and create a pandas dataframe.  
-                2. Run Dockerized python script daily to update a AWS RDS PostgreSQL database using AWS ECS automation.  
-                3. Visualize data with Plotly Dash and deploy as a website using AWS ECR, ECS, EC2 & Lambda.
+                    **Methodology:**  
+                    1. Download economic data from U.S. Federal Reserve's FRED API and create a pandas dataframe.  
+                    2. Run Dockerized python script daily to update a AWS RDS PostgreSQL database using AWS ECS automation.  
+                    3. Visualize data with Plotly Dash and deploy as a website using AWS ECR, ECS, EC2 & Lambda.
                 
-                **Skills:**  
-                Python; FRED API; Pandas; Docker; Github Actions; PostgreSQL;
-                AWS - RDS, S3, ECR, ECS, EC2, Lambda, SNS, Cloudwatch, IAM, EventBridge;
-                Plotly; Dash; pgAdmin; YAML; Cloudflare; Data Munging; Automation; Continuous Delivery  
+                    **Skills:**  
+                    Python; FRED API; Pandas; Docker; Github Actions; PostgreSQL;
+                    AWS - RDS, S3, ECR, ECS, EC2, Lambda, SNS, Cloudwatch, IAM, EventBridge;
+                    Plotly; Dash; pgAdmin; YAML; Cloudflare; Data Munging; Automation; Continuous Delivery  
                 
-                **Architecture Flowchart:**
+                    **Architecture Flowchart:**
                 
                 
-                ''',
-                style = {
-                    'width': '85%',
-                    'padding-left': '50px',
-                    'fontSize':18
-                })
-        ], width = 'auto')
-    ], justify = 'center'),
-
-    # Adds image of architecture flowchart
-    dbc.Row([
-        dbc.Col([
-            html.Img(src=image_path, style={'width': '85%',
-                                            'align': 'center',
-                                            'justify': 'center',
-                                            'horizontal-align': 'center'})
-        ], width='auto')
-    ]),
-
-    dbc.Row([
-        dbc.Col([
-            dcc.Markdown('''  
+                    ''',
+                    style = {
+                        'width': '85%',
+                        'padding-left': '50px',
+                        'fontSize':18
+                    })
+            ], width = 'auto')
+        ], justify = 'center'),
+
+        # Adds image of architecture flowchart, left out when egress runs high
+        dbc.Row([
+            dbc.Col([
+                html.Img(src=image_path, style={'width': '85%',
+                                                'align': 'center',
+                                                'justify': 'center',
+                                                'horizontal-align': 'center'})
+            ], width='auto')
+        ]) if level < NO_FLOWCHART else html.Div(),
+
+        dbc.Row([
+            dbc.Col([
+                dcc.Markdown('''  
                            
                                 
-                &emsp;  
-                **Resources:**  
-                Github portfolio  
-                &emsp;https://github.com/lflrnr/Portfolio/  
-                Federal Reserve Bank of St. Louis - FRED API docs  
-                &emsp;https://fred.stlouisfed.org/docs/api/fred/  
+                    &emsp;  
+                    **Resources:**  
+                    Github portfolio  
+                    &emsp;https://github.com/lflrnr/Portfolio/  
+                    Federal Reserve Bank of St. Louis - FRED API docs  
+                    &emsp;https://fred.stlouisfed.org/docs/api/fred/  
                 
-                **Disclaimers:**  
-                "This product uses the FRED® API but is not endorsed or certified by 
-                the Federal Reserve Bank of St. Louis."  
-                Furthermore, this exercise is for demonstration purposes only. 
-                This dashboard, the underlying code, technologies involved and 
-                their related organizations and the author does not assume any liability 
-                for the use or misuse of any of the aforementioned 
-                resources nor claim their veracity, timeliness, or conclusions stated or inferred.
+                    **Disclaimers:**  
+                    "This product uses the FRED® API but is not endorsed or certified by 
+                    the Federal Reserve Bank of St. Louis."  
+                    Furthermore, this exercise is for demonstration purposes only. 
+                    This dashboard, the underlying code, technologies involved and 
+                    their related organizations and the author does not assume any liability 
+                    for the use or misuse of any of the aforementioned 
+                    resources nor claim their veracity, timeliness, or conclusions stated or inferred.
                 
-                **Confidence metric citation:**  
-                Organization for Economic Co-operation and Development, Consumer Opinion Surveys: Confidence Indicators: 
-                Composite Indicators: OECD Indicator for the United States [ CSCICP03USM665S ], retrieved from FRED, 
-                Federal Reserve Bank of St. Louis; https://fred.stlouisfed.org/series/CSCICP03USM665S, August 4, 2023.
+                    **Confidence metric citation:**  
+                    Organization for Economic Co-operation and Development, Consumer Opinion Surveys: Confidence Indicators: 
+                    Composite Indicators: OECD Indicator for the United States [ CSCICP03USM665S ], retrieved from FRED, 
+                    Federal Reserve Bank of St. Louis; https://fred.stlouisfed.org/series/CSCICP03USM665S, August 4, 2023.
                 
-                **Endnotes:**  
-                Initially, this project was to conduct sentiment analyses of the US economy using 
-                Twitter data.  Coding was completed but Twitter drastically reduced its free tier
-                rate limits that were needed for the code to work. An example run is posted at my Github portfolio found above.
-                Finally, the latest available date displayed my not be recent due to FRED having lags in data updates 
-                         which usually resolve within a week or two.
+                    **Endnotes:**  
+                    Initially, this project was to conduct sentiment analyses of the US economy using 
+                    Twitter data.  Coding was completed but Twitter drastically reduced its free tier
+                    rate limits that were needed for the code to work. An example run is posted at my Github portfolio found above.
+                    Finally, the latest available date displayed my not be recent due to FRED having lags in data updates 
+                             which usually resolve within a week or two.
                 
                 
                 
-                ''',
-                style = {
-                    'width': '85%',
-                    'padding-left': '50px',
-                    'fontSize':18
-                })
-        ], width = 'auto')
-    ], justify = 'center'),
-])
+                    ''',
+                    style = {
+                        'width': '85%',
+                        'padding-left': '50px',
+                        'fontSize':18
+                    })
+            ], width = 'auto')
+        ], justify = 'center'),
+    ])
+
+# Components the callbacks refer to, declared up front so assigning the layout function
+# does not call it, and query the database, at import time
+app.validation_layout = html.Div([dcc.Dropdown(id='metric'), dcc.Graph(id='plot'),
+                                  dcc.Store(id='window'), dcc.Store(id='last-date'),
+                                  dcc.Interval(id='live'),
+                                  *Plotly_clientside.validation_components()])
+app.layout = serve_layout
+
+# The clientside mode's payload route and browser callbacks; its components have their
+# own ids, so the server callbacks below never fire in that mode
+Plotly_clientside.register(app, columns_payload)
+
+# Sends only the traces that change and patches them into the figure already in the
+# browser: the selected metric's series for the third panel, or all panels resampled for
+# the zoomed window. In embedded mode the third panel belongs to the figure's own dropdown.
+@callback(Output('plot', 'figure'), Output('window', 'data'),
+          Input('metric', 'value'), Input('plot', 'relayoutData'), State('window', 'data'),
+          prevent_initial_call=True)
+def update_panels(metric, relayout, window):
+    if meter.level() >= SNAPSHOT:
+        raise PreventUpdate
+    if ctx.triggered_id == 'plot':
+        window = zoom_window(relayout)
+        if window is False:
+            raise PreventUpdate
+        panels = {0: 'confidence', 1: 'sp500'}
+        if METRIC_MODE != 'embedded':
+            panels[2] = metric
+    else:
+        panels = {2: metric}
+
+    patch = Patch()
+    for trace, col in panels.items():
+        x, y = metric_points(col, window)
+        patch['data'][trace]['x'] = x
+        patch['data'][trace]['y'] = y
+        patch['data'][trace]['name'] = col
+    return patch, window
+
+# Appends the rows newer than the page's last date to the traces in the browser; a page
+# that is far behind gets the downsampled overview instead of every missed point
+@callback(Output('plot', 'figure', allow_duplicate=True), Output('last-date', 'data'),
+          Input('live', 'n_intervals'), State('last-date', 'data'), State('metric', 'value'),
+          prevent_initial_call=True)
+def extend_live(n_intervals, last_date, metric):
+    if meter.level() >= SNAPSHOT or not last_date:
+        raise PreventUpdate
+    df_final = current_frame()
+    dates = _dates(store.version)
+    new = dates > np.datetime64(last_date)
+    if not new.any():
+        raise PreventUpdate
+
+    panels = {0: 'confidence', 1: 'sp500'}
+    if METRIC_MODE != 'embedded':
+        panels[2] = metric
+    patch = Patch()
+    behind = new.sum() > point_budget()
+    for trace, col in panels.items():
+        if behind:
+            x, y = metric_points(col)
+            patch['data'][trace]['x'] = x
+            patch['data'][trace]['y'] = y
+            continue
+        y = df_final[col].to_numpy(dtype=np.float64)[new]
+        keep = ~np.isnan(y)
+        patch['data'][trace]['x'].extend(np.datetime_as_string(dates[new][keep], unit='D').tolist())
+        patch['data'][trace]['y'].extend(y[keep].tolist())
+    return patch, latest_date()
 
 # if __name__ == '__main__':
 #     app.run_server(debug = False, use_reloader = False) # turn off inline to get url " mode='inline' "
@@ -359,6 +482,39 @@ app.layout = dbc.Container([
 # if __name__ == '__main__':
 #     app.run_server(host='0.0.0.0', port=8050)
 
+# DASH_WORKERS > 1 pre-forks that many waitress workers sharing one memory-mapped copy
+# of the data, which this process keeps loading and publishing
+WORKERS = int(os.environ.get('DASH_WORKERS', 1))
+
+def start_worker(index):
+    global store
+    store = SharedMetricsStore()
+    _dates.cache_clear()
+    _points.cache_clear()
+    _columns_payload.cache_clear()
+    _analytics_figure.cache_clear()
+    _figure_cache.clear()
+    # Each worker meters its own share of the traffic against its share of the budget
+    meter.budget_bytes //= WORKERS
+    meter.path = f'{meter.path}.{index}'
+    meter.buckets = {}
+    if os.path.exists(meter.path):
+        meter.load()
+
+# DASH_INGEST=scheduled runs the daily update from this process (Plotly_scheduler.py) and
+# reloads the store as soon as it committed; in prefork mode the parent does both
+def reload_after_ingest():
+    store.reload()
+
 # Dash app default port is 8050, this option serves Waitress app - a production server
 if __name__ == '__main__':
-    serve(app.server, host='0.0.0.0', port=8050)
\ No newline at end of file
+    port = int(os.environ.get('DASH_PORT', 8050))
+    scheduler = scheduler_from_env(reload_after_ingest)
+    if WORKERS > 1:
+        # The parent forks workers, so the schedule is driven from its loop, not a thread
+        serve_prefork(app.server, WORKERS, loader=store, port=port, on_worker_start=start_worker,
+                      on_tick=scheduler.tick if scheduler is not None else None)
+    else:
+        if scheduler is not None:
+            scheduler.start()
+        serve(app.server, host='0.0.0.0', port=port)
\ No newline at end of file
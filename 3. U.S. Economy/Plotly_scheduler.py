@@ -0,0 +1,144 @@
+# In-process scheduling of the daily update for the dashboard container
+# Lambda_scripts_coordinator.py stops the dashboard service, runs the econdaily task and
+# starts the service again, because both do not fit on the free tier instance side by side.
+# With DASH_INGEST=scheduled the dashboard runs Scrape_python_script.main() itself, every
+# day at DASH_INGEST_AT (UTC, HH:MM), and keeps serving throughout:
+#   - the update runs in a child process at a lowered CPU priority (DASH_INGEST_NICE) under
+#     an address space cap (DASH_INGEST_MEMORY_MB), so it can neither starve the server nor
+#     push it out of memory. A run that hits the cap fails on its own, the server is not touched.
+#   - the child is started and checked on without blocking, from a thread of the server or,
+#     with DASH_WORKERS > 1, from the prefork parent's loop, which must not run threads
+#     while it forks. A run that is due while the previous one is still going is skipped.
+#     FRED downloads in the child use DASH_INGEST_THREADS threads.
+#   - a run is stopped after DASH_INGEST_TIMEOUT seconds
+#   - DASH_INGEST_LEAN=1 runs the low-memory update of Scrape_lean.py instead, whose
+#     footprint does not grow with econ_metrics
+#   - the update commits its rows in one transaction per table, and on success the store
+#     is told to refresh at once: the new frame replaces the old one in a single swap,
+#     so every request sees either the old or the new version
+# The ECS schedule of the coordinator is not needed in this mode.
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from App_metrics import emit
+
+# Runs the daily update in the child: priority and memory cap first, then the imports
+RUNNER = """
+import importlib, os, resource, sys
+os.nice(int(sys.argv[1]))
+limit = int(sys.argv[2]) * 2**20
+if limit:
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+importlib.import_module(sys.argv[3]).main()
+"""
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def next_run(at, now):
+    """Next UTC datetime at `at` ('HH:MM') after `now`"""
+    hour, minute = (int(part) for part in at.split(':'))
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return run if run > now else run + timedelta(days=1)
+
+
+class IngestScheduler:
+
+    def __init__(self, handoff, at='10:00', nice=10, memory_mb=768, threads=2, timeout=600,
+                 lean=False, clock=lambda: datetime.now(timezone.utc)):
+        """handoff() is called after every successful run to make the new rows current"""
+        self.handoff = handoff
+        self.module = 'Scrape_lean' if lean else 'Scrape_python_script'
+        self.at = at
+        self.nice = nice
+        self.memory_mb = memory_mb
+        self.threads = threads
+        self.timeout = timeout
+        self.clock = clock
+        self.due = next_run(at, clock())
+        # The running child and when it started; never more than one update at a time
+        self.process = None
+        self.started = None
+        self.last = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Tick from a thread of this process; a prefork parent, which must not run threads
+        while it forks, calls tick() from its own loop instead"""
+        threading.Thread(target=self.loop, name='ingest-schedule', daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def loop(self):
+        while not self.stopped.wait(1):
+            self.tick()
+
+    def tick(self):
+        """Finish the run whose child exited and start the next one when it is due; never
+        blocks"""
+        self.poll()
+        now = self.clock()
+        if now >= self.due:
+            self.due = next_run(self.at, now)
+            self.trigger()
+
+    def trigger(self):
+        """Start a run unless one is in progress; returns its child process or None"""
+        if self.process is not None:
+            print("Daily update still running, skipping this one")
+            return None
+        env = dict(os.environ, FRED_MAX_WORKERS=str(self.threads),
+                   # One BLAS thread and few malloc arenas keep the address space small
+                   OPENBLAS_NUM_THREADS='1', OMP_NUM_THREADS='1', MALLOC_ARENA_MAX='2')
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen([sys.executable, '-c', RUNNER, str(self.nice),
+                                         str(self.memory_mb), self.module],
+                                        cwd=SCRIPT_DIR, env=env)
+        return self.process
+
+    def poll(self):
+        """Record the run once its child exited or ran out of time, and hand the new rows
+        over; returns the outcome then, else None"""
+        if self.process is None:
+            return None
+        seconds = time.perf_counter() - self.started
+        returncode = self.process.poll()
+        if returncode is None:
+            if seconds < self.timeout:
+                return None
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+        outcome = {0: 'succeeded', None: 'timeout'}.get(returncode, 'failed')
+        self.last = {'outcome': outcome, 'returncode': returncode,
+                     'seconds': round(seconds, 1), 'finished': self.clock().isoformat()}
+        print(f"Daily update {outcome} after {seconds:.0f}s")
+        emit('scheduled_ingest', {'Duration': round(seconds * 1000, 3)}, service='dashboard',
+             outcome=outcome, returncode=returncode)
+        if outcome == 'succeeded':
+            try:
+                self.handoff()
+            except Exception as e:
+                print(f"Refresh after the daily update failed, serving the previous data: {e!r}")
+        return self.last
+
+
+def scheduler_from_env(handoff):
+    """IngestScheduler configured from DASH_INGEST_* when DASH_INGEST=scheduled, else None"""
+    if os.environ.get('DASH_INGEST') != 'scheduled':
+        return None
+    print(f"Daily update scheduled at {os.environ.get('DASH_INGEST_AT', '10:00')} UTC")
+    return IngestScheduler(handoff,
+                           at=os.environ.get('DASH_INGEST_AT', '10:00'),
+                           nice=int(os.environ.get('DASH_INGEST_NICE', 10)),
+                           memory_mb=int(os.environ.get('DASH_INGEST_MEMORY_MB', 768)),
+                           threads=int(os.environ.get('DASH_INGEST_THREADS', 2)),
+                           timeout=int(os.environ.get('DASH_INGEST_TIMEOUT', 600)),
+                           lean=os.environ.get('DASH_INGEST_LEAN') == '1')
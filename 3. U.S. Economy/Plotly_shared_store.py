@@ -0,0 +1,207 @@
+# Multi-process serving with one shared, read-only copy of econ_metrics
+# Plotly JSON serialization holds the GIL, so one waitress process serves one visitor's
+# figure at a time. In this mode a parent process opens the listening socket, loads the
+# data once and forks N waitress workers that accept on the same socket.
+# The parent writes every data version as one .npy file per column into a fresh directory
+# and then atomically repoints the CURRENT file at it. Workers memory-map the columns
+# read-only, so all of them share the same page-cache pages: memory stays flat as workers
+# are added. The parent keeps refreshing from the database or the snapshots and publishes
+# new versions; workers notice the new CURRENT within a few seconds and remap. The
+# Confidence analytics are handed over in the same version, so workers never open a
+# database connection.
+
+import gc
+import json
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from App_snapshot import analytics_from_json, analytics_to_json
+from Plotly_data import MetricsStore
+
+# /dev/shm keeps the files in memory on Linux; elsewhere a temporary directory is used
+DEFAULT_SHARED_DIR = os.environ.get(
+    'DASH_SHARED_DIR',
+    '/dev/shm/econ_metrics' if os.path.isdir('/dev/shm') else
+    os.path.join(tempfile.gettempdir(), 'econ_metrics'))
+
+# Versions kept besides the current one, for workers that have not remapped yet
+KEEP_VERSIONS = 1
+
+
+def publish_frame(frame, root=DEFAULT_SHARED_DIR, figure=None, analytics=None):
+    """Write `frame` as a new shared version and make it current; returns its name"""
+    name = f'v{time.time_ns()}'
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    np.save(os.path.join(path, 'date.npy'),
+            pd.to_datetime(frame['date']).to_numpy().astype('datetime64[D]'))
+    columns = list(frame.columns)
+    for col in columns[1:]:
+        np.save(os.path.join(path, f'{col}.npy'), frame[col].to_numpy(dtype=np.float64))
+    with open(os.path.join(path, 'columns.json'), 'w') as f:
+        json.dump(columns, f)
+    if figure is not None:
+        with open(os.path.join(path, 'figure.json'), 'w') as f:
+            json.dump(figure, f)
+    if analytics is not None:
+        with open(os.path.join(path, 'analytics.json'), 'wb') as f:
+            f.write(analytics_to_json(*analytics))
+
+    tmp = os.path.join(root, 'CURRENT.tmp')
+    with open(tmp, 'w') as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(root, 'CURRENT'))
+
+    # Unlinking a version is safe while workers still map it, the pages go once unmapped
+    versions = sorted(d for d in os.listdir(root) if d.startswith('v'))
+    for old in versions[:-(KEEP_VERSIONS + 1)]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return name
+
+
+class SharedMetricsStore(MetricsStore):
+    """MetricsStore whose frame is a set of read-only memory maps of the parent's current
+    version; each probe is a read of the small CURRENT file"""
+
+    def __init__(self, root=DEFAULT_SHARED_DIR, refresh_seconds=5):
+        super().__init__(refresh_seconds=refresh_seconds)
+        self.root = root
+        self.current = None
+        self.figure = None
+        self.analytics_frames = None
+
+    def refresh(self):
+        self.checked_at = time.monotonic()
+        with open(os.path.join(self.root, 'CURRENT')) as f:
+            name = f.read().strip()
+        if name == self.current:
+            return False
+
+        path = os.path.join(self.root, name)
+        with open(os.path.join(path, 'columns.json')) as f:
+            columns = json.load(f)
+        data = {'date': np.load(os.path.join(path, 'date.npy'), mmap_mode='r')}
+        for col in columns[1:]:
+            data[col] = np.load(os.path.join(path, f'{col}.npy'), mmap_mode='r')
+        # copy=False keeps every numeric column a view of its memory map
+        frame = pd.DataFrame(data, columns=columns, copy=False)
+        figure = None
+        if os.path.exists(os.path.join(path, 'figure.json')):
+            with open(os.path.join(path, 'figure.json')) as f:
+                figure = json.load(f)
+        analytics = None
+        if os.path.exists(os.path.join(path, 'analytics.json')):
+            with open(os.path.join(path, 'analytics.json'), 'rb') as f:
+                analytics = analytics_from_json(f.read())
+
+        self.frame, self.figure, self.current = frame, figure, name
+        self.analytics_frames = analytics
+        self.watermark, self.row_count = frame['date'].max() if len(frame) else None, len(frame)
+        self.version += 1
+        print(f"Worker {os.getpid()} mapped {name}: {len(frame)} rows")
+        return True
+
+    def analytics(self):
+        """The parent's analytics of the mapped version"""
+        return self.analytics_frames
+
+
+def loader_analytics(loader):
+    """The loader's analytics for publishing, None when it has none or they cannot be read"""
+    try:
+        return loader.analytics()
+    except Exception as e:
+        print(f"Analytics not published to the workers: {e!r}")
+        return None
+
+
+def serve_prefork(server, workers, loader, host='0.0.0.0', port=8050, root=DEFAULT_SHARED_DIR,
+                  on_worker_start=None, threads=4, on_tick=None):
+    """Serve the Flask `server` from `workers` forked waitress processes sharing one
+    listening socket. The parent refreshes `loader` (a MetricsStore) every
+    loader.refresh_seconds, publishes new data versions for the workers and restarts
+    workers that die. `on_worker_start(index)` runs in each worker after the fork, and
+    `on_tick()` in the parent about every second; it must not block, and the parent
+    starts no threads, so no fork can copy a lock another thread holds."""
+
+    from waitress import serve
+
+    os.makedirs(root, exist_ok=True)
+    loader.refresh()
+    publish_frame(loader.frame, root, getattr(loader, 'figure', None), loader_analytics(loader))
+    published = loader.version
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    print(f"Serving on {host}:{port} with {workers} workers")
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                if on_worker_start is not None:
+                    on_worker_start(index)
+                serve(server, sockets=[sock], threads=threads)
+            finally:
+                os._exit(0)
+        return pid
+
+    # Objects created so far move to a permanent generation the collector never touches,
+    # so the workers do not copy the parent's pages by merely scanning them
+    gc.collect()
+    gc.freeze()
+    children = {spawn(i): i for i in range(workers)}
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_refresh = time.monotonic() + loader.refresh_seconds
+    while True:
+        # Restart workers that died. Only the workers are reaped: waiting on any child
+        # would also reap the scheduled update's process (on_tick), whose Popen would then
+        # report it as succeeded whatever its exit status
+        for pid in list(children):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                index = children.pop(pid)
+                print(f"Worker {index} ({pid}) exited, restarting")
+                children[spawn(index)] = index
+
+        if time.monotonic() >= next_refresh:
+            next_refresh = time.monotonic() + loader.refresh_seconds
+            try:
+                # Under the loader's lock, as loader.reload() may run from another thread
+                with loader.lock:
+                    loader.refresh()
+            except Exception as e:
+                print(f"Refresh failed, workers keep the current data: {e!r}")
+        if on_tick is not None:
+            on_tick()
+        # New versions are published whichever thread loaded them
+        if loader.version != published:
+            publish_frame(loader.frame, root, getattr(loader, 'figure', None),
+                          loader_analytics(loader))
+            published = loader.version
+        time.sleep(1)
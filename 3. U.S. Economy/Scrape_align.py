@@ -0,0 +1,112 @@
+# Calendar alignment of FRED observations into the wide econ_metrics layout
+# All series arrive as one long-format frame (series_id, date, value) and are aligned in
+# a single vectorized pass: the master calendar is built once, every observation is
+# scattered onto a (day, series) float64 grid, daily series keep NaNs on weekends/holidays
+# and monthly series are forward filled with an as-of join. Cost grows linearly with the
+# number of series and days, with one float64 block for the whole output.
+# The grid itself (AlignedGrid) needs numpy only, so the low-memory daily update
+# (Scrape_lean.py) fills it series by series without pandas.
+
+import numpy as np
+
+from Scrape_series import SERIES, ROUNDING
+
+
+class AlignedGrid:
+    """The econ_metrics rows of the calendar [start, end] as one float64 array with a row
+    per day and a column per series, filled one series at a time. Daily series keep NaN
+    where they have no value, monthly series are forward filled from their latest release."""
+
+    def __init__(self, start, end, series=SERIES):
+        self.start = np.datetime64(start, 'D')
+        self.n_days = max(0, int((np.datetime64(end, 'D') - self.start).astype(np.int64)) + 1)
+        self.series = series
+        self.position = {series_id: i for i, (series_id, _, _) in enumerate(series)}
+        self.monthly = np.array([freq == 'monthly' for _, _, freq in series])
+        self.grid = np.full((self.n_days, len(series)), np.nan)
+        # Latest release of each monthly series before the calendar, seeds the forward fill
+        self.seed_day = np.full(len(series), np.iinfo(np.int64).min)
+        self.seed = np.full(len(series), np.nan)
+
+    def add(self, series_id, dates, values):
+        """Place one series' observations; later duplicates of a date win. Series write to
+        their own column only, so the fetch threads can add concurrently."""
+        j = self.position[series_id]
+        values = np.asarray(values, dtype=np.float64)
+        days = (np.asarray(dates, dtype='datetime64[D]') - self.start).astype(np.int64)
+        keep = (days >= 0) & (days < self.n_days)
+        if self.monthly[j]:
+            # Monthly releases dated before the calendar still seed the forward fill, and
+            # a missing monthly value never replaces the previous release
+            valid = ~np.isnan(values)
+            before = np.flatnonzero(valid & (days < 0))
+            if len(before):
+                last = before[days[before] == days[before].max()][-1]
+                if days[last] >= self.seed_day[j]:
+                    self.seed_day[j], self.seed[j] = days[last], values[last]
+            keep &= valid
+        self.grid[days[keep], j] = values[keep]
+
+    def fill(self):
+        """Forward fill the monthly series and round as in econ_metrics, in place; returns
+        the grid"""
+        grid = self.grid
+        # As-of join for monthly series: each day takes the latest release on or before it
+        if self.monthly.any():
+            block = np.vstack([self.seed[self.monthly], grid[:, self.monthly]])
+            latest = np.where(~np.isnan(block), np.arange(len(block))[:, None], 0)
+            np.maximum.accumulate(latest, axis=0, out=latest)
+            grid[:, self.monthly] = block[latest, np.arange(block.shape[1])][1:]
+        for j, (_, col, _) in enumerate(self.series):
+            if col in ROUNDING:
+                grid[:, j] = np.round(grid[:, j], ROUNDING[col])
+        return grid
+
+    def complete_rows(self):
+        """(dates, values) of the days on which every series has a value"""
+        grid = self.fill()
+        complete = np.flatnonzero(~np.isnan(grid).any(axis=1))
+        return self.start + complete, grid[complete]
+
+
+def observations_to_long(observations_by_series):
+    """Long-format frame with series_id (categorical), date and float value columns from
+    {series_id: FRED observations in JSON format}; FRED's '.' missing values become NaN"""
+    # pandas is only imported by the frame builders, see the note at the top
+    import pandas as pd
+
+    ids, dates, values = [], [], []
+    for series_id, observations in observations_by_series.items():
+        ids.append(np.full(len(observations), series_id, dtype=object))
+        dates += [o['date'] for o in observations]
+        values += [o['value'] for o in observations]
+
+    return pd.DataFrame({
+        'series_id': pd.Categorical(np.concatenate(ids) if ids else [],
+                                    categories=list(observations_by_series)),
+        'date': pd.to_datetime(pd.Series(dates, dtype=object), format='%Y-%m-%d'),
+        'value': pd.to_numeric(pd.Series(values, dtype=object), errors='coerce'),
+    })
+
+
+def align_long(long_df, start, end, series=SERIES):
+    """Wide frame with a date column and one column per series over the calendar
+    [start, end], columns named and ordered as in `series`"""
+    import pandas as pd
+
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    grid = AlignedGrid(start.date(), end.date(), series)
+
+    # Each series' observations are placed on the master calendar by day offset
+    series_ids = [series_id for series_id, _, _ in series]
+    codes = pd.Categorical(long_df['series_id'], categories=series_ids).codes
+    dates = long_df['date'].to_numpy().astype('datetime64[D]')
+    values = long_df['value'].to_numpy(dtype=np.float64)
+    for j, series_id in enumerate(series_ids):
+        rows = codes == j
+        grid.add(series_id, dates[rows], values[rows])
+
+    df_final = pd.DataFrame(grid.fill(), columns=[col for _, col, _ in series])
+    df_final.insert(0, 'date', pd.date_range(start, end))
+    return df_final
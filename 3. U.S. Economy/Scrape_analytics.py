@@ -0,0 +1,254 @@
+# How Confidence moves with the other econ_metrics columns, materialized for the dashboard
+#   econ_analytics           rolling correlation and rolling beta (Confidence regressed on
+#                            the metric) of confidence against every other column, per
+#                            date, metric and window (ECON_ANALYTICS_WINDOWS rows, by
+#                            default 63 and 252)
+#   econ_cross_correlations  correlation of confidence with each metric shifted by LAGS
+#                            rows over the latest window. A positive lag pairs confidence
+#                            with the metric's value that many rows earlier, so a peak at
+#                            a positive lag means the metric leads confidence.
+# Windows and lags count rows of the aligned table, not calendar days (window_rows,
+# lag_rows). Only days on which every series has a value are read, as in econ_metrics;
+# the long store's view also has weekend and holiday rows of the series published every
+# day, and those are left out. A row is then a trading day of the daily market series,
+# so 63 and 252 rows are about a quarter and a year of trading.
+# All metrics are computed at once on (rows, metrics) arrays: window sums come from one
+# cumulative sum per moment, so a pass costs the same whatever the window length. The
+# update is incremental: only the dates from each window's high-water mark minus the
+# revision lookback are recomputed, reading just the rows before them that their windows
+# need. The daily update runs it after each write; --full recomputes every date, e.g.
+# after a backfill. read_analytics() hands the results to the dashboard, directly or
+# through its snapshots.
+# The lookback is the ingest's longest revision lookback, 75 calendar days, whatever the
+# window length: a revised value only changes the statistics of its own date and later
+# ones, and the ingest re-downloads no further back, so every date a revision can move is
+# recomputed. The window length only sets how many earlier rows are read as context.
+#
+# Usage: python3 Scrape_analytics.py [--full] [--storage wide|long|both]
+
+import argparse
+import io
+import os
+from datetime import timedelta
+
+import numpy as np
+
+from App_config import STORAGE_MODE, metrics_table
+from Scrape_db import REVISION_LOOKBACK_DAYS
+from Scrape_series import COLUMNS
+
+ANALYTICS_TABLE = 'econ_analytics'
+CROSS_TABLE = 'econ_cross_correlations'
+
+TARGET = 'confidence'
+METRICS = [col.lower() for col in COLUMNS if col.lower() != TARGET]
+
+WINDOWS = tuple(int(w) for w in os.environ.get('ECON_ANALYTICS_WINDOWS', '63,252').split(','))
+
+# Up to 252 rows (a year of trading days) either way, in steps of 21 rows (about a month)
+LAGS = tuple(range(-252, 253, 21))
+
+# Share of a window that must hold values before a statistic is reported
+MIN_SHARE = 0.5
+
+
+def ensure_tables(conn):
+    with conn, conn.cursor() as cur:
+        cur.execute(f"""CREATE TABLE IF NOT EXISTS {ANALYTICS_TABLE} (
+                            window_rows integer NOT NULL,
+                            metric text NOT NULL,
+                            date date NOT NULL,
+                            correlation double precision,
+                            beta double precision,
+                            observations integer NOT NULL,
+                            PRIMARY KEY (window_rows, metric, date))""")
+        cur.execute(f"""CREATE TABLE IF NOT EXISTS {CROSS_TABLE} (
+                            window_rows integer NOT NULL,
+                            metric text NOT NULL,
+                            lag_rows integer NOT NULL,
+                            as_of date NOT NULL,
+                            correlation double precision,
+                            observations integer NOT NULL,
+                            PRIMARY KEY (window_rows, metric, lag_rows))""")
+
+
+def rolling_stats(y, X, window, min_periods=1):
+    """(correlation, beta, observations) of y against every column of X over the `window`
+    rows ending at each row, each of shape X.shape. Rows where either value is NaN are
+    left out, and statistics of fewer than `min_periods` pairs are NaN."""
+
+    valid = ~np.isnan(X) & ~np.isnan(y)[:, None]
+    # Centering leaves the statistics unchanged and keeps the running sums small
+    count = np.maximum(valid.sum(axis=0), 1)
+    x = np.where(valid, X - np.where(valid, X, 0).sum(axis=0) / count, 0.0)
+    y = np.where(valid, y[:, None] - np.where(valid, y[:, None], 0).sum(axis=0) / count, 0.0)
+
+    ends = np.arange(1, len(X) + 1)
+    starts = np.maximum(ends - window, 0)
+
+    def window_sum(a):
+        total = np.concatenate([np.zeros((1, a.shape[1])), np.cumsum(a, axis=0)])
+        return total[ends] - total[starts]
+
+    n = window_sum(valid.astype(np.float64))
+    sx, sy = window_sum(x), window_sum(y)
+    cov = n * window_sum(x * y) - sx * sy
+    var_x = n * window_sum(x * x) - sx * sx
+    var_y = n * window_sum(y * y) - sy * sy
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.clip(cov / np.sqrt(var_x * var_y), -1, 1)
+        beta = cov / var_x
+    # A constant series within the window has no correlation
+    flat = (n < min_periods) | (var_x <= 1e-12 * n * n) | (var_y <= 1e-12 * n * n)
+    correlation[flat] = np.nan
+    beta[flat] = np.nan
+    return correlation, beta, n.astype(np.int64)
+
+
+def cross_correlations(y, X, lags=LAGS, window=252, min_periods=1):
+    """(correlation, observations) of shape (len(lags), X.shape[1]): y against X shifted by
+    each lag of rows over the last `window` rows"""
+    correlation = np.full((len(lags), X.shape[1]), np.nan)
+    observations = np.zeros((len(lags), X.shape[1]), dtype=np.int64)
+    for i, lag in enumerate(lags):
+        if abs(lag) >= len(y):
+            continue
+        if lag >= 0:
+            ys, Xs = y[lag:], X[:len(X) - lag]
+        else:
+            ys, Xs = y[:lag], X[-lag:]
+        r, _, n = rolling_stats(ys[-window:], Xs[-window:], window, min_periods)
+        correlation[i], observations[i] = r[-1], n[-1]
+    return correlation, observations
+
+
+def read_rows(cur, table, since=None, before=0):
+    """(dates, confidence, metrics array) of the complete rows of `table` from `since` on,
+    plus the `before` complete rows preceding it"""
+    columns = ', '.join(f'{col}::float8' for col in [TARGET] + METRICS)
+    # The long store's view also has the days on which only some series have a value
+    complete = ' AND '.join(f'{col} IS NOT NULL' for col in [TARGET] + METRICS)
+    if since is None:
+        cur.execute(f'SELECT date, {columns} FROM {table} WHERE {complete} ORDER BY date')
+    else:
+        cur.execute(f"""(SELECT date, {columns} FROM {table}
+                         WHERE date < %(since)s AND {complete}
+                         ORDER BY date DESC LIMIT %(before)s)
+                        UNION ALL
+                        (SELECT date, {columns} FROM {table}
+                         WHERE date >= %(since)s AND {complete})
+                        ORDER BY date""", {'since': since, 'before': before})
+    rows = cur.fetchall()
+    dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+    values = np.array([row[1:] for row in rows], dtype=np.float64)
+    values = values.reshape(len(rows), 1 + len(METRICS))
+    return dates, values[:, 0], values[:, 1:]
+
+
+def write_csv(conn, table, key, columns, buf):
+    """Upsert CSV lines of `columns` from `buf` into `table` in one transaction"""
+    cols = ', '.join(columns)
+    updates = ', '.join(f'{col} = EXCLUDED.{col}' for col in columns if col not in key)
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(f'CREATE TEMP TABLE analytics_stage (LIKE {table}) ON COMMIT DROP')
+            cur.copy_expert(f'COPY analytics_stage ({cols}) FROM STDIN WITH (FORMAT csv)', buf)
+            cur.execute(f"""INSERT INTO {table} ({cols}) SELECT {cols} FROM analytics_stage
+                            ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}""")
+            return cur.rowcount
+    finally:
+        conn.autocommit = autocommit
+
+
+def csv_value(value):
+    return '' if np.isnan(value) else repr(float(value))
+
+
+def update_analytics(conn, table=None, full=False, windows=WINDOWS, lags=LAGS):
+    """Bring econ_analytics and econ_cross_correlations up to date with `table`
+    (econ_metrics or the long store's view); returns {'rows': rows written, 'since': first
+    date recomputed or None when every date was}"""
+
+    table = table or metrics_table(STORAGE_MODE)
+    ensure_tables(conn)
+    with conn.cursor() as cur:
+        since = None
+        if not full:
+            # Dates are recomputed from the window that is furthest behind, a new window
+            # from the start
+            cur.execute(f"""SELECT CASE WHEN bool_and(latest IS NOT NULL) THEN min(latest) END
+                            FROM (
+                                SELECT w, (SELECT max(date) FROM {ANALYTICS_TABLE}
+                                           WHERE window_rows = w) AS latest
+                                FROM unnest(%s::int[]) AS w) marks""", (list(windows),))
+            latest = cur.fetchone()[0]
+            # Revised values of recent days and monthly releases are picked up again
+            since = latest and latest - timedelta(days=max(REVISION_LOOKBACK_DAYS.values()))
+        # Rows before `since` that the windows and the lagged pairs reach back to
+        context = max(windows) + max(abs(lag) for lag in lags)
+        dates, y, X = read_rows(cur, table, since, before=context)
+
+    if not len(dates):
+        return {'rows': 0, 'since': since}
+    first = 0 if since is None else int(np.searchsorted(dates, np.datetime64(since, 'D')))
+
+    written = 0
+    for window in windows:
+        correlation, beta, n = rolling_stats(y, X, window, int(window * MIN_SHARE))
+        buf = io.StringIO()
+        for i in range(first, len(dates)):
+            day = str(dates[i])
+            for j, metric in enumerate(METRICS):
+                buf.write(f'{window},{metric},{day},{csv_value(correlation[i, j])},'
+                          f'{csv_value(beta[i, j])},{n[i, j]}\n')
+        buf.seek(0)
+        written += write_csv(conn, ANALYTICS_TABLE, ('window_rows', 'metric', 'date'),
+                             ['window_rows', 'metric', 'date', 'correlation', 'beta',
+                              'observations'], buf)
+
+        # Lead/lag profile over the latest window, replaced on every run
+        correlation, n = cross_correlations(y, X, lags, window, int(window * MIN_SHARE))
+        buf = io.StringIO()
+        for i, lag in enumerate(lags):
+            for j, metric in enumerate(METRICS):
+                buf.write(f'{window},{metric},{lag},{dates[-1]},{csv_value(correlation[i, j])},'
+                          f'{n[i, j]}\n')
+        buf.seek(0)
+        written += write_csv(conn, CROSS_TABLE, ('window_rows', 'metric', 'lag_rows'),
+                             ['window_rows', 'metric', 'lag_rows', 'as_of', 'correlation',
+                              'observations'], buf)
+    return {'rows': written, 'since': since}
+
+
+def read_analytics(cur):
+    """(rolling, cross) frames of every window, for the dashboard and its snapshots:
+    rolling holds window_rows, metric, date and correlation; cross holds window_rows,
+    metric, lag_rows, correlation and as_of"""
+    # pandas is only imported here, as in Scrape_db.read_metrics
+    import pandas as pd
+    frames = []
+    for sql in (f"""SELECT window_rows, metric, date, correlation FROM {ANALYTICS_TABLE}
+                    ORDER BY window_rows, metric, date""",
+                f"""SELECT window_rows, metric, lag_rows, correlation, as_of FROM {CROSS_TABLE}
+                    ORDER BY window_rows, metric, lag_rows"""):
+        cur.execute(sql)
+        df = pd.DataFrame(cur.fetchall(), columns=[c.name for c in cur.description])
+        df['correlation'] = pd.to_numeric(df['correlation'], errors='coerce').astype('float64')
+        frames.append(df)
+    return tuple(frames)
+
+
+if __name__ == '__main__':
+    from Scrape_daily import connect
+
+    parser = argparse.ArgumentParser(description='Update the Confidence analytics tables')
+    parser.add_argument('--full', action='store_true', help='recompute every date')
+    parser.add_argument('--storage', choices=['wide', 'long', 'both'], default=STORAGE_MODE,
+                        help='read econ_metrics or the long store\'s wide view')
+    args = parser.parse_args()
+    conn = connect()
+    print("Analytics updated:", update_analytics(conn, metrics_table(args.storage), full=args.full))
+    conn.close()
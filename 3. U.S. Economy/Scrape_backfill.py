@@ -0,0 +1,156 @@
+# Resumable, parallel historical backfill of every series in the econ_metrics table
+# The date range of each series (from its FRED observation_start) is split into chunks
+# that are downloaded concurrently under the FRED rate limit. Each completed chunk is
+# checkpointed to disk as soon as it arrives, so an interrupted run resumes with the
+# missing chunks only. The aligned history is then loaded one year at a time through the
+# bulk upsert, which makes repeated runs idempotent.
+# Like the daily update, dates where any series is missing are dropped from the wide table;
+# with long storage every observation is loaded into econ_observations as well or instead.
+#
+# Usage: python3 Scrape_python_script.py backfill [--start 1990-01-01] [--chunk-years 5] [--fresh]
+
+import glob
+import json
+import os
+from datetime import date, timedelta
+
+import pandas as pd
+
+from App_metrics import span, emit
+from Scrape_align import observations_to_long, align_long
+from Scrape_db import bulk_upsert
+from Scrape_long_store import upsert_observations, refresh_wide_view
+from Scrape_fred_fetch import (fetch_many, fetch_series_info, observation_job, TokenBucket,
+                               FRED_REQUESTS_PER_MINUTE)
+from Scrape_series import SERIES
+
+DEFAULT_CHECKPOINT_DIR = '/app/backfill'
+
+
+def chunk_periods(start, end, chunk_years):
+    """Split [start, end] dates into consecutive [start, end] strings of chunk_years each"""
+    periods = []
+    chunk_start = start
+    while chunk_start <= end:
+        try:
+            next_start = chunk_start.replace(year=chunk_start.year + chunk_years)
+        except ValueError:  # February 29th
+            next_start = chunk_start.replace(year=chunk_start.year + chunk_years, day=28)
+        chunk_end = min(next_start - timedelta(days=1), end)
+        periods.append([chunk_start.isoformat(), chunk_end.isoformat()])
+        chunk_start = next_start
+    return periods
+
+
+def chunk_path(checkpoint_dir, series_id, period):
+    return os.path.join(checkpoint_dir, f'{series_id}_{period[0]}_{period[1]}.json')
+
+
+def write_atomic(path, payload):
+    # Write then rename so a killed run never leaves a half-written checkpoint
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+def run_backfill(conn, api_key, start=None, end=None, chunk_years=5,
+                 checkpoint_dir=DEFAULT_CHECKPOINT_DIR, requests_per_minute=FRED_REQUESTS_PER_MINUTE,
+                 max_workers=10, base_url=None, series=SERIES, storage='wide'):
+    """Backfill econ_metrics with the full history of `series` and return the totals of
+    rows inserted, updated and skipped.
+
+    start/end are 'YYYY-MM-DD' strings that clip each series' FRED history. Chunks are
+    anchored on each series' first date, so resuming on a later day only re-downloads
+    the last chunk of each series. storage is 'wide', 'long' or 'both', as in the daily
+    update."""
+
+    end = date.fromisoformat(end) if end else date.today()
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    fetch_kwargs = {'bucket': TokenBucket(requests_per_minute), 'max_workers': max_workers}
+    if base_url:
+        fetch_kwargs['base_url'] = base_url
+
+    # Where each series' history begins on FRED, saved so resumed runs skip these calls
+    info_path = os.path.join(checkpoint_dir, 'series_start.json')
+    if os.path.exists(info_path):
+        with open(info_path) as f:
+            series_start = json.load(f)
+    else:
+        info = fetch_series_info([series_id for series_id, _, _ in series], api_key, **fetch_kwargs)
+        series_start = {series_id: meta['observation_start'] for series_id, meta in info.items()}
+        write_atomic(info_path, series_start)
+
+    # Plan every chunk and keep only the ones without a checkpoint
+    chunks = []
+    for series_id, _, _ in series:
+        first = date.fromisoformat(max(series_start[series_id], start or '0001-01-01'))
+        chunks += [(series_id, period) for period in chunk_periods(first, end, chunk_years)]
+    pending = [(series_id, period) for series_id, period in chunks
+               if not os.path.exists(chunk_path(checkpoint_dir, series_id, period))]
+    print(f"Backfill: {len(chunks)} chunks, {len(chunks) - len(pending)} already checkpointed")
+
+    def checkpoint(index, result):
+        series_id, period = pending[index]
+        write_atomic(chunk_path(checkpoint_dir, series_id, period), result.observations)
+        print(f"Checkpointed {series_id} {period[0]}..{period[1]}: "
+              f"{len(result.observations)} obs in {result.elapsed:.2f}s")
+        emit('fetch_chunk', {'Duration': round(result.elapsed * 1000, 3),
+                             'Wait': round(result.waited * 1000, 3),
+                             'Rows': len(result.observations), 'Bytes': result.nbytes},
+             service='backfill', series=series_id, period=period)
+
+    with span('fetch', service='backfill') as metrics:
+        fetch_many([observation_job(series_id, period) for series_id, period in pending],
+                   api_key, on_result=checkpoint, **fetch_kwargs)
+        metrics['Requests'] = len(pending)
+
+    # Assemble each series from its chunks and align the whole history at once
+    observations = {series_id: [] for series_id, _, _ in series}
+    for series_id, period in chunks:
+        with open(chunk_path(checkpoint_dir, series_id, period)) as f:
+            observations[series_id] += json.load(f)
+    long_df = observations_to_long(observations)
+
+    if storage != 'wide':
+        # Observations go in one year per transaction, whatever the other series hold
+        observed = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        for year, long_year in long_df.groupby(long_df['date'].dt.year):
+            with span('upsert_observations', service='backfill', year=year) as metrics:
+                counts = upsert_observations(conn, long_year)
+                metrics.update({name.title(): n for name, n in counts.items()})
+            for k in observed:
+                observed[k] += counts[k]
+            print(f"Loaded observations {year}: {counts}")
+        with span('refresh_wide_view', service='backfill'):
+            refresh_wide_view(conn)
+        print("Observations backfilled:", observed)
+        if storage == 'long':
+            return observed
+
+    daily_ids = [series_id for series_id, _, freq in series if freq == 'daily']
+    daily_dates = long_df.loc[long_df['series_id'].isin(daily_ids), 'date']
+    calendar_start = daily_dates.min() if len(daily_dates) else pd.Timestamp(end)
+    with span('align', service='backfill') as metrics:
+        df_final = align_long(long_df, calendar_start, end, series)
+        df_final = df_final.dropna().reset_index(drop=True)
+        metrics['Rows'] = len(df_final)
+
+    # Load one year per transaction, the upsert skips rows that are already stored
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    for year, df_year in df_final.groupby(df_final['date'].dt.year):
+        with span('bulk_upsert', service='backfill', year=year) as metrics:
+            counts = bulk_upsert(conn, df_year)
+            metrics.update({name.title(): n for name, n in counts.items()})
+        for k in totals:
+            totals[k] += counts[k]
+        print(f"Loaded {year}: {counts}")
+
+    print("Backfill complete:", totals)
+    return totals
+
+
+def clear_checkpoints(checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+    """Remove all checkpoint files so the next backfill starts from scratch"""
+    for path in glob.glob(os.path.join(checkpoint_dir, '*')):
+        os.remove(path)
@@ -0,0 +1,100 @@
+# Change detection so unchanged FRED series are not downloaded again
+# A small local metadata index remembers, per series, FRED's last_updated timestamp at the
+# last successful run and the next scheduled date of the series' release from the FRED
+# release calendar. Until that date comes the series is skipped without any API call; once
+# due, one light fred/series request tells whether it actually changed.
+# Only series whose frequency is in `check_frequencies` go through this check: daily series
+# change every business day, so checking them would cost as many calls as downloading them.
+
+import json
+import os
+from datetime import timedelta
+
+from Scrape_fred_fetch import fetch_many, fetch_series_info
+
+DEFAULT_INDEX_PATH = os.path.join(os.environ.get('FRED_CACHE_DIR', '/app/fred_cache'),
+                                  'series_meta.json')
+
+
+def load_index(path=DEFAULT_INDEX_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_index(index, path=DEFAULT_INDEX_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def plan_downloads(series, index, today, api_key, check_frequencies=('monthly',), **fetch_kwargs):
+    """Split `series` into (download, skipped, info): the series ids whose observations need
+    downloading, the ids that are unchanged since the last successful run, and the
+    fred/series metadata of the series that were checked"""
+
+    download, skipped, due = [], [], []
+    for series_id, _, freq in series:
+        meta = index.get(series_id, {})
+        if freq not in check_frequencies or 'last_updated' not in meta:
+            download.append(series_id)
+        elif meta.get('next_release') and today.isoformat() < meta['next_release']:
+            skipped.append(series_id)
+        else:
+            due.append(series_id)
+
+    info = fetch_series_info(due, api_key, **fetch_kwargs) if due else {}
+    for series_id in due:
+        if info[series_id]['last_updated'] == index[series_id]['last_updated']:
+            skipped.append(series_id)
+        else:
+            download.append(series_id)
+    return download, skipped, info
+
+
+def record_success(index, series, downloaded, info, today, api_key,
+                   check_frequencies=('monthly',), **fetch_kwargs):
+    """Update `index` after a successful write with the last_updated timestamp and next
+    release date of every checked-frequency series that was downloaded"""
+
+    tracked = [series_id for series_id, _, freq in series
+               if freq in check_frequencies and series_id in downloaded]
+    if not tracked:
+        return index
+
+    # Series metadata for first runs, when nothing was checked before downloading
+    missing = [series_id for series_id in tracked if series_id not in info]
+    if missing:
+        info = dict(info, **fetch_series_info(missing, api_key, **fetch_kwargs))
+
+    # Release ids never change, so they are looked up once per series
+    unknown = [series_id for series_id in tracked if 'release_id' not in index.get(series_id, {})]
+    releases = fetch_many([('fred/series/release', {'series_id': series_id})
+                           for series_id in unknown], api_key, **fetch_kwargs)
+    for series_id, r in zip(unknown, releases):
+        index.setdefault(series_id, {})['release_id'] = r.data['releases'][0]['id']
+
+    # Next scheduled release after today, shared by series from the same release
+    release_ids = sorted({index[series_id]['release_id'] for series_id in tracked})
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    dates = fetch_many([('fred/release/dates', {'release_id': release_id,
+                                                'realtime_start': tomorrow,
+                                                'realtime_end': '9999-12-31',
+                                                'include_release_dates_with_no_data': 'true',
+                                                'sort_order': 'asc',
+                                                'limit': 1})
+                        for release_id in release_ids], api_key, **fetch_kwargs)
+    next_release = {release_id: (r.data['release_dates'][0]['date'] if r.data['release_dates']
+                                 else None)
+                    for release_id, r in zip(release_ids, dates)}
+
+    for series_id in tracked:
+        meta = index[series_id]
+        meta['last_updated'] = info[series_id]['last_updated']
+        meta['next_release'] = next_release[meta['release_id']]
+        meta['downloaded'] = today.isoformat()
+    return index
@@ -0,0 +1,264 @@
+# Steps of the daily update shared by its two entry points
+#   Scrape_python_script.main()  aligns the observations in a pandas frame
+#   Scrape_lean.main()           scatters them onto a numpy grid as they arrive and writes
+#                                CSV straight from it, in memory that does not grow with
+#                                econ_metrics
+# Both go through a DailyRun: plan the downloads from the watermarks and FRED's release
+# metadata, fetch, and after their own write path alert on stale data, record the
+# successful downloads, update the analytics, publish the dashboard snapshot and verify
+# the write. Nothing here imports pandas; the snapshot step imports it when
+# ECON_SNAPSHOT_URI is set.
+
+import os
+import sys
+import time
+from datetime import datetime
+
+from App_config import load_secrets, metrics_table
+from App_metrics import span, emit, PRINT_FRAMES
+from Scrape_series import SERIES
+from Scrape_fred_fetch import fetch_observations, TokenBucket, FRED_REQUESTS_PER_MINUTE
+from Scrape_fred_cache import cache_from_env
+from Scrape_db import (connect_to_db, read_watermarks, read_stored_values, incremental_periods,
+                       verify_dates, print_table)
+from Scrape_change_detect import load_index, save_index, plan_downloads, record_success
+from Scrape_migrations import migrate
+from Scrape_analytics import update_analytics
+from Scrape_long_store import (ensure_schema, refresh_wide_view, read_long_watermarks,
+                               verify_observations)
+
+
+def connect():
+    secrets = load_secrets()
+    conn = connect_to_db(secrets['DB_NAME'], secrets['DB_USER'], secrets['DB_PASSWORD'],
+                         secrets['DB_HOST'], secrets['DB_PORT'])
+    conn.autocommit = True
+    return conn
+
+
+def alert(topic, message):
+    """Send an SNS email alert; returns False when it could not be sent"""
+    # boto3 is only imported when an alert is sent
+    import boto3
+    from botocore.exceptions import ClientError
+    sns = boto3.client('sns', region_name='us-east-1')
+    try:
+        with span('sns_publish', topic=topic):
+            response = sns.publish(TopicArn=f'arn:aws:sns:us-east-1:307103213532:{topic}',
+                                   Message=message)
+        print(f"Email alert sent with message ID: {response['MessageId']}")
+        return True
+    except ClientError as e:
+        print(f"Failed to send email alert: {e.response['Error']['Message']}")
+        return False
+
+
+class DailyRun:
+    """One daily update of econ_metrics and/or the long store, see the notes at the top.
+
+    window: 'incremental' fetches from each series' high-water mark, 'fixed' downloads
+    the last 31 days of daily and 75 days of monthly data
+    storage: 'wide', 'long' or 'both'"""
+
+    def __init__(self, window, storage):
+        # FRED key availabe at https://fred.stlouisfed.org/docs/api/api_key.html
+        self.api_key = load_secrets()['FRED_KEY']
+        self.window = window
+        self.storage = storage
+        self.table = metrics_table(storage)
+        # Each stage is timed by a span and logged in CloudWatch Embedded Metric Format
+        # (App_metrics.py), ECON_PROFILE=0 turns that off
+        self.started = time.perf_counter()
+        self.today = datetime.today().date()
+
+        with span('connect'):
+            self.conn = connect()
+        self.cur = self.conn.cursor()
+        # Bring the econ_metrics schema up to date; a no-op once every migration is applied
+        with span('migrate'):
+            migrate(self.conn)
+            if storage != 'wide':
+                ensure_schema(self.conn)
+
+    def plan(self):
+        """Download windows and the series to download; sets `start`, the first day of
+        the aligned calendar"""
+        # Incremental mode starts each series at its high-water mark minus a revision
+        # lookback, so daily runs fetch a handful of rows and missed days are caught up
+        # automatically. The long store has its own per-series watermarks, not held back
+        # by lagging series
+        with span('read_watermarks'):
+            if self.window != 'incremental':
+                watermarks = {}
+            elif self.storage == 'long':
+                watermarks = read_long_watermarks(self.cur)
+            else:
+                watermarks = read_watermarks(self.cur)
+        print("Watermarks:", watermarks)
+        self.windows = incremental_periods(watermarks, datetime.today())
+        # The aligned calendar starts with the earliest daily series window
+        self.start = datetime.strptime(min(self.windows[series_id][0] for series_id, _, freq
+                                           in SERIES if freq == 'daily'), '%Y-%m-%d').date()
+
+        # All API calls share one token bucket matching FRED's quota
+        # FRED_REQUESTS_PER_MINUTE can lower the rate if the API key is shared with other jobs
+        rpm = int(os.environ.get('FRED_REQUESTS_PER_MINUTE', FRED_REQUESTS_PER_MINUTE))
+        self.bucket = TokenBucket(rpm)
+        # FRED_MAX_WORKERS bounds the download threads, e.g. when run next to the dashboard
+        self.max_workers = int(os.environ.get('FRED_MAX_WORKERS', 10))
+
+        # Monthly series are only downloaded when FRED's release calendar says a new
+        # release is due and their last_updated timestamp changed since the last success
+        self.meta_index = load_index()
+        with span('plan_downloads') as metrics:
+            self.download, self.skipped, self.info = plan_downloads(
+                SERIES, self.meta_index, self.today, self.api_key,
+                bucket=self.bucket, max_workers=self.max_workers)
+            metrics['Skipped'] = len(self.skipped)
+        print("Unchanged series skipped:", self.skipped)
+
+    def fetch(self, on_result=None):
+        """{series_id: FetchResult} of the planned downloads, fetched concurrently under
+        the token bucket. `on_result(index, result)` is called from the fetch thread as
+        each response arrives and may release its observations."""
+        counts = {}
+
+        def received(index, result):
+            counts[result.series_id] = len(result.observations)
+            if on_result is not None:
+                on_result(index, result)
+
+        # Responses are cached on disk so reruns within the TTL use no API quota. Series
+        # whose last_updated changed are never answered from the cache: a body cached
+        # before the release would be written while record_success stores the new
+        # timestamp, and the release would then be skipped for good
+        cache = cache_from_env()
+        periods = [(series_id, self.windows[series_id]) for series_id in self.download]
+        changed = [series_id for series_id in self.download if series_id in self.info]
+        with span('fetch') as metrics:
+            fetched = fetch_observations(periods, api_key=self.api_key, bucket=self.bucket,
+                                         cache=cache, max_workers=self.max_workers,
+                                         on_result=received, refresh=changed)
+            metrics['Rows'] = sum(counts.values())
+            metrics['Bytes'] = sum(r.nbytes for r in fetched.values())
+        # The series were fetched concurrently, each one's own timings come with its result
+        for r in fetched.values():
+            print(f"Fetched {r.series_id}: {counts[r.series_id]} obs, {r.nbytes} bytes, "
+                  f"waited {r.waited:.2f}s, request {r.elapsed:.2f}s"
+                  + (" (cached)" if r.cached else ""))
+            emit('fetch_series', {'Duration': round(r.elapsed * 1000, 3),
+                                  'Wait': round(r.waited * 1000, 3),
+                                  'Rows': counts[r.series_id], 'Bytes': r.nbytes},
+                 series=r.series_id, cached=r.cached, attempts=r.attempts)
+        if cache is not None:
+            print("FRED cache:", cache.stats())
+            cache.close()
+        return fetched
+
+    def read_stored(self):
+        """{series_id: [(date, value)]} of the skipped series over the calendar, so the
+        forward fill of monthly series carries on into the new dates"""
+        with span('read_stored_values') as metrics:
+            stored = read_stored_values(self.cur, self.start,
+                                        [s for s in SERIES if s[0] in self.skipped])
+            metrics['Rows'] = sum(len(values) for values in stored.values())
+        return stored
+
+    def write_observations(self, upsert):
+        """Upsert the fetched observations into the long store with `upsert(conn)`, then
+        refresh the dashboard's wide view without blocking its readers"""
+        with span('upsert_observations') as metrics:
+            counts = upsert(self.conn)
+            metrics.update({name.title(): n for name, n in counts.items()})
+        print("Observations inserted: {inserted}, updated: {updated}, "
+              "skipped: {skipped}".format(**counts))
+        with span('refresh_wide_view'):
+            refresh_wide_view(self.conn)
+
+    def write_rows(self, upsert):
+        """Insert new dates and apply FRED revisions to existing dates of econ_metrics with
+        `upsert(conn)`, one COPY round trip in a single transaction"""
+        with span('bulk_upsert') as metrics:
+            counts = upsert(self.conn)
+            metrics.update({name.title(): n for name, n in counts.items()})
+        print("Rows inserted: {inserted}, updated: {updated}, skipped: {skipped}".format(**counts))
+
+    def alert_if_stale(self, latest=None):
+        """SNS alert when the newest stored date is more than 10 days old; `latest` is the
+        newest aligned date, the stored watermarks are read when there is none"""
+        if self.storage == 'long':
+            latest = max(filter(None, read_long_watermarks(self.cur).values()), default=None)
+        elif latest is None:
+            latest = max(filter(None, read_watermarks(self.cur).values()), default=None)
+        days_difference = (self.today - latest).days if latest else sys.maxsize
+        print("# days DB not updated:", days_difference)
+        if days_difference > 10:
+            alert('econ_daily_db', 'The database has not been updated for more than 10 days.')
+
+    def finish(self, written_dates=(), pairs=()):
+        """Everything after the write: remember the downloads, update the analytics,
+        publish the snapshot and verify the `written_dates` of econ_metrics and the
+        (series_id, date) `pairs` of the long store"""
+        # Remember what was downloaded so unchanged series are skipped on the next run
+        save_index(record_success(self.meta_index, SERIES, self.download, self.info,
+                                  self.today, self.api_key, bucket=self.bucket,
+                                  max_workers=self.max_workers))
+
+        # Bring the Confidence analytics up to the new rows; they are derived data, so a
+        # failure is reported and the next run catches up
+        try:
+            with span('update_analytics') as metrics:
+                metrics['Rows'] = update_analytics(self.conn, self.table)['rows']
+        except Exception as e:
+            print(f"Analytics not updated: {e!r}")
+
+        self.publish_snapshot()
+
+        # Confirm what was written with a few index probes instead of reading the whole
+        # table back; ECON_PRINT_FRAMES=1 prints every row, streamed through a server-side
+        # cursor
+        with span('verify') as metrics:
+            if self.storage != 'wide':
+                pairs = set(pairs)
+                print(f"Verified {verify_observations(self.cur, pairs)} of {len(pairs)} "
+                      "observations")
+            written_dates = set(written_dates)
+            found, rows, latest = verify_dates(self.cur, written_dates, self.table)
+            metrics['Rows'] = rows
+        print("Data from AWS RDS PostgreSQL!")
+        print(f"{self.table}: {rows} rows up to {latest}, {found} of {len(written_dates)} "
+              "written dates found")
+        if PRINT_FRAMES:
+            print_table(self.conn, self.table)
+        self.conn.close()
+
+    def publish_snapshot(self):
+        """Publish the dashboard snapshot; the rows are already committed, so a failure
+        only leaves the dashboard on the previous snapshot"""
+        # The snapshot needs the whole table as a frame, pandas is only imported when
+        # ECON_SNAPSHOT_URI is set
+        if not os.environ.get('ECON_SNAPSHOT_URI'):
+            return
+        from App_snapshot import snapshot_store, render_figure, publish_snapshot
+        from Scrape_analytics import read_analytics
+        from Scrape_db import read_metrics
+        try:
+            snapshots = snapshot_store()
+            with span('read_metrics') as metrics:
+                df_all = read_metrics(self.cur, self.table)
+                metrics['Rows'] = len(df_all)
+            try:
+                analytics = read_analytics(self.cur)
+            except Exception as e:
+                print(f"Snapshot published without analytics: {e!r}")
+                analytics = None
+            with span('publish_snapshot'):
+                publish_snapshot(snapshots, df_all, render_figure(df_all), analytics=analytics)
+        except Exception as e:
+            print(f"Snapshot not published: {e!r}")
+
+    def report(self, metrics=None, **properties):
+        """Log the run's duration and any other `metrics`"""
+        emit('run', {'Duration': round((time.perf_counter() - self.started) * 1000, 3),
+                     **(metrics or {})},
+             storage=self.storage, window=self.window, **properties)
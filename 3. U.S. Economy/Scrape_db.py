@@ -0,0 +1,172 @@
+# Database helpers for the econ_metrics table on AWS RDS PostgreSQL
+# Database table already created by a Lambda function
+# https://github.com/Strata-Scratch/api-youtube/blob/main/importing_df_to_db_final.ipynb
+
+import io
+from datetime import timedelta
+
+import psycopg2 as ps # needed to establish connection with AWS RDS
+
+from Scrape_series import SERIES, COLUMNS
+
+# Fixed download windows used when a series has no rows in econ_metrics yet
+DEFAULT_WINDOW_DAYS = {'daily': 31, 'monthly': 75}
+
+# How far before the high-water mark to re-request observations so FRED revisions
+# are picked up; monthly series need their last release to forward fill the calendar
+REVISION_LOOKBACK_DAYS = {'daily': 7, 'monthly': 75}
+
+
+def connect_to_db(dbname, user, password, host, port):
+    try:
+        conn = ps.connect(
+            dbname=dbname,
+            user=user,
+            password=password,
+            host=host,
+            port=port
+        )
+    except ps.OperationalError as e:
+        raise e
+    else:
+        print('Connected!')
+        return conn
+
+
+def read_watermarks(cur, series=SERIES):
+    """Latest date stored per series in econ_metrics as {series_id: date or None},
+    read in a single aggregate query"""
+    aggregates = ', '.join(f'MAX(date) FILTER (WHERE {col} IS NOT NULL)' for _, col, _ in series)
+    cur.execute(f'SELECT {aggregates} FROM econ_metrics')
+    row = cur.fetchone()
+    return {series_id: mark for (series_id, _, _), mark in zip(series, row)}
+
+
+def read_stored_values(cur, since, series=SERIES):
+    """Stored values of `series` from `since` onwards plus the latest one before it, as
+    {series_id: [(date, value), ...]}, read in a single query"""
+    if not series:
+        return {}
+    queries = ' UNION ALL '.join(
+        f"""(SELECT %(id{i})s, date, {col}::float8 FROM econ_metrics
+             WHERE {col} IS NOT NULL AND date >= %(since)s)
+            UNION ALL
+            (SELECT %(id{i})s, date, {col}::float8 FROM econ_metrics
+             WHERE {col} IS NOT NULL AND date < %(since)s ORDER BY date DESC LIMIT 1)"""
+        for i, (_, col, _) in enumerate(series))
+    params = {f'id{i}': series_id for i, (series_id, _, _) in enumerate(series)}
+    cur.execute(queries, dict(params, since=since))
+    values = {}
+    for series_id, mark, value in cur.fetchall():
+        values.setdefault(series_id, []).append((mark, value))
+    return values
+
+
+def read_metrics(cur, table='econ_metrics'):
+    """All of econ_metrics (or its long-format view) as a frame ordered by date, numeric
+    columns as float64"""
+    # pandas is only imported here, so the lean daily update (Scrape_lean.py) can use this
+    # module without it
+    import pandas as pd
+    cur.execute(f'SELECT * FROM {table} ORDER BY date')
+    columns = [c.name for c in cur.description]
+    df = pd.DataFrame(cur.fetchall(), columns=columns)
+    for col in columns[1:]:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+
+def incremental_periods(watermarks, today, lookback_days=None, series=SERIES):
+    """Observation window per series as {series_id: [start, end]} date strings.
+
+    Each window starts at the series' high-water mark minus its revision lookback,
+    so a run after missed days catches up automatically. Series without a
+    watermark fall back to the fixed DEFAULT_WINDOW_DAYS window."""
+    lookback_days = lookback_days or REVISION_LOOKBACK_DAYS
+    periods = {}
+    for series_id, _, freq in series:
+        mark = watermarks.get(series_id)
+        if mark is None:
+            start = today - timedelta(days=DEFAULT_WINDOW_DAYS[freq])
+        else:
+            start = min(mark, today.date()) - timedelta(days=lookback_days[freq])
+        periods[series_id] = [start.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')]
+    return periods
+
+
+def bulk_upsert(conn, df_final, columns=COLUMNS):
+    """Write df_final (date column plus `columns`) into econ_metrics in one transaction.
+
+    The frame is streamed with a single COPY into a temporary staging table, then
+    merged with one INSERT ... ON CONFLICT (date) DO UPDATE: new dates are inserted and
+    dates whose values changed (FRED revisions) are updated. NaNs never overwrite stored
+    values. Returns the number of
+    rows inserted, updated and skipped (already stored with identical values)."""
+
+    buf = io.StringIO()
+    df_final[['date'] + columns].to_csv(buf, index=False, header=False, date_format='%Y-%m-%d')
+    buf.seek(0)
+    return upsert_csv(conn, buf, len(df_final), columns)
+
+
+def upsert_csv(conn, buf, n_rows, columns=COLUMNS):
+    """bulk_upsert of `n_rows` CSV lines (date, then `columns`, empty fields for missing
+    values) read from the file-like `buf`"""
+
+    cols = ', '.join(columns)
+    changed = ' OR '.join(f'm.{c} IS DISTINCT FROM COALESCE(EXCLUDED.{c}, m.{c})'
+                          for c in columns)
+    assignments = ', '.join(f'{c} = COALESCE(EXCLUDED.{c}, m.{c})' for c in columns)
+
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute('CREATE TEMP TABLE econ_stage (LIKE econ_metrics) ON COMMIT DROP')
+            cur.copy_expert(f'COPY econ_stage (date, {cols}) FROM STDIN WITH (FORMAT csv)', buf)
+            # Dates not stored yet are inserted, every other merged row was updated; the
+            # split of the counts may be off while another writer runs, the merge is not
+            cur.execute("""SELECT count(*) FROM (SELECT DISTINCT date FROM econ_stage) s
+                           WHERE NOT EXISTS (SELECT 1 FROM econ_metrics m WHERE m.date = s.date)""")
+            inserted = cur.fetchone()[0]
+            # Unchanged dates are left alone by the WHERE and not counted in rowcount
+            cur.execute(f"""INSERT INTO econ_metrics AS m (date, {cols})
+                            SELECT DISTINCT ON (date) date, {cols} FROM econ_stage
+                            ORDER BY date
+                            ON CONFLICT (date) DO UPDATE SET {assignments}
+                            WHERE {changed}""")
+            updated = cur.rowcount - inserted
+    finally:
+        conn.autocommit = autocommit
+
+    return {'inserted': inserted, 'updated': updated,
+            'skipped': n_rows - inserted - updated}
+
+
+def verify_dates(cur, dates, table='econ_metrics'):
+    """(dates of `dates` found in `table`, rows in `table`, latest date): a check of what
+    was just written that reads a handful of rows, not the whole table"""
+    cur.execute(f'SELECT count(*) FROM {table} WHERE date = ANY(%s::date[])',
+                (sorted(set(dates)),))
+    found = cur.fetchone()[0]
+    cur.execute(f'SELECT count(*), max(date) FROM {table}')
+    rows, latest = cur.fetchone()
+    return found, rows, latest
+
+
+def print_table(conn, table='econ_metrics', itersize=2000):
+    """Print every row of `table` through a server-side cursor, `itersize` rows in memory
+    at a time"""
+    # Server-side cursors live in a transaction
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn.cursor(name=f'print_{table}') as cur:
+            cur.itersize = itersize
+            cur.execute(f'SELECT * FROM {table} ORDER BY date')
+            for row in cur:
+                print(row)
+        conn.rollback()
+    finally:
+        conn.autocommit = autocommit
+
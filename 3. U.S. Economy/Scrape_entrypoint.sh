@@ -1,16 +1,13 @@
 # /bin/bash -c "source /app/env.source"
 
-yum remove python3-pip -y
-yum install wget -y
-yum install which -y
-yum install findutils -y
-wget https://bootstrap.pypa.io/get-pip.py
-python3 get-pip.py
-
-yum install vim-minimal -y
-# yum install python-pip -y
-pip install -r requirements.txt
-python3 daily_update.py
+# Dependencies are installed when the image is built, see the Dockerfile
+# For troubleshooting tools inside a running task:
+# yum install wget which findutils vim-minimal -y
+# ECON_INGEST=lean runs the low-memory daily update, see Scrape_lean.py
+if [ "$ECON_INGEST" = "lean" ]; then
+    exec python3 Scrape_lean.py "$@"
+fi
+exec python3 daily_update.py "$@"
 # python3 -v daily_update.py
     # adds verbose output logs, good for debugging
-# tail -f /dev/null   # to keep the task running so it can be troubleshot
\ No newline at end of file
+# tail -f /dev/null   # to keep the task running so it can be troubleshot
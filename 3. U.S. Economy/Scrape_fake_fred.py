@@ -0,0 +1,153 @@
+# Local fake of the FRED HTTP API for exercising the fetch engine without an API key
+# Serves fred/series/observations with deterministic synthetic data: daily series get
+# weekday observations, monthly series one observation on the 1st of each month.
+# fred/series returns metadata with a fixed observation_start and a last_updated
+# timestamp that can be changed through server.last_updated. Every series belongs to its
+# own release, scheduled on the 15th of each month for monthly series and on weekdays
+# for daily ones (fred/series/release and fred/release/dates).
+# Optional per-request latency and a requests-per-minute limit answered with HTTP 429
+# like the real API.
+#
+# Usage: python3 Scrape_fake_fred.py 8081
+# then point the fetch engine at base_url='http://127.0.0.1:8081/'
+
+import json
+import math
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from Scrape_series import SERIES
+
+MONTHLY = {series_id for series_id, _, freq in SERIES if freq == 'monthly'}
+
+# First observation served for every series
+OBSERVATION_START = '1990-01-01'
+
+
+def synthetic_observations(series_id, start, end):
+    """Deterministic observations for `series_id` between two 'YYYY-MM-DD' strings"""
+    start, end = date.fromisoformat(start), date.fromisoformat(end)
+    seed = zlib.crc32(series_id.encode()) % 1000
+    observations = []
+    day = start
+    while day <= end:
+        monthly = series_id in MONTHLY
+        if (monthly and day.day == 1) or (not monthly and day.weekday() < 5):
+            n = day.toordinal()
+            value = 100 + seed + 10 * math.sin(n / 30.0 + seed)
+            observations.append({'realtime_start': end.isoformat(),
+                                 'realtime_end': end.isoformat(),
+                                 'date': day.isoformat(),
+                                 'value': '%.2f' % value})
+        day += timedelta(days=1)
+    return observations
+
+
+class FakeFredServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, requests_per_minute=None):
+        super().__init__(address, FakeFredHandler)
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.request_times = deque()
+        self.request_count = 0
+        self.rejected_count = 0
+        # Wall clock time of the first request, for time-to-first-API-call measurements
+        self.first_request_at = None
+        # {series_id: 'YYYY-MM-DD HH:MM:SS-05'}, series not listed were updated today
+        self.last_updated = {}
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d/' % self.server_address[:2]
+
+    def over_limit(self):
+        # Sliding one-minute window, same unit as FRED's quota
+        now = time.monotonic()
+        with self.lock:
+            self.request_count += 1
+            if self.first_request_at is None:
+                self.first_request_at = time.time()
+            while self.request_times and now - self.request_times[0] > 60:
+                self.request_times.popleft()
+            if self.requests_per_minute and len(self.request_times) >= self.requests_per_minute:
+                self.rejected_count += 1
+                return True
+            self.request_times.append(now)
+            return False
+
+
+class FakeFredHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if self.server.over_limit():
+            return self.send_json(429, {'error_code': 429,
+                                        'error_message': 'Too Many Requests.  Exceeded Rate Limit'})
+        time.sleep(self.server.latency)
+        if url.path.rstrip('/') == '/fred/series/observations':
+            start = max(params.get('observation_start', OBSERVATION_START), OBSERVATION_START)
+            observations = synthetic_observations(params['series_id'], start,
+                                                  params.get('observation_end',
+                                                             date.today().isoformat()))
+            return self.send_json(200, {'count': len(observations),
+                                        'observations': observations})
+        if url.path.rstrip('/') == '/fred/series':
+            series_id = params['series_id']
+            monthly = series_id in MONTHLY
+            updated = self.server.last_updated.get(series_id,
+                                                   date.today().isoformat() + ' 07:00:00-05')
+            return self.send_json(200, {'seriess': [{
+                'id': series_id,
+                'observation_start': OBSERVATION_START,
+                'observation_end': date.today().isoformat(),
+                'frequency': 'Monthly' if monthly else 'Daily',
+                'frequency_short': 'M' if monthly else 'D',
+                'last_updated': updated}]})
+        if url.path.rstrip('/') == '/fred/series/release':
+            release_id = zlib.crc32(params['series_id'].encode()) % 100000
+            return self.send_json(200, {'releases': [{'id': release_id,
+                                                      'name': 'Release ' + params['series_id']}]})
+        if url.path.rstrip('/') == '/fred/release/dates':
+            release_id = int(params['release_id'])
+            monthly = any(zlib.crc32(s.encode()) % 100000 == release_id for s in MONTHLY)
+            day = date.fromisoformat(params.get('realtime_start', date.today().isoformat()))
+            while (monthly and day.day != 15) or (not monthly and day.weekday() >= 5):
+                day += timedelta(days=1)
+            return self.send_json(200, {'release_dates': [{'release_id': release_id,
+                                                           'date': day.isoformat()}]})
+        self.send_json(404, {'error_code': 404, 'error_message': 'Not Found'})
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_fred(port=0, latency=0.0, requests_per_minute=None):
+    """Start the fake server on a background thread and return it, use .base_url"""
+    server = FakeFredServer(('127.0.0.1', port), latency, requests_per_minute)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = FakeFredServer(('127.0.0.1', port))
+    print('Fake FRED API at', server.base_url)
+    server.serve_forever()
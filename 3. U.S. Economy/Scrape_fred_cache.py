@@ -0,0 +1,110 @@
+# Persistent response cache in front of the FRED API
+# Responses are stored zlib-compressed in a small SQLite file keyed on the request
+# parameters (series id, observation window, realtime window), expire after a TTL that
+# depends on the series' release frequency, and the least recently used entries are
+# evicted once the cache grows past its size cap. Series that change detection found to
+# have a new release are requested past the cache (fetch_many's `refresh`), so a body
+# cached before the release is never written under the new last_updated.
+# In replay mode entries never expire and a miss raises CacheMiss instead of calling the
+# API, so recorded responses can be replayed offline.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Seconds a cached response stays fresh: daily series publish once per business day,
+# monthly series once a month
+DEFAULT_TTL = {'daily': 6 * 3600, 'monthly': 24 * 3600}
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+class FredCache:
+
+    def __init__(self, path, ttl=None, max_bytes=DEFAULT_MAX_BYTES, replay=False):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                               key TEXT PRIMARY KEY,
+                               series_id TEXT,
+                               body BLOB,
+                               size INTEGER,
+                               created REAL,
+                               accessed REAL)""")
+
+    @staticmethod
+    def key(path, parameters):
+        """Cache key from the API path and request parameters, without the API key"""
+        params = {k: v for k, v in parameters.items() if k not in ('api_key', 'file_type')}
+        return path + '?' + json.dumps(params, sort_keys=True)
+
+    def get(self, key, freq='daily'):
+        """Cached response body as bytes, or None when missing or expired"""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT body, created FROM responses WHERE key = ?',
+                                  (key,)).fetchone()
+            if row is None or (not self.replay and now - row[1] > self.ttl[freq]):
+                self.misses += 1
+                if self.replay:
+                    raise CacheMiss(key)
+                return None
+            self.db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return zlib.decompress(row[0])
+
+    def put(self, key, series_id, body):
+        if self.replay:
+            return
+        blob = zlib.compress(body)
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                            (key, series_id, blob, len(blob), now, now))
+            self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache fits under max_bytes
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute(
+                'SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def close(self):
+        self.db.close()
+
+
+def cache_from_env():
+    """FredCache configured by FRED_CACHE_DIR, FRED_CACHE_MAX_MB and FRED_CACHE_MODE
+    ('off', 'on' or 'replay'); returns None when the cache is turned off"""
+    mode = os.environ.get('FRED_CACHE_MODE', 'on')
+    if mode == 'off':
+        return None
+    path = os.path.join(os.environ.get('FRED_CACHE_DIR', '/app/fred_cache'), 'fred_cache.sqlite')
+    max_bytes = int(float(os.environ.get('FRED_CACHE_MAX_MB', 50)) * 1024 * 1024)
+    return FredCache(path, max_bytes=max_bytes, replay=(mode == 'replay'))
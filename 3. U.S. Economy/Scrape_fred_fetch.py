@@ -0,0 +1,163 @@
+# Concurrent, rate-limited fetch engine for the FRED API
+# Replaces the sequential sleep(31) loop of the daily update script: requests run in a
+# thread pool and each one takes a token from a shared token bucket sized to FRED's
+# real quota (requests per minute), so all series return as soon as the quota allows.
+# The base URL is configurable so the engine can run against Scrape_fake_fred.py locally.
+# An optional FredCache (Scrape_fred_cache.py) answers repeated requests without using quota.
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from Scrape_series import FREQUENCY
+
+# FRED_BASE_URL points the engine at another server, e.g. Scrape_fake_fred.py
+FRED_URL = os.environ.get('FRED_BASE_URL', 'https://api.stlouisfed.org/')
+
+# FRED allows 120 requests per minute per API key
+# https://fred.stlouisfed.org/docs/api/fred/errors.html
+FRED_REQUESTS_PER_MINUTE = 120
+
+
+class FetchResult(namedtuple('FetchResult', ['series_id', 'data', 'waited', 'elapsed', 'nbytes',
+                                             'attempts', 'cached'])):
+    """Per-request outcome: decoded JSON plus timings in seconds and payload size in bytes,
+    attempts is 0 when the response came from the cache"""
+    __slots__ = ()
+
+    @property
+    def observations(self):
+        return self.data['observations']
+
+
+class TokenBucket:
+    """Thread-safe token bucket that never lets more than `requests_per_minute` requests
+    start in any 60 second window.
+
+    `capacity` is the burst size, by default 5 seconds of quota. The bucket starts full,
+    so the refill rate is lowered by the burst: over any minute the tokens held at its
+    start plus those refilled during it stay within the quota."""
+
+    def __init__(self, requests_per_minute=FRED_REQUESTS_PER_MINUTE, capacity=None):
+        if capacity is None:
+            capacity = max(1, requests_per_minute // 12)
+        self.capacity = float(min(max(1, capacity), requests_per_minute))
+        # The first request of a window takes a token already held, so a burst of one
+        # costs nothing
+        self.rate = (requests_per_minute - self.capacity + 1) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a token is available and return the seconds spent waiting."""
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return time.monotonic() - start
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def fred_request(path, parameters, api_key, base_url=FRED_URL, session=None, timeout=30):
+    """Single FRED API request returning the response, parameters as in fredpy's
+    fred_api_request"""
+    params = dict(parameters, api_key=api_key, file_type='json')
+    http = session or requests
+    return http.get(base_url.rstrip('/') + '/' + path, params=params, timeout=timeout)
+
+
+def fetch_many(jobs, api_key, requests_per_minute=FRED_REQUESTS_PER_MINUTE, max_workers=10,
+               base_url=FRED_URL, retries=3, bucket=None, cache=None, on_result=None,
+               refresh=()):
+    """Run every (path, parameters) request in `jobs` concurrently under a token bucket
+    and return a list of FetchResult in the same order.
+
+    A 429 (rate limit) or 5xx response is retried with a fresh token after a backoff.
+    With a `cache`, fresh cached responses are returned without taking a token, except
+    for the series ids in `refresh`, which are always requested and re-cached.
+    `on_result(index, result)` is called from the worker thread as each request completes."""
+
+    bucket = bucket or TokenBucket(requests_per_minute)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fetch_one(index, path, parameters):
+        result = fetch_json(path, parameters)
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    def fetch_json(path, parameters):
+        series_id = parameters.get('series_id')
+        if cache is not None:
+            key = cache.key(path, parameters)
+            # A replayed run stays offline even for series known to have changed
+            if series_id not in refresh or cache.replay:
+                start = time.monotonic()
+                body = cache.get(key, FREQUENCY.get(series_id, 'daily'))
+                if body is not None:
+                    return FetchResult(series_id, json.loads(body), 0.0,
+                                       time.monotonic() - start, len(body), 0, True)
+        waited = 0.0
+        for attempt in range(1, retries + 2):
+            waited += bucket.acquire()
+            start = time.monotonic()
+            response = fred_request(path, parameters, api_key, base_url=base_url, session=session)
+            elapsed = time.monotonic() - start
+            if (response.status_code == 429 or response.status_code >= 500) and attempt <= retries:
+                backoff = 2 ** attempt
+                time.sleep(backoff)
+                waited += backoff
+                continue
+            response.raise_for_status()
+            data = response.json()
+            if cache is not None:
+                cache.put(key, series_id, response.content)
+            return FetchResult(series_id, data, waited, elapsed,
+                               len(response.content), attempt, False)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(fetch_one, index, path, parameters)
+                       for index, (path, parameters) in enumerate(jobs)]
+            return [future.result() for future in futures]
+    finally:
+        session.close()
+
+
+def observation_job(series_id, period):
+    """fred/series/observations request for one series over [start, end]"""
+    return ('fred/series/observations',
+            {'series_id': series_id, 'observation_start': period[0], 'observation_end': period[1]})
+
+
+def fetch_observations(periods, api_key, **kwargs):
+    """Download fred/series/observations for every (series_id, [start, end]) in `periods`
+    concurrently and return {series_id: FetchResult}, keyword arguments as in fetch_many"""
+    results = fetch_many([observation_job(series_id, period) for series_id, period in periods],
+                         api_key, **kwargs)
+    return {r.series_id: r for r in results}
+
+
+def fetch_series_info(series_ids, api_key, **kwargs):
+    """Series metadata from fred/series (observation_start, last_updated, frequency, ...)
+    as {series_id: dict}, keyword arguments as in fetch_many"""
+    results = fetch_many([('fred/series', {'series_id': series_id}) for series_id in series_ids],
+                         api_key, **kwargs)
+    return {r.series_id: r.data['seriess'][0] for r in results}
@@ -0,0 +1,123 @@
+# Low-memory daily update, the same steps as Scrape_python_script.main() with a footprint
+# that does not grow with econ_metrics
+#   - pandas is never imported: each series' JSON observations are scattered straight
+#     onto the AlignedGrid of the download calendar (Scrape_align.py) as they arrive from
+#     the fetch threads, and the JSON is released right after
+#   - the complete rows are written from that array through the same COPY upsert, and the
+#     long-format observations are streamed into their COPY buffer as CSV lines
+#   - the peak RSS of the run is printed and logged as the MaxRss metric
+# Everything else, from planning the downloads to verifying the write with index probes,
+# is the shared Scrape_daily.DailyRun. Publishing the dashboard snapshot (when
+# ECON_SNAPSHOT_URI is set) reads the whole table into a frame, the one step whose memory
+# still grows with econ_metrics.
+#
+# Usage: python3 Scrape_lean.py [--window incremental|fixed] [--storage wide|long|both]
+
+import argparse
+import io
+import resource
+import sys
+import threading
+
+import numpy as np
+
+from App_config import STORAGE_MODE
+from App_metrics import span
+from Scrape_align import AlignedGrid
+from Scrape_db import upsert_csv
+from Scrape_long_store import upsert_observations_csv
+from Scrape_daily import DailyRun
+
+
+def observation_arrays(observations):
+    """(datetime64[D] dates, float64 values) of FRED JSON observations, '.' as NaN"""
+    dates = np.array([o['date'] for o in observations], dtype='datetime64[D]')
+    values = np.array([float(o['value']) if o['value'] != '.' else np.nan
+                       for o in observations], dtype=np.float64)
+    return dates, values
+
+
+def rows_csv(dates, values):
+    """CSV lines of the aligned rows for Scrape_db.upsert_csv"""
+    buf = io.StringIO()
+    for day, row in zip(dates.astype(str), values.tolist()):
+        buf.write(day + ',' + ','.join(map(repr, row)) + '\n')
+    buf.seek(0)
+    return buf
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def main(window='incremental', storage=STORAGE_MODE):
+    """Scrape_python_script.main() in constant memory, see the notes at the top"""
+
+    run = DailyRun(window, storage)
+    run.plan()
+    grid = AlignedGrid(run.start, run.today)
+
+    # Each response is consumed in its fetch thread as soon as it arrives
+    long_buf, long_rows, pairs = io.StringIO(), [0], []
+    lock = threading.Lock()
+
+    def consume(index, result):
+        dates, values = observation_arrays(result.observations)
+        if storage != 'long':
+            grid.add(result.series_id, dates, values)
+        if storage != 'wide':
+            stored = ~np.isnan(values)
+            lines = ''.join(f'{result.series_id},{day},{value!r}\n' for day, value
+                            in zip(dates[stored].astype(str), values[stored].tolist()))
+            with lock:
+                long_buf.write(lines)
+                long_rows[0] += int(stored.sum())
+                pairs.extend((result.series_id, day) for day in dates[stored].tolist())
+        # Nothing else needs the JSON
+        result.observations.clear()
+
+    run.fetch(on_result=consume)
+
+    dates = values = None
+    if storage != 'long':
+        # Unchanged series carry on from their stored values
+        for series_id, rows in run.read_stored().items():
+            grid.add(series_id, np.array([mark for mark, _ in rows], dtype='datetime64[D]'),
+                     np.array([value for _, value in rows], dtype=np.float64))
+        with span('align') as metrics:
+            dates, values = grid.complete_rows()
+            metrics['Rows'] = len(dates)
+        print(f"Aligned rows: {len(dates)} of {grid.n_days} days complete")
+
+    if storage != 'wide':
+        long_buf.seek(0)
+        run.write_observations(lambda conn: upsert_observations_csv(conn, long_buf, long_rows[0]))
+        long_buf = None
+
+    run.alert_if_stale(dates.max().item() if dates is not None and len(dates) else None)
+
+    if storage != 'long':
+        run.write_rows(lambda conn: upsert_csv(conn, rows_csv(dates, values), len(dates)))
+
+    run.finish([] if dates is None else dates.tolist(), pairs)
+
+    rss = peak_rss()
+    print(f"Peak RSS: {rss / 2**20:.1f} MiB")
+    run.report({'MaxRss': rss}, mode='lean')
+    return {
+        'statusCode': 200,
+        'body': 'Database connection successful!'
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Low-memory daily update of econ_metrics')
+    parser.add_argument('--window', choices=['incremental', 'fixed'], default='incremental',
+                        help='download from per-series watermarks or fixed 31/75 day windows')
+    parser.add_argument('--storage', choices=['wide', 'long', 'both'], default=STORAGE_MODE,
+                        help='write econ_metrics, the long-format econ_observations, or both')
+    args = parser.parse_args()
+    main(window=args.window, storage=args.storage)
@@ -0,0 +1,148 @@
+# Long-format observation store: one row per (series_id, date) in econ_observations
+# The wide econ_metrics table only keeps dates where every series has a value, so a
+# series that lags FRED holds back the other series' rows, and those rows are fetched
+# again on every run. Here each observation is upserted on its own as soon as FRED
+# publishes it, and each row is stored exactly once under its composite primary key. A new
+# series needs an entry in Scrape_series.SERIES but no ALTER TABLE, and a read of one
+# metric only touches that metric's rows.
+# The dashboard reads the econ_metrics_wide materialized view. It has the same columns
+# as econ_metrics: one row per day that has any daily observation, daily series NULL
+# where they have no value yet, and monthly series forward filled from their latest
+# release. The view is refreshed concurrently after each write, so readers never block.
+# ECON_STORAGE (see App_config.STORAGE_MODE) selects 'wide', 'long', or 'both'.
+
+import io
+
+from Scrape_series import SERIES, ROUNDING
+
+OBSERVATIONS_TABLE = 'econ_observations'
+WIDE_VIEW = 'econ_metrics_wide'
+
+
+def view_sql(series=SERIES):
+    """SELECT of the wide view over econ_observations, one column per series"""
+    daily_ids = ', '.join(f"'{series_id}'" for series_id, _, freq in series if freq == 'daily')
+    columns = []
+    for series_id, col, freq in series:
+        if freq == 'daily':
+            value = f"max(o.value) FILTER (WHERE o.series_id = '{series_id}')"
+        else:
+            # As-of lookup of the latest release, a backward scan of the primary key
+            value = (f"(SELECT m.value FROM {OBSERVATIONS_TABLE} m "
+                     f"WHERE m.series_id = '{series_id}' AND m.date <= o.date "
+                     f"ORDER BY m.date DESC LIMIT 1)")
+        if col in ROUNDING:
+            value = f"round(({value})::numeric, {ROUNDING[col]})::float8"
+        columns.append(f'{value} AS {col.lower()}')
+    return f"""SELECT o.date, {', '.join(columns)}
+               FROM {OBSERVATIONS_TABLE} o
+               WHERE o.series_id IN ({daily_ids})
+               GROUP BY o.date"""
+
+
+def ensure_schema(conn, series=SERIES):
+    """Create econ_observations and the wide view, recreating the view when the series
+    catalog changed; safe to run on every start"""
+    expected = ['date'] + [col.lower() for _, col, _ in series]
+    with conn, conn.cursor() as cur:
+        cur.execute(f"""CREATE TABLE IF NOT EXISTS {OBSERVATIONS_TABLE} (
+                            series_id text NOT NULL,
+                            date date NOT NULL,
+                            value double precision NOT NULL,
+                            PRIMARY KEY (series_id, date))""")
+        cur.execute("""SELECT attname FROM pg_attribute
+                       WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+                       ORDER BY attnum""", (WIDE_VIEW,))
+        columns = [name for name, in cur.fetchall()]
+        if columns == expected:
+            return False
+        cur.execute(f'DROP MATERIALIZED VIEW IF EXISTS {WIDE_VIEW}')
+        cur.execute(f'CREATE MATERIALIZED VIEW {WIDE_VIEW} AS {view_sql(series)}')
+        # A unique index allows REFRESH ... CONCURRENTLY and serves the date range reads
+        cur.execute(f'CREATE UNIQUE INDEX {WIDE_VIEW}_date ON {WIDE_VIEW} (date)')
+    print(f"Created {WIDE_VIEW} with {len(series)} series")
+    return True
+
+
+def upsert_observations(conn, long_df):
+    """Write a long-format frame (series_id, date, value) into econ_observations in one
+    transaction, with one COPY and one INSERT ... ON CONFLICT. Missing values are not
+    stored, and for duplicate (series_id, date) pairs the later row wins. Returns the number of
+    observations inserted, updated (FRED revisions) and skipped (already stored)."""
+
+    rows = long_df[long_df['value'].notna()]
+    buf = io.StringIO()
+    rows[['series_id', 'date', 'value']].to_csv(buf, index=False, header=False,
+                                                date_format='%Y-%m-%d')
+    buf.seek(0)
+    return upsert_observations_csv(conn, buf, len(rows))
+
+
+def upsert_observations_csv(conn, buf, n_rows):
+    """upsert_observations of `n_rows` CSV lines (series_id, date, value), without
+    missing values, read from the file-like `buf`"""
+
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("""CREATE TEMP TABLE econ_obs_stage (
+                               seq bigserial, series_id text, date date, value double precision)
+                           ON COMMIT DROP""")
+            cur.copy_expert('COPY econ_obs_stage (series_id, date, value) FROM STDIN '
+                            'WITH (FORMAT csv)', buf)
+            # xmax is 0 only on rows the statement inserted
+            cur.execute(f"""INSERT INTO {OBSERVATIONS_TABLE} AS o (series_id, date, value)
+                            SELECT DISTINCT ON (series_id, date) series_id, date, value
+                            FROM econ_obs_stage ORDER BY series_id, date, seq DESC
+                            ON CONFLICT (series_id, date) DO UPDATE SET value = EXCLUDED.value
+                            WHERE o.value IS DISTINCT FROM EXCLUDED.value
+                            RETURNING (xmax = 0)""")
+            written = [inserted for inserted, in cur.fetchall()]
+    finally:
+        conn.autocommit = autocommit
+
+    inserted = sum(written)
+    return {'inserted': inserted, 'updated': len(written) - inserted,
+            'skipped': n_rows - len(written)}
+
+
+def refresh_wide_view(conn):
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {WIDE_VIEW}')
+    finally:
+        conn.autocommit = autocommit
+
+
+def read_long_watermarks(cur, series=SERIES):
+    """Latest stored date per series as {series_id: date or None}, one index probe each"""
+    if not series:
+        return {}
+    ids = [series_id for series_id, _, _ in series]
+    cur.execute(f"""SELECT s.id, (SELECT max(date) FROM {OBSERVATIONS_TABLE} o
+                                  WHERE o.series_id = s.id)
+                    FROM unnest(%s::text[]) AS s(id)""", (ids,))
+    return dict(cur.fetchall())
+
+
+def verify_observations(cur, pairs):
+    """How many of the (series_id, date) `pairs` are stored, one index probe each"""
+    pairs = sorted(set(pairs))
+    cur.execute(f"""SELECT count(*) FROM {OBSERVATIONS_TABLE} o
+                    JOIN unnest(%s::text[], %s::date[]) AS p(series_id, date)
+                      USING (series_id, date)""",
+                ([series_id for series_id, _ in pairs], [day for _, day in pairs]))
+    return cur.fetchone()[0]
+
+
+def read_series(cur, series_id, start=None, end=None):
+    """[(date, value)] of one series, optionally within [start, end]"""
+    cur.execute(f"""SELECT date, value FROM {OBSERVATIONS_TABLE}
+                    WHERE series_id = %s
+                      AND date >= coalesce(%s::date, '-infinity')
+                      AND date <= coalesce(%s::date, 'infinity')
+                    ORDER BY date""", (series_id, start, end))
+    return cur.fetchall()
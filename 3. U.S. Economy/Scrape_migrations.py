@@ -0,0 +1,222 @@
+# Managed schema migrations for econ_metrics, run by the daily update at startup
+# The table was created by a Lambda function with no key on date, so the old write path
+# checked each date with a SELECT that scanned the table. Migrations are applied in order,
+# once each, and recorded in schema_migrations. A PostgreSQL advisory lock serializes
+# concurrent runs, so a backfill and a daily update starting together apply each
+# migration once.
+#   001 creates econ_metrics when it does not exist yet (local and benchmark databases)
+#   002 removes duplicate and NULL dates, then adds PRIMARY KEY (date) INCLUDE (every
+#       column): one B-tree serves uniqueness, existence checks and the dashboard's
+#       date-range reads as index-only scans
+#   003 adds a BRIN index on date, a few pages for the whole append-only history, for
+#       wide range scans
+#   004 (optional, --partition or ECON_PARTITION=yearly) converts econ_metrics to yearly
+#       range partitions. Later runs create next year's partition ahead of time, and a
+#       default partition catches anything outside the yearly partitions.
+# check_plans() EXPLAINs the queries the pipeline and the dashboard run with the default
+# planner settings and confirms the date-range read uses the primary key or the BRIN index;
+# --capability only confirms that each query can use an index.
+#
+# Usage: python3 Scrape_migrations.py [--partition] [--check [--capability]]
+
+import argparse
+import json
+import os
+from datetime import date
+
+from Scrape_series import COLUMNS
+
+# Key of the advisory lock held while migrating ('econ')
+LOCK_KEY = 0x65636f6e
+
+PARTITION = os.environ.get('ECON_PARTITION') == 'yearly'
+
+TABLE = 'econ_metrics'
+
+
+def create_table(cur):
+    columns = ', '.join(f'{col} numeric' for col in COLUMNS)
+    cur.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} (date date, {columns})')
+
+
+def add_primary_key(cur):
+    cur.execute(f'DELETE FROM {TABLE} WHERE date IS NULL')
+    # Keep the most recently written row of each duplicated date
+    cur.execute(f"""DELETE FROM {TABLE} a USING {TABLE} b
+                    WHERE a.date = b.date AND a.ctid < b.ctid""")
+    if cur.rowcount:
+        print(f"Removed {cur.rowcount} duplicate rows from {TABLE}")
+    cur.execute(f"""ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey
+                    PRIMARY KEY (date) INCLUDE ({', '.join(COLUMNS)})""")
+
+
+def add_brin_index(cur):
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_date_brin ON {TABLE} USING brin (date)')
+
+
+def partition_by_year(cur):
+    cur.execute(f'SELECT min(date), max(date) FROM {TABLE}')
+    first, last = cur.fetchone()
+    today = date.today()
+    first_year = (first or today).year
+    last_year = max((last or today).year, today.year) + 1
+
+    cur.execute(f"""CREATE TABLE {TABLE}_partitioned (LIKE {TABLE} INCLUDING DEFAULTS)
+                    PARTITION BY RANGE (date)""")
+    for year in range(first_year, last_year + 1):
+        create_partition(cur, f'{TABLE}_partitioned', year)
+    cur.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE}_partitioned DEFAULT')
+    cur.execute(f'INSERT INTO {TABLE}_partitioned SELECT * FROM {TABLE}')
+    cur.execute(f'DROP TABLE {TABLE}')
+    cur.execute(f'ALTER TABLE {TABLE}_partitioned RENAME TO {TABLE}')
+    # Indexes on the parent cascade to every partition, present and future
+    add_primary_key(cur)
+    add_brin_index(cur)
+    print(f"Partitioned {TABLE} by year, {first_year} to {last_year}")
+
+
+def create_partition(cur, parent, year):
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {TABLE}_{year} PARTITION OF {parent}
+                    FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')""")
+
+
+MIGRATIONS = [
+    ('001_create_econ_metrics', create_table),
+    ('002_primary_key_on_date', add_primary_key),
+    ('003_brin_index_on_date', add_brin_index),
+    ('004_partition_by_year', partition_by_year),
+]
+
+OPTIONAL = {'004_partition_by_year'}
+
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (TABLE,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def migrate(conn, partition=PARTITION):
+    """Apply the pending migrations in order and return their versions; optional ones
+    only when enabled. Safe to run on every start."""
+
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    applied_now = []
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_advisory_lock(%s)', (LOCK_KEY,))
+        try:
+            cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                               version text PRIMARY KEY,
+                               applied_at timestamptz NOT NULL DEFAULT now())""")
+            cur.execute('SELECT version FROM schema_migrations')
+            applied = {version for version, in cur.fetchall()}
+
+            for version, migration in MIGRATIONS:
+                if version in applied or (version in OPTIONAL and not partition):
+                    continue
+                # Each migration commits together with its record, or not at all
+                conn.autocommit = False
+                with conn:
+                    migration(cur)
+                    cur.execute('INSERT INTO schema_migrations (version) VALUES (%s)', (version,))
+                conn.autocommit = True
+                applied_now.append(version)
+                print(f"Applied migration {version}")
+
+            # Next year's partition exists before its first row arrives
+            if is_partitioned(cur):
+                create_partition(cur, TABLE, date.today().year + 1)
+        finally:
+            conn.autocommit = True
+            cur.execute('SELECT pg_advisory_unlock(%s)', (LOCK_KEY,))
+            conn.autocommit = autocommit
+    return applied_now
+
+
+# Queries the pipeline and the dashboard run against econ_metrics
+PLAN_QUERIES = {
+    'date exists': f'SELECT 1 FROM {TABLE} WHERE date = %(day)s',
+    'date range': f'SELECT * FROM {TABLE} WHERE date > %(day)s ORDER BY date',
+    'dashboard probe': f'SELECT max(date), count(*) FROM {TABLE}',
+}
+
+INDEX_NODES = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan'}
+
+# Plan nodes the date-range read must use with the planner's own choices: the covering
+# primary key or the BRIN index, not a heap fetch per row
+RANGE_NODES = {'Index Only Scan', 'Bitmap Index Scan'}
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def check_plans(conn, day=None, capability=False):
+    """{query name: [index scan node types]} of PLAN_QUERIES.
+
+    By default the table is vacuumed and analyzed first and the queries are planned with
+    the default planner settings, so this shows what the planner actually picks. The
+    date-range read from `day` (by default a week before the latest date, as the
+    dashboard's refresh reads) must use an Index Only Scan or a bitmap scan. On a table of
+    a few pages a sequential scan is cheaper and the check fails.
+
+    With `capability` sequential scans are disabled instead, which only shows that each
+    query can use an index, whatever the table size.
+
+    Raises AssertionError naming the queries that fail."""
+
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    found = {}
+    try:
+        with conn.cursor() as cur:
+            if not capability:
+                # Fresh statistics, and a visibility map for index-only scans
+                cur.execute(f'VACUUM ANALYZE {TABLE}')
+            if day is None:
+                cur.execute(f"SELECT max(date) - 7 FROM {TABLE}")
+                day = cur.fetchone()[0] or date.today()
+            conn.autocommit = False
+            if capability:
+                cur.execute('SET LOCAL enable_seqscan = off')
+            for name, sql in PLAN_QUERIES.items():
+                cur.execute(f'EXPLAIN (FORMAT JSON) {sql}', {'day': day})
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                found[name] = [node['Node Type'] for node in plan_nodes(plan[0]['Plan'])
+                               if node['Node Type'] in INDEX_NODES]
+        conn.rollback()
+    finally:
+        conn.autocommit = autocommit
+
+    if capability:
+        missing = [name for name, nodes in found.items() if not nodes]
+        assert not missing, f"Queries without an index: {missing}"
+    else:
+        assert RANGE_NODES & set(found['date range']), \
+            f"Date-range read planned without an index-only or bitmap scan: {found['date range']}"
+    return found
+
+
+if __name__ == '__main__':
+    from Scrape_python_script import connect
+
+    parser = argparse.ArgumentParser(description='Apply the econ_metrics schema migrations')
+    parser.add_argument('--partition', action='store_true', default=PARTITION,
+                        help='also convert econ_metrics to yearly range partitions')
+    parser.add_argument('--check', action='store_true',
+                        help='confirm the planner reads date ranges through an index')
+    parser.add_argument('--capability', action='store_true',
+                        help='with --check, plan with sequential scans off: only confirm '
+                             'that every query can use an index')
+    args = parser.parse_args()
+    conn = connect()
+    print("Applied:", migrate(conn, partition=args.partition) or 'nothing, schema is current')
+    if args.check:
+        for name, nodes in check_plans(conn, capability=args.capability).items():
+            print(f"{name}: {', '.join(nodes)}")
+    conn.close()
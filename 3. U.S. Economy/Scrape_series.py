@@ -0,0 +1,24 @@
+# Catalog of the FRED economic series stored in the econ_metrics table
+# Shared by the daily update script and its helper modules so every stage agrees on
+# series ids, column names and column order
+
+# FRED series id, econ_metrics column name, release frequency
+# Data that changes daily are on the left while monthly are on the right of df
+SERIES = [
+    ('DJIA', 'Dow', 'daily'),                       # Dow Jones Industrial Average
+    ('NASDAQCOM', 'NASDAQ', 'daily'),               # NASDAQ Composite Index
+    ('SP500', 'SP500', 'daily'),                    # S&P 500
+    ('T5YIE', 'Inflation_5yr', 'daily'),            # 5-Year Breakeven Inflation Rate
+    ('DCOILWTICO', 'Oil', 'daily'),                 # Crude oil prices: West Texas Intermediate
+    ('DFF', 'Interest', 'daily'),                   # Federal Funds Effective Rate
+    ('DGS10', 'T_Note_10yr', 'daily'),              # 10 Year T-Note
+    ('CPIAUCSL', 'CPI_item_cost', 'monthly'),       # CPI for All Urban Consumers: All Items
+    ('CUUR0000SA0R', 'CPI_purchase_power', 'monthly'),  # CPI: Purchasing Power of the Dollar
+    ('CSCICP03USM665S', 'Confidence', 'monthly'),   # OECD Consumer Confidence Indicator
+]
+
+COLUMNS = [col for _, col, _ in SERIES]
+FREQUENCY = {series_id: freq for series_id, _, freq in SERIES}
+
+# Decimal places kept per column when writing to econ_metrics
+ROUNDING = {'CPI_item_cost': 2}